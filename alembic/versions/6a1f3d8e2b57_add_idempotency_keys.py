@@ -0,0 +1,45 @@
+"""Add IdempotencyKey table shared by all workers
+
+Revision ID: 6a1f3d8e2b57
+Revises: 9b3e6f1c2d84
+Create Date: 2026-10-20 10:14:52.307615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6a1f3d8e2b57"
+down_revision = "9b3e6f1c2d84"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "idempotencykey",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("status", sa.Integer(), nullable=True),
+        sa.Column("content_type", sa.String(length=255), nullable=True),
+        sa.Column("compressed", sa.Boolean(), nullable=True),
+        sa.Column("body", sa.LargeBinary(), nullable=True),
+        sa.Column("expires_at", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("key"),
+    )
+    op.create_index(
+        op.f("ix_idempotencykey_expires_at"),
+        "idempotencykey",
+        ["expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_idempotencykey_expires_at"), table_name="idempotencykey"
+    )
+    op.drop_table("idempotencykey")
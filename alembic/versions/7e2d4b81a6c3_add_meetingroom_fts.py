@@ -0,0 +1,70 @@
+"""Add FTS5 index for MeetingRoom name and description
+
+Revision ID: 7e2d4b81a6c3
+Revises: 3c9a51e27d04
+Create Date: 2026-10-19 11:03:17.540912
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7e2d4b81a6c3"
+down_revision = "3c9a51e27d04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Внешнее содержимое: в индексе только токены, сами строки
+    # остаются в meetingroom, rowid совпадает с meetingroom.id
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE meetingroom_fts USING fts5(
+            name,
+            description,
+            content='meetingroom',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """
+    )
+    # Триггеры держат индекс в актуальном состоянии при любых изменениях
+    op.execute(
+        """
+        CREATE TRIGGER meetingroom_fts_insert AFTER INSERT ON meetingroom
+        BEGIN
+            INSERT INTO meetingroom_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER meetingroom_fts_delete AFTER DELETE ON meetingroom
+        BEGIN
+            INSERT INTO meetingroom_fts(meetingroom_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER meetingroom_fts_update AFTER UPDATE ON meetingroom
+        BEGIN
+            INSERT INTO meetingroom_fts(meetingroom_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO meetingroom_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """
+    )
+    # Проиндексируем уже существующие комнаты
+    op.execute("INSERT INTO meetingroom_fts(meetingroom_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS meetingroom_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS meetingroom_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS meetingroom_fts_insert")
+    op.execute("DROP TABLE IF EXISTS meetingroom_fts")
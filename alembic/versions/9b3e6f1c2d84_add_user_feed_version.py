@@ -0,0 +1,34 @@
+"""Add feed_version to User for revocable calendar links
+
+Revision ID: 9b3e6f1c2d84
+Revises: e4a7d2c9b615
+Create Date: 2026-10-19 23:02:41.518304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9b3e6f1c2d84"
+down_revision = "e4a7d2c9b615"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Прежние ссылки без версии считаются ссылками версии 0
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "feed_version",
+                sa.Integer(),
+                nullable=False,
+                server_default="0",
+            )
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("feed_version")
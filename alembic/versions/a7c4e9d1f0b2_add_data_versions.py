@@ -0,0 +1,39 @@
+"""Add DataVersion table for cross-worker cache versions
+
+Revision ID: a7c4e9d1f0b2
+Revises: f3b91c5d2a47
+Create Date: 2026-10-19 17:42:10.512396
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a7c4e9d1f0b2"
+down_revision = "f3b91c5d2a47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dataversion",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("scope", sa.String(length=16), nullable=False),
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("scope", "key"),
+    )
+    op.create_index(
+        op.f("ix_dataversion_version"),
+        "dataversion",
+        ["version"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_dataversion_version"), table_name="dataversion")
+    op.drop_table("dataversion")
@@ -0,0 +1,43 @@
+"""Add RevokedToken table for JWT revocation
+
+Revision ID: c5e2b8f4a913
+Revises: a7c4e9d1f0b2
+Create Date: 2026-10-19 19:05:37.201844
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5e2b8f4a913"
+down_revision = "a7c4e9d1f0b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "revokedtoken",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("jti", sa.String(length=32), nullable=True),
+        sa.Column("issued_before", sa.Integer(), nullable=True),
+        sa.Column("expires_at", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("jti"),
+    )
+    op.create_index(
+        op.f("ix_revokedtoken_expires_at"),
+        "revokedtoken",
+        ["expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_revokedtoken_expires_at"), table_name="revokedtoken"
+    )
+    op.drop_table("revokedtoken")
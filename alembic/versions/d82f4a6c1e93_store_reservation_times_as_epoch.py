@@ -0,0 +1,59 @@
+"""Store Reservation times as integer UTC epoch seconds
+
+Revision ID: d82f4a6c1e93
+Revises: c5e8f03a7b21
+Create Date: 2026-10-19 15:07:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d82f4a6c1e93"
+down_revision = "c5e8f03a7b21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Наивные времена в БД считаем временем UTC, как и EpochSeconds
+    op.execute(
+        "UPDATE reservation SET "
+        "from_reserve = CAST(strftime('%s', from_reserve) AS INTEGER), "
+        "to_reserve = CAST(strftime('%s', to_reserve) AS INTEGER)"
+    )
+    with op.batch_alter_table("reservation", schema=None) as batch_op:
+        batch_op.alter_column(
+            "from_reserve",
+            existing_type=sa.DateTime(),
+            type_=sa.Integer(),
+            existing_nullable=True,
+        )
+        batch_op.alter_column(
+            "to_reserve",
+            existing_type=sa.DateTime(),
+            type_=sa.Integer(),
+            existing_nullable=True,
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("reservation", schema=None) as batch_op:
+        batch_op.alter_column(
+            "from_reserve",
+            existing_type=sa.Integer(),
+            type_=sa.DateTime(),
+            existing_nullable=True,
+        )
+        batch_op.alter_column(
+            "to_reserve",
+            existing_type=sa.Integer(),
+            type_=sa.DateTime(),
+            existing_nullable=True,
+        )
+    op.execute(
+        "UPDATE reservation SET "
+        "from_reserve = datetime(from_reserve, 'unixepoch'), "
+        "to_reserve = datetime(to_reserve, 'unixepoch')"
+    )
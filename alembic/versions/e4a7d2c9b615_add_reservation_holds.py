@@ -0,0 +1,44 @@
+"""Add ReservationHold table for short-lived holds
+
+Revision ID: e4a7d2c9b615
+Revises: c5e2b8f4a913
+Create Date: 2026-10-19 21:14:52.630917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e4a7d2c9b615"
+down_revision = "c5e2b8f4a913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "reservationhold",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("meetingroom_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("from_reserve", sa.Integer(), nullable=False),
+        sa.Column("to_reserve", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["meetingroom_id"], ["meetingroom.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_reservationhold_expires_at"),
+        "reservationhold",
+        ["expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_reservationhold_expires_at"), table_name="reservationhold"
+    )
+    op.drop_table("reservationhold")
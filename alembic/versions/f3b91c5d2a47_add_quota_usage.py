@@ -0,0 +1,45 @@
+"""Add QuotaUsage counters for booking quotas
+
+Revision ID: f3b91c5d2a47
+Revises: d82f4a6c1e93
+Create Date: 2026-10-19 16:05:27.318452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3b91c5d2a47"
+down_revision = "d82f4a6c1e93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "quotausage",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("week", sa.Integer(), nullable=False),
+        sa.Column("reservations", sa.Integer(), nullable=False),
+        sa.Column("seconds", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "week"),
+    )
+    # Начальные счётчики по уже существующим броням основной БД; брони
+    # из дополнительных шардов учтёт python -m app.crud.quota rebuild.
+    # 345600 - первый понедельник эпохи, 604800 - секунд в неделе
+    op.execute(
+        "INSERT INTO quotausage (user_id, week, reservations, seconds) "
+        "SELECT user_id, "
+        "(from_reserve - 345600) / 604800 * 604800 + 345600 AS week, "
+        "COUNT(*), SUM(to_reserve - from_reserve) "
+        "FROM reservation WHERE user_id IS NOT NULL "
+        "GROUP BY user_id, week"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("quotausage")
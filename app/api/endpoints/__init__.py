@@ -1,4 +1,5 @@
 # app/api/endpoints/__init__.py
+from .admin import router as admin_router
 from .meeting_room import router as meeting_room_router
 from .reservation import router as reservation_router
 from .user import router as user_router
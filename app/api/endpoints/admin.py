@@ -0,0 +1,148 @@
+# app/api/endpoints/admin.py
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import PlainTextResponse, Response
+from app.core.jobs import job_queue
+from app.core.profiling import RequestProfile, profile_store
+from app.core.rate_limit import rate_limiter
+from app.core.slow_queries import slow_query_log
+from app.core.user import current_superuser
+
+router = APIRouter(dependencies=[Depends(current_superuser)])
+
+
+@router.get(
+    "/rate_limits",
+    summary="Счётчики ограничения запросов",
+    response_description="Текущее состояние контроля допуска",
+)
+async def get_rate_limit_stats():
+    """
+    (Могут пользоваться только суперпользователи)
+    Счётчики пропущенных, ограниченных (429) и сброшенных (503) запросов
+    по группам маршрутов
+    """
+    return rate_limiter.stats()
+
+
+@router.get(
+    "/jobs",
+    summary="Очередь фоновых задач",
+    response_description="Глубина очереди, счётчики и задержки задач",
+)
+async def get_job_stats():
+    """
+    (Могут пользоваться только суперпользователи)
+    Сколько задач ждёт, выполняется и ждёт повтора, сколько выполнено,
+    повторено, провалено и отброшено из-за переполнения, а также
+    ожидание в очереди и время выполнения (p50, p95, max) в мс.
+    Очередь своя у каждого воркера: с несколькими воркерами лаунчера
+    здесь только очередь и счётчики ответившего
+    """
+    return job_queue.stats()
+
+
+@router.get(
+    "/slow_queries",
+    summary="Медленные SQL-запросы",
+    response_description="Самые тяжёлые запросы с планами выполнения",
+)
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=500, title="Сколько запросов показать"),
+    order_by: str = Query(
+        "total_ms",
+        regex="^(total_ms|max_ms|count|last_ms)$",
+        title="По чему сортировать",
+    ),
+):
+    """
+    (Могут пользоваться только суперпользователи)
+    Запросы дольше порога SLOW_QUERY_THRESHOLD_MS, сгруппированные по
+    нормализованному тексту: число, суммарное и худшее время, маршруты,
+    типы параметров и EXPLAIN QUERY PLAN. Сводка своя у каждого воркера:
+    с несколькими воркерами лаунчера здесь только запросы ответившего,
+    полную картину по всем воркерам даёт журнал (logging)
+    """
+    return slow_query_log.top(limit, order_by)
+
+
+@router.delete(
+    "/slow_queries",
+    status_code=204,
+    summary="Очистить сводку медленных запросов",
+)
+async def clear_slow_queries():
+    """
+    (Могут пользоваться только суперпользователи)
+    Очищает сводку только того воркера, который ответил
+    """
+    slow_query_log.clear()
+
+
+def get_profile(
+    profile_id: int = Path(..., ge=1, title="Номер профиля")
+) -> RequestProfile:
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return profile
+
+
+@router.get(
+    "/profiles",
+    summary="Профили запросов",
+    response_description="Последние снятые профили, новые первыми",
+)
+async def get_profiles():
+    """
+    (Могут пользоваться только суперпользователи)
+    Профиль снимается с запроса суперпользователя с заголовком
+    X-Profile: 1 или параметром ?_profile=1, его номер приходит
+    в заголовке ответа X-Profile-Id. Профили хранятся в памяти воркера,
+    который выполнил запрос, и номера у каждого воркера свои: с
+    несколькими воркерами лаунчера список и отчёты показывают только
+    профили ответившего воркера, поэтому профилировать лучше с одним
+    воркером (--workers 1)
+    """
+    return profile_store.list()
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    response_class=PlainTextResponse,
+    summary="Отчёт по профилю запроса",
+    response_description="SQL-запросы и дерево вызовов",
+)
+async def get_profile_report(
+    sort: str = Query(
+        "cumulative",
+        regex="^(cumulative|tottime|ncalls)$",
+        title="Сортировка функций",
+    ),
+    limit: int = Query(60, ge=1, le=1000, title="Сколько функций показать"),
+    profile: RequestProfile = Depends(get_profile),
+):
+    """
+    (Могут пользоваться только суперпользователи)
+    """
+    return profile.report(sort, limit)
+
+
+@router.get(
+    "/profiles/{profile_id}/download",
+    response_class=Response,
+    summary="Профиль запроса в формате .prof",
+    response_description="Файл для pstats или snakeviz",
+)
+async def download_profile(profile: RequestProfile = Depends(get_profile)):
+    """
+    (Могут пользоваться только суперпользователи)
+    """
+    return Response(
+        profile.dump(),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="request-{profile.id}.prof"'
+            )
+        },
+    )
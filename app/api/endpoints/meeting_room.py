@@ -1,13 +1,35 @@
 # app/api/endpoints/meeting_room.py
-from typing import List
-from fastapi import APIRouter, Depends, Path
+from datetime import timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Path, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.db import get_async_session
+from app.core.config import settings
+from app.core.db import (
+    get_async_read_session,
+    get_async_session,
+    utc_now,
+)
 from app.core.user import current_superuser
+from app.core.versions import ROOM, data_versions
 from app.crud.meeting_room import meeting_room_crud
 from app.crud.reservation import reservation_crud
-from app.api.validators import check_meeting_room_exists, check_name_duplicate
-from app.schemas.reservation import ReservationRoomDB, ReservationWithRoomName
+from app.api.feeds import calendar_feed_response
+from app.api.fieldsets import fieldset_response, requested_fields
+from app.api.validators import (
+    check_meeting_room_before_edit,
+    check_meeting_room_exists,
+    check_meeting_rooms_exist,
+    check_name_duplicate,
+    check_time_window,
+)
+from app.services.ical import render_event
+from app.schemas.availability import AvailabilityGrid
+from app.schemas.reservation import (
+    ReservationRoomDB,
+    ReservationWithRoomName,
+    RoomReservations,
+    UTCDateTime,
+)
 from app.schemas.meeting_room import (
     MeetingRoomCreate,
     MeetingRoomDB,
@@ -16,6 +38,18 @@ from app.schemas.meeting_room import (
 
 router = APIRouter()
 
+# Самое длинное окно, для которого строим сетку свободных слотов
+MAX_AVAILABILITY_WINDOW = timedelta(days=31)
+# Самый длинный период, на который можно искать свободные комнаты
+MAX_SEARCH_WINDOW = timedelta(days=31)
+# Самое длинное окно для расписания многих комнат
+MAX_SCHEDULE_WINDOW = timedelta(days=366)
+# Поля, которые можно запросить через ?fields=
+MEETING_ROOM_FIELDS = list(MeetingRoomDB.__fields__)
+ROOM_RESERVATION_FIELDS = [
+    name for name in ReservationRoomDB.__fields__ if name != "user_id"
+]
+
 
 @router.post(
     "/",
@@ -40,7 +74,7 @@ async def create_new_meeting_room(
     - **description** = Описание комнаты
     """
     # Вызываем функцию проверки уникальности поля name
-    await check_name_duplicate(meeting_room.name, session)
+    await check_name_duplicate(meeting_room.name)
     # Вторым параметром передаём сессию в CRUD метод
     new_room = await meeting_room_crud.create(meeting_room, session)
     return new_room
@@ -54,18 +88,150 @@ async def create_new_meeting_room(
     response_description="Список получен",
 )
 async def get_all_meeting_rooms(
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    fields: Optional[str] = Query(None, title="Нужные поля через запятую"),
+    session: AsyncSession = Depends(get_async_read_session),
 ):
     """
     Список комнат для переговоров:
 
     - **name** = Название комнаты
     - **description** = Описание комнаты
+    - **fields** = Только эти поля, например id,name.
+    С заголовком Accept: application/vnd.columnar+json ответ приходит
+    в колоночном виде: {"columns": [...], "rows": [[...], ...]}
     """
+    columns = requested_fields(request, fields, MEETING_ROOM_FIELDS)
+    if columns is not None:
+        rows = await meeting_room_crud.get_multi(session, columns)
+        return fieldset_response(request, rows, columns, exclude_none=True)
     get_rooms = await meeting_room_crud.get_multi(session)
     return get_rooms
 
 
+@router.get(
+    "/search",
+    response_model=List[MeetingRoomDB],
+    response_model_exclude_none=True,
+    summary="Поиск переговорных комнат",
+    response_description="Найденные комнаты, лучшие совпадения первыми",
+)
+async def search_meeting_rooms(
+    q: str = Query(..., min_length=1, max_length=200, title="Что ищем"),
+    from_time: Optional[UTCDateTime] = Query(
+        None, title="Комната свободна с"
+    ),
+    to_time: Optional[UTCDateTime] = Query(None, title="Комната свободна до"),
+    limit: int = Query(20, ge=1, le=100, title="Размер страницы"),
+    offset: int = Query(0, ge=0, title="Сколько результатов пропустить"),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    Полнотекстовый поиск по названию и описанию комнат. Каждое слово
+    ищется как начало слова, совпадения в названии важнее
+
+    - **q** = Поисковый запрос, например "проектор 40"
+    - **from_time**, **to_time** = Если указаны, вернутся только комнаты,
+    свободные весь этот период
+    - **limit**, **offset** = Постраничный вывод
+    """
+    if from_time is not None or to_time is not None:
+        check_time_window(from_time, to_time, MAX_SEARCH_WINDOW)
+    rooms = await meeting_room_crud.search(
+        q,
+        session,
+        limit=limit,
+        offset=offset,
+        free_from=from_time,
+        free_to=to_time,
+    )
+    return rooms
+
+
+@router.get(
+    "/availability",
+    response_model=AvailabilityGrid,
+    summary="Свободные слоты для многих переговорных комнат",
+    response_description="Сетка свободных слотов",
+)
+async def get_rooms_availability(
+    from_time: UTCDateTime = Query(..., title="Начало периода"),
+    to_time: UTCDateTime = Query(..., title="Окончание периода"),
+    duration: int = Query(
+        30, ge=1, le=24 * 60, title="Длительность встречи в минутах"
+    ),
+    step: int = Query(
+        15, ge=1, le=24 * 60, title="Шаг между слотами в минутах"
+    ),
+    room_ids: Optional[list[int]] = Query(
+        None, alias="room_id", title="ID комнат, по умолчанию - все"
+    ),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    Для каждой комнаты возвращает строку из "0" и "1" - по символу
+    на каждый слот из списка **slots**. "1" значит, что комнату можно
+    забронировать на **duration** минут с начала слота.
+
+    - **from_time**, **to_time** = Период поиска
+    - **duration** = Длительность встречи в минутах
+    - **step** = Шаг между началами слотов в минутах
+    - **room_id** = ID комнаты, можно передать несколько раз
+    """
+    # Сетка считается на numpy: модуль грузится при первом вызове или
+    # при прогреве, а не при импорте приложения
+    from app.services.availability import build_slot_grid
+
+    check_time_window(from_time, to_time, MAX_AVAILABILITY_WINDOW)
+    room_ids = await check_meeting_rooms_exist(room_ids)
+    reservations = await reservation_crud.get_reservations_in_window(
+        room_ids, from_time, to_time, session
+    )
+    return build_slot_grid(
+        room_ids,
+        reservations,
+        from_time,
+        to_time,
+        timedelta(minutes=duration),
+        timedelta(minutes=step),
+    )
+
+
+@router.get(
+    "/reservations",
+    response_model=list[RoomReservations],
+    response_model_exclude={"reservations": {"__all__": {"user_id"}}},
+    summary="Время бронирования многих переговорных комнат",
+    response_description="Брони, сгруппированные по комнатам",
+)
+async def get_reservations_for_rooms(
+    room_ids: Optional[list[int]] = Query(
+        None, alias="room_id", title="ID комнат, по умолчанию - все"
+    ),
+    from_time: Optional[UTCDateTime] = Query(None, title="Начало периода"),
+    to_time: Optional[UTCDateTime] = Query(None, title="Окончание периода"),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    То же, что и расписание одной комнаты, но сразу для многих: одна
+    проверка комнат и один запрос броней вместо пары запросов на комнату
+
+    - **room_id** = ID комнаты, можно передать несколько раз
+    - **from_time**, **to_time** = Если указаны, вернутся только брони,
+    пересекающиеся с этим периодом
+    """
+    if from_time is not None or to_time is not None:
+        check_time_window(from_time, to_time, MAX_SCHEDULE_WINDOW)
+    room_ids = await check_meeting_rooms_exist(room_ids)
+    schedule = await reservation_crud.get_future_reservations_for_rooms(
+        room_ids, session, from_time=from_time, to_time=to_time
+    )
+    return [
+        {"meetingroom_id": room_id, "reservations": reservations}
+        for room_id, reservations in schedule.items()
+    ]
+
+
 # Обновление объекта передаём PATH методом
 @router.patch(
     "/{meeting_room_id}",
@@ -95,11 +261,13 @@ async def partially_update_meeting_room(
     - **name** = Название комнаты
     - **description** = Описание комнаты
     """
-    meeting_room = await check_meeting_room_exists(meeting_room_id, session)
+    meeting_room = await check_meeting_room_before_edit(
+        meeting_room_id, session
+    )
     if obj_in.name is not None:
         # Если в переданных данных, есть поле name
         # проверяем его на уникальность
-        await check_name_duplicate(obj_in.name, session)
+        await check_name_duplicate(obj_in.name)
 
     # Когда проверки завершены - передаём в корутину
     # все необходимые для обновления данные
@@ -133,7 +301,9 @@ async def remove_meeting_room(
 
     - **meeting_room_id** = ID комнаты для удаления
     """
-    meeting_room = await check_meeting_room_exists(meeting_room_id, session)
+    meeting_room = await check_meeting_room_before_edit(
+        meeting_room_id, session
+    )
     meeting_room = await meeting_room_crud.remove(meeting_room, session)
     return meeting_room
 
@@ -148,16 +318,77 @@ async def remove_meeting_room(
     response_description="Запрос успешно получен",
 )
 async def get_reservations_for_room(
+    request: Request,
     meeting_room_id: int = Path(
         ...,
         ge=0,
         title="ID переговорной комнаты",
         description="Любое положительное число",
     ),
-    session: AsyncSession = Depends(get_async_session),
+    fields: Optional[str] = Query(None, title="Нужные поля через запятую"),
+    session: AsyncSession = Depends(get_async_read_session),
 ):
-    await check_meeting_room_exists(meeting_room_id, session)
+    """
+    - **fields** = Только эти поля, например id,from_reserve,to_reserve.
+    С заголовком Accept: application/vnd.columnar+json ответ приходит
+    в колоночном виде: {"columns": [...], "rows": [[...], ...]}
+    """
+    columns = requested_fields(request, fields, ROOM_RESERVATION_FIELDS)
+    await check_meeting_room_exists(meeting_room_id)
     reservations = await reservation_crud.get_future_reservations_for_room(
-        room_id=meeting_room_id, session=session
+        room_id=meeting_room_id, session=session, fields=columns
     )
+    if columns is not None:
+        return fieldset_response(request, reservations, columns)
     return reservations
+
+
+@router.get(
+    "/{meeting_room_id}/reservations.ics",
+    response_class=Response,
+    summary="Календарь бронирований переговорной комнаты",
+    response_description="Лента в формате iCalendar",
+)
+async def get_room_calendar(
+    request: Request,
+    meeting_room_id: int = Path(
+        ...,
+        ge=0,
+        title="ID переговорной комнаты",
+        description="Любое положительное число",
+    ),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    Ссылку можно добавить в календарное приложение. Пока бронирования
+    комнаты не менялись, лента отдаётся из кэша без обращения к БД
+    """
+
+    async def open_feed():
+        meeting_room = await check_meeting_room_exists(meeting_room_id)
+        since = utc_now() - timedelta(
+            days=settings.calendar_feed_history_days
+        )
+        stamp = utc_now()
+        reservations = reservation_crud.stream_room_schedule(
+            meeting_room_id, since, session
+        )
+
+        async def events():
+            async for reservation in reservations:
+                yield render_event(
+                    reservation.id,
+                    reservation.from_reserve,
+                    reservation.to_reserve,
+                    "Забронировано",
+                    stamp,
+                )
+
+        return meeting_room.name, events()
+
+    return await calendar_feed_response(
+        request,
+        (ROOM, meeting_room_id),
+        data_versions.get(ROOM, meeting_room_id),
+        open_feed,
+    )
@@ -1,25 +1,70 @@
 # app/api/endpoints/reservation.py
-from fastapi import APIRouter, Depends, Path
+from datetime import timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Path, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.db import get_async_session
-from app.core.user import current_user, current_superuser
+from app.core.config import settings
+from app.core.db import (
+    get_async_read_session,
+    get_async_session,
+    utc_now,
+)
+from app.core.holds import hold_registry
+from app.core.user import (
+    current_superuser,
+    current_user,
+    generate_feed_token,
+    rotate_feed_version,
+)
+from app.core.versions import USER, data_versions
 from app.models import User
+from app.crud.hold import hold_crud
 from app.crud.reservation import reservation_crud
+from app.api.feeds import calendar_feed_response
+from app.api.fieldsets import fieldset_response, requested_fields
 from app.api.validators import (
+    check_batch_fully_assigned,
+    check_feed_token,
+    check_hold_before_edit,
+    check_hold_intersections,
+    check_hold_limit,
     check_meeting_room_exists,
+    check_meeting_rooms_exist,
     check_reservation_intersections,
     check_reservation_before_edit,
+    check_reservation_quota,
 )
 from app.schemas.reservation import (
+    CalendarFeedLink,
+    ReservationHoldConfirm,
+    ReservationHoldCreate,
+    ReservationHoldDB,
     ReservationRoomDB,
     ReservationRoomUpdate,
     ReservationRoomCreate,
-    ReservationWithRoomName
+    ReservationPeriod,
+    ReservationWithRoomName,
+    UTCDateTime,
+)
+from app.schemas.schedule import BatchScheduleRequest, BatchScheduleResult
+from app.services.ical import render_event
+from app.services.notifications import (
+    CREATED,
+    DELETED,
+    UPDATED,
+    notify_reservations_changed,
 )
+from app.services.scheduler import plan_batch
 
 
 router = APIRouter()
 
+# Поля, которые можно запросить через ?fields=
+RESERVATION_FIELDS = list(ReservationRoomDB.__fields__)
+MY_RESERVATION_FIELDS = [
+    name for name in ReservationWithRoomName.__fields__ if name != "user_id"
+]
+
 
 # у объекта Reservation нет опциональных полей, поэтому нет
 # параметра response_model_exclude_none=True
@@ -32,6 +77,8 @@ router = APIRouter()
 async def create_reservation(
     reservation: ReservationRoomCreate,
     session: AsyncSession = Depends(get_async_session),
+    # Проверку пересечений выполняем через читающую сессию
+    read_session: AsyncSession = Depends(get_async_read_session),
     # Получаем текущего пользователя и сохраняем его в переменную user
     user: User = Depends(current_user),
 ):
@@ -42,17 +89,171 @@ async def create_reservation(
     - **to_reserve** = Дата окончания бронирования. Формата 2022-12-15T08:56
     - **meetingroom_id** = Целое число. ID переговорной комнаты
     """
-    await check_meeting_room_exists(reservation.meetingroom_id, session)
+    await check_meeting_room_exists(reservation.meetingroom_id)
+    await check_hold_intersections(
+        reservation.meetingroom_id,
+        reservation.from_reserve,
+        reservation.to_reserve,
+        user.id,
+    )
     await check_reservation_intersections(
         # Т.к. валидатор принимает **kwargs, аргументы нужно передать
         # с указанием ключей
         **reservation.dict(),
-        session=session,
+        session=read_session,
+    )
+    # Счётчики квот читаем пишущей сессией - в транзакции, которая
+    # их же и увеличит, как в schedule_reservations
+    await check_reservation_quota(
+        user.id,
+        [(reservation.from_reserve, reservation.to_reserve)],
+        session,
     )
     new_reservation = await reservation_crud.create(reservation, session, user)
+    await notify_reservations_changed([new_reservation], CREATED)
     return new_reservation
 
 
+@router.post(
+    "/schedule",
+    response_model=BatchScheduleResult,
+    summary="Пакетное бронирование на любые свободные комнаты",
+    response_description="Заявки распределены по комнатам",
+)
+async def schedule_reservations(
+    batch: BatchScheduleRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """
+    Распределяет пакет гибких заявок по свободным комнатам и времени
+    и бронирует их одной транзакцией
+
+    - **requests** = Заявки: длительность **duration** в минутах, окно
+    **window_start** - **window_end** и, по желанию, список **room_ids**
+    - **granularity** = Шаг в минутах, по которому выравнивается начало встреч
+    - **all_or_nothing** = Не бронировать ничего, если хоть одна заявка
+    не поместилась
+    """
+    # Занятость читаем через пишущую сессию: в той же транзакции, что и
+    # запись, чтобы между проверкой и сохранением никто не вклинился
+    room_ids = await check_meeting_rooms_exist(None)
+    listed_room_ids = {
+        room_id
+        for item in batch.requests
+        if item.room_ids is not None
+        for room_id in item.room_ids
+    }
+    if listed_room_ids:
+        await check_meeting_rooms_exist(sorted(listed_room_ids))
+    window_start = min(item.window_start for item in batch.requests)
+    window_end = max(item.window_end for item in batch.requests)
+    reservations = await reservation_crud.get_reservations_in_window(
+        room_ids, window_start, window_end, session
+    )
+    # Чужие удержания для планировщика - такая же занятость, как брони
+    reservations += await hold_registry.in_window(
+        room_ids, window_start, window_end, exclude_user_id=user.id
+    )
+    granularity = timedelta(minutes=batch.granularity)
+    planned, unassigned = plan_batch(
+        batch.requests,
+        room_ids,
+        reservations,
+        granularity,
+        not_before=utc_now() + granularity,
+    )
+    check_batch_fully_assigned(unassigned, batch.all_or_nothing)
+    await check_reservation_quota(
+        user.id,
+        [(item["from_reserve"], item["to_reserve"]) for item in planned],
+        session,
+    )
+    indexes = [item.pop("request_index") for item in planned]
+    created = await reservation_crud.create_many(planned, session, user)
+    await notify_reservations_changed(created, CREATED, user.id)
+    return {
+        "assigned": [
+            dict(reservation, request_index=index)
+            for index, reservation in zip(indexes, created)
+        ],
+        "unassigned": unassigned,
+    }
+
+
+@router.post(
+    "/holds",
+    response_model=ReservationHoldDB,
+    summary="Удержать интервал комнаты",
+    response_description="Интервал удержан",
+)
+async def create_hold(
+    hold: ReservationHoldCreate,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """
+    Удерживает интервал на несколько минут (**expires_at** в ответе):
+    никто другой не сможет его забронировать, а бронь создаётся
+    подтверждением удержания. Неподтверждённое удержание истекает само
+
+    - **from_reserve**, **to_reserve**, **meetingroom_id** - как у брони
+    """
+    await check_meeting_room_exists(hold.meetingroom_id)
+    await check_hold_limit(user.id)
+    await check_hold_intersections(
+        hold.meetingroom_id, hold.from_reserve, hold.to_reserve, user.id
+    )
+    # Пересечения с бронями проверяются при записи, под блокировкой
+    return await hold_crud.create(hold, session, user)
+
+
+@router.post(
+    "/holds/{hold_id}/confirm",
+    response_model=ReservationRoomDB,
+    summary="Подтвердить удержание",
+    response_description="Комната зарезервирована",
+)
+async def confirm_hold(
+    hold_id: int,
+    obj_in: Optional[ReservationHoldConfirm] = None,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """
+    Превращает своё удержание в бронь на тот же интервал
+
+    - **comment** = Комментарий к брони, необязательно
+    """
+    hold = await check_hold_before_edit(hold_id, user, owner_only=True)
+    # Снятие удержания берёт блокировку записи, квоты читаем уже под ней
+    await hold_crud.claim(hold, session)
+    await check_reservation_quota(
+        user.id, [(hold.from_reserve, hold.to_reserve)], session
+    )
+    reservation = await hold_crud.confirm(
+        hold, obj_in.comment if obj_in is not None else None, session, user
+    )
+    await notify_reservations_changed([reservation], CREATED)
+    return reservation
+
+
+@router.delete(
+    "/holds/{hold_id}",
+    response_model=ReservationHoldDB,
+    summary="Снять удержание",
+    response_description="Удержание снято",
+)
+async def delete_hold(
+    hold_id: int,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """Освобождает интервал раньше, чем удержание истечёт само"""
+    hold = await check_hold_before_edit(hold_id, user)
+    return await hold_crud.remove(hold, session)
+
+
 @router.get(
     "/",
     response_model=list[ReservationRoomDB],
@@ -62,11 +263,21 @@ async def create_reservation(
     description="Получить список зарезервированных комнат",
 )
 async def get_all_reservation(
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    fields: Optional[str] = Query(None, title="Нужные поля через запятую"),
+    session: AsyncSession = Depends(get_async_read_session),
 ):
     """
     (Могут воспользоваться только суперпользователи)
+
+    - **fields** = Только эти поля, например id,from_reserve,to_reserve.
+    С заголовком Accept: application/vnd.columnar+json ответ приходит
+    в колоночном виде: {"columns": [...], "rows": [[...], ...]}
     """
+    columns = requested_fields(request, fields, RESERVATION_FIELDS)
+    if columns is not None:
+        rows = await reservation_crud.get_multi(session, columns)
+        return fieldset_response(request, rows, columns)
     reservations = await reservation_crud.get_multi(session)
     return reservations
 
@@ -96,6 +307,7 @@ async def delete_reservation(
         reservation_id, session, user
     )
     reservation = await reservation_crud.remove(reservation, session)
+    await notify_reservations_changed([reservation], DELETED)
     return reservation
 
 
@@ -115,6 +327,7 @@ async def update_reservation(
     ),
     obj_in: ReservationRoomUpdate,
     session: AsyncSession = Depends(get_async_session),
+    read_session: AsyncSession = Depends(get_async_read_session),
     user: User = Depends(current_user),
 ):
     """
@@ -128,17 +341,32 @@ async def update_reservation(
     reservation = await check_reservation_before_edit(
         reservation_id, session, user
     )
+    # Проверяем, что нет пересечений с чужими удержаниями
+    await check_hold_intersections(
+        reservation.meetingroom_id,
+        obj_in.from_reserve,
+        obj_in.to_reserve,
+        reservation.user_id,
+    )
     # Проверяем, что нет пересечений с другими бронированиями
     await check_reservation_intersections(
         # Новое время бронирования, распаковываем на ключевые аргументы
         **obj_in.dict(),
         reservation_id=reservation_id,
         meetingroom_id=reservation.meetingroom_id,
-        session=session,
+        session=read_session,
+    )
+    # Квоты считаются у владельца брони, даже если её правит админ
+    await check_reservation_quota(
+        reservation.user_id,
+        [(obj_in.from_reserve, obj_in.to_reserve)],
+        session,
+        replaced=reservation,
     )
     reservation = await reservation_crud.update(
         db_obj=reservation, obj_in=obj_in, session=session
     )
+    await notify_reservations_changed([reservation], UPDATED)
     return reservation
 
 
@@ -149,13 +377,144 @@ async def update_reservation(
     response_model_exclude={"user_id"},
 )
 async def get_my_reservations(
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    from_time: Optional[UTCDateTime] = Query(
+        None, title="Бронирования, начинающиеся не раньше"
+    ),
+    to_time: Optional[UTCDateTime] = Query(
+        None, title="Бронирования, начинающиеся раньше"
+    ),
+    period: Optional[ReservationPeriod] = Query(
+        None, title="Только будущие (upcoming) или начавшиеся (past)"
+    ),
+    after_from_reserve: Optional[UTCDateTime] = Query(
+        None, title="from_reserve последнего бронирования прошлой страницы"
+    ),
+    after_id: Optional[int] = Query(
+        None, title="id последнего бронирования прошлой страницы"
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=1000, title="Размер страницы"),
+    fields: Optional[str] = Query(None, title="Нужные поля через запятую"),
+    session: AsyncSession = Depends(get_async_read_session),
     user: User = Depends(current_user),
 ):
     """
     Показывает список всех бронирований переговорных комнат для текущего пользователя
+
+    - **from_time**, **to_time** = Период, в который начинаются бронирования
+    - **period** = upcoming - ещё не начавшиеся, past - уже начавшиеся
+    - **limit** = Размер страницы. Для следующей страницы передайте
+    **after_from_reserve** и **after_id** последнего элемента текущей
+    - **fields** = Только эти поля, например id,from_reserve,to_reserve.
+    С заголовком Accept: application/vnd.columnar+json ответ приходит
+    в колоночном виде: {"columns": [...], "rows": [[...], ...]}
     """
+    after = None
+    if after_from_reserve is not None and after_id is not None:
+        after = (after_from_reserve, after_id)
+    columns = requested_fields(request, fields, MY_RESERVATION_FIELDS)
     reservations = await reservation_crud.get_by_user(
-        session=session, user=user
+        session=session,
+        user=user,
+        from_time=from_time,
+        to_time=to_time,
+        period=period,
+        after=after,
+        limit=limit,
+        fields=columns,
     )
+    if columns is not None:
+        return fieldset_response(request, reservations, columns)
     return reservations
+
+
+@router.get(
+    "/my_reservations/feed",
+    response_model=CalendarFeedLink,
+    summary="Ссылка на календарь моих бронирований",
+    response_description="Ссылка для календарного приложения",
+)
+async def get_my_calendar_link(
+    request: Request,
+    user: User = Depends(current_user),
+):
+    """
+    Личная ссылка на ленту iCalendar с бронированиями текущего пользователя.
+    Ссылка работает без авторизации, поэтому её не стоит никому передавать
+    """
+    return {
+        "url": request.url_for(
+            "get_user_calendar", token=generate_feed_token(user)
+        )
+    }
+
+
+@router.post(
+    "/my_reservations/feed",
+    response_model=CalendarFeedLink,
+    summary="Новая ссылка на календарь моих бронирований",
+    response_description="Новая ссылка, прежние больше не работают",
+)
+async def rotate_my_calendar_link(
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """
+    Выдаёт новую личную ссылку на ленту iCalendar. Все выданные раньше
+    ссылки перестают работать - например, если ссылку кому-то передали
+    """
+    user = await rotate_feed_version(user, session)
+    return {
+        "url": request.url_for(
+            "get_user_calendar", token=generate_feed_token(user)
+        )
+    }
+
+
+@router.get(
+    "/feeds/{token}.ics",
+    response_class=Response,
+    name="get_user_calendar",
+    summary="Календарь бронирований пользователя",
+    response_description="Лента в формате iCalendar",
+)
+async def get_user_calendar(
+    request: Request,
+    token: str,
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    Пока бронирования пользователя не менялись, лента отдаётся из кэша
+    без обращения к БД
+    """
+    user_id = await check_feed_token(token, session)
+
+    async def open_feed():
+        since = utc_now() - timedelta(
+            days=settings.calendar_feed_history_days
+        )
+        stamp = utc_now()
+        reservations = reservation_crud.stream_user_schedule(
+            user_id, since, session
+        )
+
+        async def events():
+            async for reservation in reservations:
+                yield render_event(
+                    reservation.id,
+                    reservation.from_reserve,
+                    reservation.to_reserve,
+                    reservation.meeting_room_name,
+                    stamp,
+                    reservation.comment,
+                )
+
+        return "Мои бронирования", events()
+
+    return await calendar_feed_response(
+        request,
+        (USER, user_id),
+        data_versions.get(USER, user_id),
+        open_feed,
+    )
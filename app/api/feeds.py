@@ -0,0 +1,111 @@
+# app/api/feeds.py
+"""
+Кэш отрисованных календарных лент и ответы с ними.
+
+Лента хранится в кэше несжатой, а сжатые варианты строятся при первом
+запросе с такой кодировкой и лежат рядом до смены версии данных -
+повторные ответы из кэша ничего не сжимают.
+"""
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.core.compression import choose_encoding, compress
+from app.core.config import settings
+from app.services.ical import CALENDAR_FOOTER, render_calendar_header
+
+ICAL_MEDIA_TYPE = "text/calendar; charset=utf-8"
+# Сколько лент держим в памяти, самые давние вытесняются
+MAX_CACHED_FEEDS = 1000
+# Сколько событий отправляем клиенту одним куском
+EVENTS_PER_CHUNK = 64
+
+
+class FeedCache:
+    def __init__(self, max_feeds: int):
+        self.max_feeds = max_feeds
+        self.feeds: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, key, version, encoding: Optional[str] = None
+    ) -> Optional[tuple[bytes, Optional[str]]]:
+        """
+        Тело ленты и его кодировку: сжатое encoding, если лента не меньше
+        порога сжатия, иначе несжатое (кодировка None).
+        """
+        entry = self.feeds.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.feeds.move_to_end(key)
+        self.hits += 1
+        bodies = entry[1]
+        body = bodies[None]
+        if encoding is None or len(body) < settings.compression_min_size:
+            return body, None
+        if encoding not in bodies:
+            bodies[encoding] = compress(body, encoding)
+        return bodies[encoding], encoding
+
+    def put(self, key, version, body: bytes) -> None:
+        self.feeds[key] = (version, {None: body})
+        self.feeds.move_to_end(key)
+        while len(self.feeds) > self.max_feeds:
+            self.feeds.popitem(last=False)
+
+
+feed_cache = FeedCache(MAX_CACHED_FEEDS)
+
+
+async def calendar_feed_response(
+    request: Request,
+    cache_key: tuple,
+    version: tuple,
+    open_feed: Callable[[], Awaitable[tuple[str, AsyncIterator[str]]]],
+) -> Response:
+    """
+    Отдаёт ленту из кэша, если версия данных не изменилась. Иначе вызывает
+    open_feed - корутину, которая проверяет, что лента существует, и
+    возвращает её название и асинхронный итератор событий. Лента
+    отправляется клиенту по мере чтения из БД и заодно сохраняется в кэш.
+    """
+    etag = '"{}-{}-{}-{}"'.format(*cache_key, *version)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    # Сжатые ответы получают слабый ETag (W/...), сравниваем без него
+    if request.headers.get("if-none-match", "").removeprefix("W/") == etag:
+        return Response(status_code=304, headers=headers)
+    encoding = None
+    if settings.compression_enabled:
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+    cached = feed_cache.get(cache_key, version, encoding)
+    if cached is not None:
+        body, encoding = cached
+        if encoding is not None:
+            headers.update({"ETag": f"W/{etag}", "Content-Encoding": encoding})
+        return Response(body, media_type=ICAL_MEDIA_TYPE, headers=headers)
+
+    name, events = await open_feed()
+
+    async def stream():
+        chunks = [render_calendar_header(name).encode()]
+        yield chunks[0]
+        batch = []
+        async for event in events:
+            batch.append(event)
+            if len(batch) == EVENTS_PER_CHUNK:
+                chunks.append("".join(batch).encode())
+                batch = []
+                yield chunks[-1]
+        chunks.append(("".join(batch) + CALENDAR_FOOTER).encode())
+        yield chunks[-1]
+        # Версию взяли до чтения из БД: если за это время были записи,
+        # следующий запрос увидит новую версию и построит ленту заново
+        feed_cache.put(cache_key, version, b"".join(chunks))
+
+    return StreamingResponse(
+        stream(), media_type=ICAL_MEDIA_TYPE, headers=headers
+    )
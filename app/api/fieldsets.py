@@ -0,0 +1,90 @@
+# app/api/fieldsets.py
+"""
+Выборочные поля (?fields=id,from_reserve) и компактный колоночный JSON
+для списков. Колоночный формат клиент просит заголовком
+Accept: application/vnd.columnar+json и получает имена полей один раз:
+{"columns": ["id", "from_reserve"], "rows": [[1, "..."], [2, "..."]]}
+"""
+import json
+from datetime import date, datetime
+from typing import Iterable, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+
+
+def wants_columnar(request: Request) -> bool:
+    return COLUMNAR_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def requested_fields(
+    request: Request, fields: Optional[str], allowed: Sequence[str]
+) -> Optional[list[str]]:
+    """
+    Поля, которые нужно выбрать из БД и отдать. None - клиент не просил
+    ни выборочных полей, ни колоночного формата, и ответ строится
+    как обычно, через response_model.
+    """
+    if fields is None:
+        return list(allowed) if wants_columnar(request) else None
+    # Повторы убираем, порядок полей - как в запросе
+    names = [name.strip() for name in fields.split(",")]
+    names = list(dict.fromkeys(name for name in names if name))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Неизвестные поля: {unknown}. Доступны: {list(allowed)}",
+        )
+    if not names:
+        raise HTTPException(
+            status_code=422, detail="Не указано ни одного поля"
+        )
+    return names
+
+
+def encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def fieldset_response(
+    request: Request,
+    rows: Iterable,
+    fields: Sequence[str],
+    exclude_none: bool = False,
+) -> Response:
+    """
+    Собирает JSON напрямую из строк выборки, без pydantic-схем: у строк
+    берутся только поля fields.
+    """
+    if wants_columnar(request):
+        media_type = COLUMNAR_MEDIA_TYPE
+        content = {
+            "columns": list(fields),
+            "rows": [[getattr(row, name) for name in fields] for row in rows],
+        }
+    else:
+        media_type = "application/json"
+        content = [
+            {
+                name: value
+                for name, value in (
+                    (name, getattr(row, name)) for name in fields
+                )
+                if not (exclude_none and value is None)
+            }
+            for row in rows
+        ]
+    return Response(
+        json.dumps(
+            content,
+            default=encode_value,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ),
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
@@ -1,6 +1,7 @@
 # app/api/routers.py
 from fastapi import APIRouter
 from app.api.endpoints import (
+    admin_router,
     meeting_room_router,
     reservation_router,
     user_router,
@@ -14,3 +15,4 @@ main_router.include_router(
     reservation_router, prefix="/reservations", tags=["Reservations"]
 )
 main_router.include_router(user_router)
+main_router.include_router(admin_router, prefix="/admin", tags=["Admin"])
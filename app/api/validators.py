@@ -1,34 +1,95 @@
 # app/api/validators.py
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.db import utc_now
+from app.core.holds import HoldEntry, hold_registry
+from app.core.revocation import feed_links, token_revocations
+from app.core.rooms import ROOM_NAME_TAKEN, RoomEntry, room_registry
+from app.core.user import read_feed_token
 from app.crud.meeting_room import meeting_room_crud
+from app.crud.quota import quota_crud, weekly_usage
 from app.crud.reservation import reservation_crud
 from app.models import MeetingRoom, Reservation, User
 
 
-# Корутина, которая проверяет уникальность имени переговорной
-async def check_name_duplicate(room_name: str, session: AsyncSession) -> None:
-    # и вторым параметром передаём сессию в CRUD функцию
-    room_id = await meeting_room_crud.get_room_id_by_name(room_name, session)
+# Корутина, которая проверяет уникальность имени переговорной.
+# Комнаты берём из справочника в памяти, без запроса к БД
+async def check_name_duplicate(room_name: str) -> None:
+    room_id = await room_registry.get_id_by_name(room_name)
     # Если такой объект уже есть в базе - вызвать ошибку
     if room_id is not None:
-        raise HTTPException(
-            status_code=422,
-            detail="Такая переговорная комната уже существует!",
-        )
+        raise HTTPException(status_code=422, detail=ROOM_NAME_TAKEN)
+
+
+# Корутина, которая проверяет, существует ли комната с таким ID
+async def check_meeting_room_exists(meeting_room_id: int) -> RoomEntry:
+    meeting_room = await room_registry.get(meeting_room_id)
+    if meeting_room is None:
+        raise HTTPException(status_code=404, detail="Переговорка не найдена")
+    return meeting_room
 
 
-# Корутина, которая проверяет, существует ли объект в БД с таким ID
-async def check_meeting_room_exists(
+# Для изменения и удаления нужен сам объект из БД
+async def check_meeting_room_before_edit(
     meeting_room_id: int, session: AsyncSession
 ) -> MeetingRoom:
-    # Получаем объект из БД по ID
     meeting_room = await meeting_room_crud.get(meeting_room_id, session)
     if meeting_room is None:
         raise HTTPException(status_code=404, detail="Переговорка не найдена")
     return meeting_room
 
 
+# Корутина, которая проверяет сразу список комнат.
+# Без списка возвращает id всех комнат
+async def check_meeting_rooms_exist(
+    meeting_room_ids: Optional[Sequence[int]],
+) -> list[int]:
+    room_ids = await room_registry.get_ids(meeting_room_ids)
+    if meeting_room_ids is not None:
+        missing = set(meeting_room_ids) - set(room_ids)
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Переговорки не найдены: {sorted(missing)}",
+            )
+    return room_ids
+
+
+def check_time_window(
+    from_time: Optional[datetime],
+    to_time: Optional[datetime],
+    max_length: timedelta,
+) -> None:
+    if from_time is None or to_time is None:
+        raise HTTPException(
+            status_code=422,
+            detail="Нужно указать и начало, и окончание периода",
+        )
+    if from_time >= to_time:
+        raise HTTPException(
+            status_code=422,
+            detail="Начало периода должно быть раньше его окончания",
+        )
+    if to_time - from_time > max_length:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Период не может быть длиннее {max_length}",
+        )
+
+
+def check_batch_fully_assigned(
+    unassigned: Sequence[int], all_or_nothing: bool
+) -> None:
+    if unassigned and all_or_nothing:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Не удалось разместить заявки: {list(unassigned)}",
+        )
+
+
 async def check_reservation_intersections(**kwargs) -> None:
     reservation = await reservation_crud.get_reservations_at_the_same_time(
         **kwargs
@@ -37,6 +98,94 @@ async def check_reservation_intersections(**kwargs) -> None:
         raise HTTPException(status_code=422, detail=str(reservation))
 
 
+# Удержания проверяются по памяти: проигравшие гонку за комнату
+# получают отказ без запросов к БД
+async def check_hold_intersections(
+    meetingroom_id: int,
+    from_reserve: datetime,
+    to_reserve: datetime,
+    user_id: Optional[int],
+) -> None:
+    holds = await hold_registry.conflicts(
+        meetingroom_id, from_reserve, to_reserve, exclude_user_id=user_id
+    )
+    if holds:
+        raise HTTPException(status_code=422, detail=str(holds))
+
+
+async def check_hold_limit(user_id: int) -> None:
+    limit = settings.reservation_hold_max_per_user
+    if await hold_registry.count_for_user(user_id) >= limit:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Не больше {limit} удержаний одновременно",
+        )
+
+
+async def check_hold_before_edit(
+    hold_id: int, user: User, owner_only: bool = False
+) -> HoldEntry:
+    hold = await hold_registry.get(hold_id)
+    if hold is None:
+        raise HTTPException(
+            status_code=404, detail="Удержание не найдено или истекло"
+        )
+    if hold.user_id != user.id and (owner_only or not user.is_superuser):
+        raise HTTPException(
+            status_code=403,
+            detail="Невозможно использовать чужое удержание!",
+        )
+    return hold
+
+
+async def check_reservation_quota(
+    user_id: Optional[int],
+    intervals: Sequence[tuple[datetime, datetime]],
+    session: AsyncSession,
+    replaced: Optional[Reservation] = None,
+) -> None:
+    """
+    Проверяет квоты пользователя для новых броней intervals. replaced -
+    бронь, которую они заменяют при изменении. Читает только счётчики.
+    """
+    if user_id is None:
+        return
+    removed = []
+    if replaced is not None:
+        removed.append((replaced.from_reserve, replaced.to_reserve))
+    if settings.quota_week_hours is not None:
+        usage = weekly_usage(intervals, removed)
+        grown = [week for week, (_, seconds) in usage.items() if seconds > 0]
+        if grown:
+            used = await quota_crud.get_week_seconds(user_id, grown, session)
+            limit = settings.quota_week_hours * 60 * 60
+            for week in grown:
+                if used.get(week, 0) + usage[week][1] > limit:
+                    raise HTTPException(
+                        status_code=422,
+                        detail=(
+                            f"Превышена квота: не больше "
+                            f"{settings.quota_week_hours:g} ч броней "
+                            f"в неделю (неделя с {week:%d.%m.%Y})"
+                        ),
+                    )
+    if settings.quota_future_reservations is not None:
+        now = utc_now()
+        added = sum(1 for start, _ in intervals if start >= now) - sum(
+            1 for start, _ in removed if start >= now
+        )
+        if added > 0:
+            future = await quota_crud.count_future(user_id, now, session)
+            if future + added > settings.quota_future_reservations:
+                raise HTTPException(
+                    status_code=422,
+                    detail=(
+                        f"Превышена квота: не больше "
+                        f"{settings.quota_future_reservations} будущих броней"
+                    ),
+                )
+
+
 async def check_reservation_before_edit(
     reservation_id: int, session: AsyncSession, user: User
 ) -> Reservation:
@@ -53,3 +202,19 @@ async def check_reservation_before_edit(
             detail="Невозможно редактировать или удалять чужую бронь!",
         )
     return reservation
+
+
+async def check_feed_token(token: str, session: AsyncSession) -> int:
+    """
+    Ссылка работает, пока пользователь активен и не получил новую:
+    версия в токене должна совпадать с User.feed_version. Обе проверки
+    идут по памяти, пользователь читается из БД, только когда его
+    ссылки или активность изменились.
+    """
+    await token_revocations.refresh()
+    claims = read_feed_token(token)
+    if claims is not None:
+        user_id, feed_version = claims
+        if await feed_links.check(user_id, feed_version, session):
+            return user_id
+    raise HTTPException(status_code=404, detail="Календарь не найден")
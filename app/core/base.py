@@ -1,4 +1,15 @@
 # app/core/base.py
 """Импорты класса Base и всех моделей для Alembic."""
 from app.core.db import Base  # noqa
-from app.models import MeetingRoom, Reservation, User  # noqa
+from app.models import (  # noqa
+    DataVersion,
+    IdempotencyKey,
+    IdSequence,
+    MeetingRoom,
+    QuotaUsage,
+    Reservation,
+    ReservationHold,
+    RevokedToken,
+    RoomShard,
+    User,
+)
@@ -0,0 +1,238 @@
+# app/core/capture.py
+"""
+Запись реального трафика для воспроизведения (benchmarks/replay.py).
+
+Каждый запрос - строка NDJSON: время начала, метод, шаблон маршрута,
+путь, параметры, форма тела, хэш id пользователя, статус и длительность.
+Данные обезличены: строки в JSON-теле (названия, комментарии, почта)
+заменяются псевдонимами той же длины - одинаковые строки получают
+одинаковые псевдонимы, так что повторы и конфликты названий остаются.
+Даты, числа и ключи сохраняются. Токены в пути и чувствительные
+параметры тоже заменяются, тела форм (вход) не пишутся.
+
+Строки уходят в очередь logging, а пишет их в файл отдельный поток -
+запрос не ждёт диска. Файл ротируется по размеру (RotatingFileHandler).
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import string
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from app.core.config import settings
+
+# Параметры пути, строки запроса и поля тела, значения которых не пишем
+SENSITIVE_NAMES = {"token", "password", "username", "email"}
+JSON_TYPE = b"application/json"
+PSEUDONYM_ALPHABET = string.ascii_lowercase
+
+# Куда ручки записывают пользователя текущего записываемого запроса
+captured_user: ContextVar[Optional[dict]] = ContextVar(
+    "captured_user", default=None
+)
+
+
+def hash_user_id(user_id) -> str:
+    return hmac.new(
+        settings.secret_key.encode(), str(user_id).encode(), hashlib.sha256
+    ).hexdigest()[:16]
+
+
+def note_user(user) -> None:
+    """Вызывается проверкой токена: запрос запишется от этого юзера."""
+    holder = captured_user.get()
+    if holder is not None:
+        holder["user"] = hash_user_id(user.id)
+        holder["superuser"] = user.is_superuser
+
+
+def pseudonym(value: str) -> str:
+    """Строка из букв той же длины, одна и та же для равных строк."""
+    digest = b""
+    while len(digest) < len(value):
+        digest += hmac.new(
+            settings.secret_key.encode(),
+            f"{len(digest)}:{value}".encode(),
+            hashlib.sha256,
+        ).digest()
+    return "".join(
+        PSEUDONYM_ALPHABET[byte % len(PSEUDONYM_ALPHABET)]
+        for byte in digest[: len(value)]
+    )
+
+
+def is_datetime(value: str) -> bool:
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def sanitize(value):
+    if isinstance(value, dict):
+        return {key: sanitize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item) for item in value]
+    if isinstance(value, str) and not is_datetime(value):
+        return pseudonym(value)
+    return value
+
+
+def sanitize_query(query_string: bytes) -> list:
+    return [
+        [name, pseudonym(value) if name in SENSITIVE_NAMES else value]
+        for name, value in parse_qsl(
+            query_string.decode("latin-1"), keep_blank_values=True
+        )
+    ]
+
+
+def sanitize_path(scope) -> str:
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        if name in SENSITIVE_NAMES and isinstance(value, str) and value:
+            path = path.replace(value, pseudonym(value))
+    return path
+
+
+def sanitize_body(body: bytes, content_type: Optional[bytes]):
+    if not body or content_type is None:
+        return None
+    if not content_type.startswith(JSON_TYPE):
+        return None
+    try:
+        return sanitize(json.loads(body))
+    except ValueError:
+        return None
+
+
+class TrafficCapture:
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logger = logging.getLogger("app.capture")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.listener: Optional[QueueListener] = None
+        self.records = 0
+
+    @property
+    def running(self) -> bool:
+        return self.listener is not None
+
+    def start(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(
+            self.path,
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(records))
+        self.listener = QueueListener(records, handler)
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener is None:
+            return
+        # Дописывает оставшиеся в очереди строки
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.listener = None
+
+    def record(self, entry: dict) -> None:
+        if self.listener is None:
+            return
+        self.records += 1
+        self.logger.info(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        )
+
+
+traffic_capture = TrafficCapture(
+    settings.capture_file,
+    settings.capture_max_bytes,
+    settings.capture_backup_count,
+)
+
+
+class CaptureMiddleware:
+    """Записывает каждый HTTP-запрос в traffic_capture."""
+
+    def __init__(self, app, capture: TrafficCapture = traffic_capture):
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.capture.running:
+            await self.app(scope, receive, send)
+            return
+        started_at = time.time()
+        started = time.perf_counter()
+        body = []
+        body_size = 0
+        status = 500
+
+        async def capturing_receive():
+            nonlocal body_size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                body_size += len(chunk)
+                if body_size <= settings.capture_max_body:
+                    body.append(chunk)
+            return message
+
+        async def capturing_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        holder = {}
+        token = captured_user.set(holder)
+        try:
+            await self.app(scope, capturing_receive, capturing_send)
+        finally:
+            captured_user.reset(token)
+            content_type = None
+            for name, value in scope.get("headers", []):
+                if name == b"content-type":
+                    content_type = value
+            route = scope.get("route")
+            self.capture.record(
+                {
+                    "t": round(started_at, 6),
+                    "method": scope["method"],
+                    "route": getattr(route, "path", None),
+                    "path": sanitize_path(scope),
+                    "query": sanitize_query(scope.get("query_string", b"")),
+                    "body": (
+                        sanitize_body(b"".join(body), content_type)
+                        if body_size <= settings.capture_max_body
+                        else None
+                    ),
+                    "body_bytes": body_size,
+                    "user": holder.get("user"),
+                    "superuser": holder.get("superuser", False),
+                    "status": status,
+                    "ms": round((time.perf_counter() - started) * 1000, 3),
+                }
+            )
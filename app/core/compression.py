@@ -0,0 +1,238 @@
+# app/core/compression.py
+"""
+Сжатие ответов по заголовку Accept-Encoding.
+
+Кодировки - gzip и, если установлены пакеты brotli или zstandard, br и
+zstd; из принятых клиентом выбирается лучшая по сжатию. Небольшие ответы
+(меньше settings.compression_min_size) и ответы, у которых уже есть
+Content-Encoding (например, ленты из кэша, сжатые заранее), отдаются
+как есть. Потоковые ответы сжимаются по кускам: каждый кусок сразу
+уходит клиенту, тело целиком в памяти не собирается.
+"""
+import asyncio
+import zlib
+from functools import lru_cache
+from typing import Optional
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+# Уровни выбраны ради скорости: ответы сжимаются на каждый запрос
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+# Доступные кодировки в порядке предпочтения сервера
+ENCODINGS = tuple(
+    encoding
+    for encoding, available in (
+        (ZSTD, zstandard is not None),
+        (BROTLI, brotli is not None),
+        (GZIP, True),
+    )
+    if available
+)
+COMPRESSIBLE_TYPES = (
+    b"text/",
+    b"application/json",
+    b"application/xml",
+    b"application/javascript",
+)
+# Куски больше этого сжимаются в потоке, чтобы не держать event loop
+THREAD_CHUNK_SIZE = 256 * 1024
+
+
+@lru_cache(maxsize=256)
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Лучшая из доступных кодировок, которые принимает клиент."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, parameters = item.partition(";")
+        weight = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                weight = float(parameters[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    default = weights.get("*", 0.0)
+    weight, _, encoding = max(
+        (weights.get(encoding, default), -index, encoding)
+        for index, encoding in enumerate(ENCODINGS)
+    )
+    return encoding if weight > 0 else None
+
+
+class Compressor:
+    """Потоковый компрессор: compress() отдаёт всё, что уже можно
+    распаковать на стороне клиента, finish() закрывает поток."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == GZIP:
+            # wbits=31 - формат gzip с заголовком и контрольной суммой
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == BROTLI:
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == ZSTD:
+            self.compressor = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL
+            ).compressobj()
+        else:
+            raise ValueError(f"Неизвестная кодировка {encoding}")
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        if self.encoding == BROTLI:
+            data = self.compressor.process(data)
+            return data + self.compressor.flush() if flush else data
+        data = self.compressor.compress(data)
+        if not flush:
+            return data
+        if self.encoding == GZIP:
+            return data + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    compressor = Compressor(encoding)
+    return compressor.compress(body, flush=False) + compressor.finish()
+
+
+def is_compressible(headers: list) -> bool:
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type" and not value.startswith(
+            COMPRESSIBLE_TYPES
+        ):
+            return False
+    return True
+
+
+def get_header(scope, name: bytes) -> Optional[bytes]:
+    for header, value in scope.get("headers", []):
+        if header == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы кодировкой, которую выбрал choose_encoding. Заголовок
+    ответа придерживается до первого куска тела: по нему видно, большой
+    ли ответ и будет ли продолжение.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = (
+            settings.compression_min_size
+            if minimum_size is None
+            else minimum_size
+        )
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            accept_encoding = get_header(scope, b"accept-encoding")
+            if accept_encoding is not None:
+                encoding = choose_encoding(accept_encoding.decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if passthrough or message["type"] not in (
+                "http.response.start",
+                "http.response.body",
+            ):
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = list(start.get("headers", []))
+                if (
+                    start["status"] < 200
+                    or start["status"] in (204, 304)
+                    or not is_compressible(headers)
+                    or not more_body
+                    and len(body) < self.minimum_size
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding)
+                headers = self._compressed_headers(headers, encoding)
+                if not more_body:
+                    body = await self._compress(compressor, body, False)
+                    body += compressor.finish()
+                    headers.append(
+                        (b"content-length", str(len(body)).encode())
+                    )
+                    await send({**start, "headers": headers})
+                    await send({**message, "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            body = await self._compress(compressor, body, True)
+            if not more_body:
+                body += compressor.finish()
+            if body or not more_body:
+                await send({**message, "body": body})
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    async def _compress(compressor: Compressor, body: bytes, flush: bool):
+        if len(body) > THREAD_CHUNK_SIZE:
+            return await asyncio.to_thread(compressor.compress, body, flush)
+        return compressor.compress(body, flush)
+
+    @staticmethod
+    def _compressed_headers(headers: list, encoding: str) -> list:
+        result = [(b"content-encoding", encoding.encode())]
+        vary = False
+        for name, value in headers:
+            if name == b"content-length":
+                continue
+            if name == b"etag" and value.startswith(b'"'):
+                # Сжатое тело не совпадает побайтно с исходным
+                value = b"W/" + value
+            if name == b"vary":
+                vary = True
+                if b"accept-encoding" not in value.lower():
+                    value += b", Accept-Encoding"
+            result.append((name, value))
+        if not vary:
+            result.append((b"vary", b"Accept-Encoding"))
+        return result
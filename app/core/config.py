@@ -1,5 +1,5 @@
 # app/core/config.py
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseSettings, EmailStr
 
 
@@ -7,10 +7,89 @@ class Settings(BaseSettings):
     app_title: str = "..."
     app_description: str = "..."
     database_url: str = "sqlite+aiosqlite:///./fastapi.db"
+    # URL для читающего движка; по умолчанию тот же файл в режиме mode=ro
+    database_read_url: Optional[str] = None
+    database_read_pool_size: int = 5
+    # Дополнительные файлы БД для броней. Основная БД - шард 0,
+    # если список пуст - брони хранятся только в ней
+    reservation_shard_urls: List[str] = []
+    # Сколько номеров броней воркер забирает из общей нумерации за раз
+    shard_id_block_size: int = 100
+    # Брони в памяти с журналом команд вместо записи прямо в БД
+    booking_engine_enabled: bool = False
+    booking_log_dir: str = "./booking_log"
+    # Через сколько команд сохранять снимок состояния
+    booking_snapshot_every: int = 10_000
+    # Квоты пользователя; None - без ограничения. Часы считаются
+    # по неделе (с понедельника, UTC), в которую бронь начинается
+    quota_week_hours: Optional[float] = None
+    # Сколько ещё не начавшихся броней может быть у пользователя
+    quota_future_reservations: Optional[int] = None
+    # Удержание интервала комнаты перед бронью: сколько секунд живёт и
+    # сколько удержаний может быть у пользователя одновременно
+    reservation_hold_seconds: int = 120
+    reservation_hold_max_per_user: int = 3
     app_version: str = "1.0.0"
     secret_key: str = "SECRET"
+    # Срок действия токена входа; столько же живут записи об отзыве
+    jwt_lifetime_seconds: int = 3600
     first_superuser_email: Optional[EmailStr] = None
     first_superuser_password: Optional[str] = None
+    # Контроль допуска запросов: лимиты для групп маршрутов в виде
+    # (скорость пополнения корзины в запросах/сек, ёмкость корзины)
+    rate_limit_enabled: bool = True
+    rate_limits: Dict[str, Tuple[float, int]] = {
+        "default": (20.0, 40),
+        "auth": (1.0, 10),
+        "reservations_write": (2.0, 10),
+    }
+    # Сколько запросов одновременно допускаем до БД, остальные получают 503
+    max_in_flight_requests: int = 64
+    # Через сколько секунд клиенту стоит повторить запрос после 503
+    load_shed_retry_after: int = 1
+    # Сколько секунд и сколько штук хранить ответы по Idempotency-Key
+    idempotency_ttl_seconds: int = 24 * 60 * 60
+    idempotency_max_keys: int = 10_000
+    # За сколько прошедших дней показывать брони в календарных лентах
+    calendar_feed_history_days: int = 30
+    # Профилирование запросов суперпользователей по заголовку X-Profile
+    profiling_enabled: bool = True
+    # Сколько последних профилей держать в памяти
+    profiling_max_profiles: int = 50
+    # Запросы к БД дольше порога (мс) попадают в журнал медленных;
+    # None - журнал выключен
+    slow_query_threshold_ms: Optional[float] = 200
+    # Доля повторных медленных запросов, для которых заново снимается
+    # EXPLAIN QUERY PLAN (для первого появления - всегда)
+    slow_query_explain_rate: float = 0.1
+    # Сколько разных запросов держать в сводке
+    slow_query_max_statements: int = 500
+    # Сжатие ответов по Accept-Encoding: ответы меньше порога (байт)
+    # отдаются несжатыми, потоковые сжимаются всегда
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    # Запись обезличенного трафика в NDJSON для benchmarks/replay.py:
+    # файл ротируется по размеру, тела больше capture_max_body не пишутся
+    capture_enabled: bool = False
+    capture_file: str = "./capture/requests.ndjson"
+    capture_max_bytes: int = 50 * 1024 * 1024
+    capture_backup_count: int = 10
+    capture_max_body: int = 64 * 1024
+    # Как часто (мс) воркер сверяет версии кэшей с таблицей в БД;
+    # 0 - при каждом обращении к кэшу, без устаревших ответов
+    data_version_check_interval_ms: float = 0
+    # Фоновые задачи (письма, календари): сколько задач может ждать
+    # в очереди и сколько выполняются одновременно
+    job_queue_capacity: int = 1000
+    job_queue_workers: int = 4
+    # Попытки задачи и пауза перед первым повтором (дальше удваивается)
+    job_max_attempts: int = 5
+    job_retry_delay: float = 1
+    job_timeout_seconds: float = 30
+    # Файл SQLite, в котором задачи переживают рестарт; None - в памяти
+    job_queue_db: Optional[str] = None
+    # Сколько секунд при остановке доделывать задачи из очереди
+    job_queue_drain_timeout: float = 10
 
     class Config:
         env_file = ".env"
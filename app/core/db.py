@@ -2,11 +2,19 @@
 
 # Все классы и функции для асинхронной работы
 # находятся в модуле sqlalchemy.ext.asyncio
-from sqlalchemy import Integer, Column
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Integer, Column, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, declared_attr
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
+from app.core.slow_queries import slow_query_log
 
 
 class PreBase:
@@ -19,13 +27,138 @@ class PreBase:
 
 Base = declarative_base(cls=PreBase)
 
-engine = create_async_engine(settings.database_url)
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+# Сколько секунд пишущее соединение ждёт блокировку записи другого
+# процесса - как и пул, который ждёт свободное соединение
+WRITE_LOCK_TIMEOUT = 30
+
+
+def utc_now() -> datetime:
+    """Текущее время как наивный datetime в UTC - так время хранится в БД."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Время с часовым поясом переводится в UTC, без пояса - считается UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_epoch_seconds(value: datetime) -> int:
+    return (to_naive_utc(value) - EPOCH) // SECOND
+
+
+def from_epoch_seconds(value: int) -> datetime:
+    return EPOCH + value * SECOND
+
+
+class EpochSeconds(TypeDecorator):
+    """
+    Момент времени, который хранится целым числом секунд UTC от эпохи.
+    В Python это по-прежнему наивный datetime (в UTC), aware-значения
+    приводятся к UTC. Доли секунды отбрасываются.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_epoch_seconds(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_epoch_seconds(value)
+
+
+def is_sqlite_file(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def get_read_only_url(database_url: str) -> str:
+    """URL того же файла SQLite, но открытого только на чтение."""
+    url = make_url(database_url)
+    path = os.path.abspath(url.database)
+    return str(
+        url.set(
+            database=f"file:{path}",
+            query={**url.query, "mode": "ro", "uri": "true"},
+        )
+    )
+
+
+def begin_immediate(connection) -> None:
+    # Блокировка записи берётся в начале транзакции, а не на первой
+    # записи: проверки, которые читают перед записью (квоты, пересечения),
+    # видят данные, которые другой воркер не изменит до коммита, а
+    # запись не упадёт с "database is locked", когда читающая транзакция
+    # попытается стать пишущей после чужого коммита
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # В режиме WAL читатели не блокируются писателем и наоборот
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def create_engines(database_url: str, read_url: Optional[str] = None):
+    """Пишущий и читающий движки для одного файла БД."""
+    if not is_sqlite_file(database_url):
+        engine = create_async_engine(database_url)
+        watch_slow_queries(engine)
+        return engine, engine
+    # SQLite допускает только одного писателя, поэтому у пишущего движка
+    # ровно одно соединение: записи воркера встают в очередь пула, а
+    # воркеры между собой ждут блокировку записи столько же, сколько пул
+    # ждёт соединение. Транзакции открывает begin_immediate, а не драйвер
+    engine = create_async_engine(
+        database_url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        connect_args={"timeout": WRITE_LOCK_TIMEOUT, "isolation_level": None},
+    )
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    event.listen(engine.sync_engine, "begin", begin_immediate)
+    # Читающий движок открывает файл в режиме mode=ro со своим пулом
+    read_engine = create_async_engine(
+        read_url or get_read_only_url(database_url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.database_read_pool_size,
+        max_overflow=0,
+    )
+    watch_slow_queries(engine)
+    watch_slow_queries(read_engine)
+    return engine, read_engine
+
+
+def watch_slow_queries(engine) -> None:
+    if settings.slow_query_threshold_ms is not None:
+        slow_query_log.watch(engine)
+
+
+engine, read_engine = create_engines(
+    settings.database_url, settings.database_read_url
+)
 
 # Создадим асинхронную сессии
 # Для работы, нужно постоянно открывать и закрывать
 # сессии (для каждого запроса), поэтому применим
 # функцию sessionmaker
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession)
+AsyncReadSessionLocal = sessionmaker(read_engine, class_=AsyncSession)
 
 # Асинхронный генератор сессий
 async def get_async_session():
@@ -36,3 +169,9 @@ async def get_async_session():
         yield async_session
         # Когда HTTP запрос отработает - выполнение кода вернётся сюда,
         # и при выходе из контекстного менеджера сессия будет закрыта
+
+
+# Генератор сессий только для чтения: для GET-ручек и проверок в валидаторах
+async def get_async_read_session():
+    async with AsyncReadSessionLocal() as async_session:
+        yield async_session
@@ -0,0 +1,185 @@
+# app/core/holds.py
+"""
+Удержания интервалов комнат в памяти воркера.
+
+В 9:00 понедельника многие бронируют одни и те же комнаты, и почти все
+POST /reservations/ проигрывают проверку пересечений, а клиенты
+повторяют их в цикле. Удержание - короткая (reservation_hold_seconds)
+заявка на интервал: пока оно живо, интервал занят для всех, кроме
+владельца, а владелец подтверждает его в настоящую бронь. Проигравшим
+отказывает проверка по памяти, без запросов к БД.
+
+Удержания лежат в таблице reservationhold и меняют версию HOLD_LIST в
+той же транзакции; воркер, увидев новую версию, перечитывает живые
+удержания - их немного. Для каждой комнаты в памяти куча (истекает,
+id): истёкшие удержания выбрасываются при обращении к комнате, а из
+таблицы удаляются при следующей записи удержаний.
+"""
+import asyncio
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.core.db import AsyncReadSessionLocal, utc_now
+from app.core.versions import data_versions
+from app.models import ReservationHold
+
+# Версия списка удержаний
+HOLD_LIST = ("hold", "*")
+
+
+class HoldConflict(Exception):
+    def __init__(self, holds: Sequence):
+        super().__init__(holds)
+        self.holds = holds
+
+
+class HoldNotFound(Exception):
+    pass
+
+
+class HoldEntry(NamedTuple):
+    id: int
+    meetingroom_id: int
+    user_id: int
+    from_reserve: datetime
+    to_reserve: datetime
+    expires_at: datetime
+
+    def __repr__(self) -> str:
+        return (
+            f"Удержано с {self.from_reserve} по {self.to_reserve} "
+            f"до {self.expires_at}"
+        )
+
+
+def to_entry(hold) -> HoldEntry:
+    return HoldEntry(
+        hold.id,
+        hold.meetingroom_id,
+        hold.user_id,
+        hold.from_reserve,
+        hold.to_reserve,
+        hold.expires_at,
+    )
+
+
+class HoldRegistry:
+    def __init__(self):
+        self.holds: dict[int, HoldEntry] = {}
+        # id комнаты -> куча (когда истекает, id удержания)
+        self.expiry: dict[int, list[tuple]] = defaultdict(list)
+        self.version: Optional[tuple] = None
+        self.lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        version = data_versions.get(*HOLD_LIST)
+        async with AsyncReadSessionLocal() as session:
+            rows = await session.execute(
+                select(
+                    ReservationHold.id,
+                    ReservationHold.meetingroom_id,
+                    ReservationHold.user_id,
+                    ReservationHold.from_reserve,
+                    ReservationHold.to_reserve,
+                    ReservationHold.expires_at,
+                ).where(ReservationHold.expires_at > utc_now())
+            )
+            holds = [HoldEntry(*row) for row in rows.all()]
+        self.holds = {}
+        self.expiry = defaultdict(list)
+        for hold in holds:
+            self.put(hold)
+        self.version = version
+
+    async def refresh(self) -> None:
+        if data_versions.get(*HOLD_LIST) == self.version:
+            return
+        async with self.lock:
+            if data_versions.get(*HOLD_LIST) != self.version:
+                await self.load()
+
+    async def get(self, hold_id: int) -> Optional[HoldEntry]:
+        """Живое удержание или None, если его нет или оно истекло."""
+        await self.refresh()
+        hold = self.holds.get(hold_id)
+        if hold is None or hold.expires_at <= utc_now():
+            return None
+        return hold
+
+    async def conflicts(
+        self,
+        room_id: int,
+        from_reserve: datetime,
+        to_reserve: datetime,
+        exclude_user_id: Optional[int] = None,
+    ) -> list[HoldEntry]:
+        """Чужие живые удержания комнаты, пересекающие интервал."""
+        await self.refresh()
+        return [
+            hold
+            for hold in self._room_holds(room_id)
+            # Касание тоже пересечение - как у броней
+            if hold.from_reserve <= to_reserve
+            and hold.to_reserve >= from_reserve
+            and hold.user_id != exclude_user_id
+        ]
+
+    async def in_window(
+        self,
+        room_ids: Sequence[int],
+        from_time: datetime,
+        to_time: datetime,
+        exclude_user_id: Optional[int] = None,
+    ) -> list[tuple]:
+        """Занятость из удержаний: (id комнаты, начало, конец)."""
+        busy = []
+        for room_id in room_ids:
+            for hold in await self.conflicts(
+                room_id, from_time, to_time, exclude_user_id
+            ):
+                busy.append((room_id, hold.from_reserve, hold.to_reserve))
+        return busy
+
+    async def count_for_user(self, user_id: int) -> int:
+        await self.refresh()
+        now = utc_now()
+        return sum(
+            1
+            for hold in self.holds.values()
+            if hold.user_id == user_id and hold.expires_at > now
+        )
+
+    def put(self, hold) -> None:
+        entry = to_entry(hold)
+        self.holds[entry.id] = entry
+        heapq.heappush(
+            self.expiry[entry.meetingroom_id], (entry.expires_at, entry.id)
+        )
+
+    def discard(self, hold_id: int) -> None:
+        # Запись в куче останется и выпадет при истечении
+        self.holds.pop(hold_id, None)
+
+    def _room_holds(self, room_id: int) -> list[HoldEntry]:
+        if room_id not in self.expiry:
+            return []
+        expiry = self.expiry[room_id]
+        now = utc_now()
+        while expiry and expiry[0][0] <= now:
+            _, hold_id = heapq.heappop(expiry)
+            self.holds.pop(hold_id, None)
+        if not expiry:
+            del self.expiry[room_id]
+            return []
+        return [
+            self.holds[hold_id]
+            for _, hold_id in expiry
+            if hold_id in self.holds
+        ]
+
+
+hold_registry = HoldRegistry()
@@ -0,0 +1,332 @@
+# app/core/idempotency.py
+"""
+Идемпотентные записи бронирований по заголовку Idempotency-Key.
+
+Ключи и ответы лежат в таблице idempotencykey основной БД, поэтому их
+видят все воркеры: перед выполнением запрос занимает ключ вставкой
+строки, и unique на ключе пропускает только один воркер. Остальные
+получают сохранённый ответ или 409, пока первый ещё выполняется.
+Готовые ответы не меняются, поэтому воркер дополнительно держит их
+в памяти и повторы читает оттуда, не обращаясь к БД.
+"""
+import asyncio
+import hashlib
+import json
+import time
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.core.rate_limit import get_client_key
+from app.models import IdempotencyKey
+
+IDEMPOTENT_METHODS = {"POST", "PATCH", "DELETE"}
+IDEMPOTENT_PATH_PREFIX = "/reservations"
+# Тела ответов больше этого размера храним сжатыми
+COMPRESS_THRESHOLD = 512
+# Ответы, которые стоит повторить, а не запоминать
+TRANSIENT_STATUSES = {429, 503}
+# Сколько секунд ключ занят запросом, который так и не завершился
+# (например, воркер упал): потом ключ можно занять заново
+IN_FLIGHT_TTL = 5 * 60
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    # None - запрос по ключу ещё выполняется в другом воркере
+    status: Optional[int]
+    content_type: bytes
+    compressed: bool
+    body: bytes
+
+    def get_body(self) -> bytes:
+        return zlib.decompress(self.body) if self.compressed else self.body
+
+
+class IdempotencyStore:
+    """
+    Первые ответы по ключам: в таблице для всех воркеров и в памяти
+    с вытеснением по TTL. Так как TTL у всех записей одинаковый,
+    OrderedDict хранит их в порядке истечения - протухшие записи
+    всегда в начале.
+    """
+
+    def __init__(self, ttl: int, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.responses: OrderedDict = OrderedDict()
+        # Ключи, запрос по которым выполняется прямо сейчас
+        self.in_flight: dict = {}
+
+    def _evict(self, now: float) -> None:
+        while self.responses:
+            key, (expires_at, _) = next(iter(self.responses.items()))
+            if expires_at > now and len(self.responses) <= self.max_keys:
+                break
+            del self.responses[key]
+
+    def get(self, key) -> Optional[StoredResponse]:
+        self._evict(time.monotonic())
+        entry = self.responses.get(key)
+        return entry[1] if entry else None
+
+    def put(self, key, response: StoredResponse) -> None:
+        now = time.monotonic()
+        self.responses[key] = (now + self.ttl, response)
+        self.responses.move_to_end(key)
+        self._evict(now)
+
+    async def reserve(
+        self, key: str, fingerprint: str
+    ) -> Optional[StoredResponse]:
+        """
+        Занимает ключ в таблице. None - ключ занят этим запросом, и его
+        надо выполнить; иначе - ответ из таблицы вместо выполнения.
+        """
+        async with AsyncSessionLocal() as session:
+            while True:
+                now = int(time.time())
+                await session.execute(
+                    delete(IdempotencyKey).where(
+                        IdempotencyKey.expires_at <= now
+                    )
+                )
+                try:
+                    await session.execute(
+                        insert(IdempotencyKey).values(
+                            key=key,
+                            fingerprint=fingerprint,
+                            expires_at=now + IN_FLIGHT_TTL,
+                        )
+                    )
+                    await session.commit()
+                    return None
+                except IntegrityError:
+                    await session.rollback()
+                row = await session.execute(
+                    select(
+                        IdempotencyKey.fingerprint,
+                        IdempotencyKey.status,
+                        IdempotencyKey.content_type,
+                        IdempotencyKey.compressed,
+                        IdempotencyKey.body,
+                    ).where(IdempotencyKey.key == key)
+                )
+                row = row.first()
+                # Строку успели удалить - пробуем занять ключ ещё раз
+                if row is not None:
+                    break
+        stored = StoredResponse(*row)
+        if stored.status is not None:
+            self.put(key, stored)
+        return stored
+
+    async def finish(self, key: str, response: StoredResponse) -> None:
+        """Сохраняет ответ по занятому ключу или освобождает ключ."""
+        async with AsyncSessionLocal() as session:
+            if response.status is None or not is_storable(response.status):
+                await session.execute(
+                    delete(IdempotencyKey).where(IdempotencyKey.key == key)
+                )
+            else:
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key)
+                    .values(
+                        status=response.status,
+                        content_type=response.content_type,
+                        compressed=response.compressed,
+                        body=response.body,
+                        expires_at=int(time.time()) + self.ttl,
+                    )
+                )
+                self.put(key, response)
+            await session.commit()
+
+
+idempotency_store = IdempotencyStore(
+    settings.idempotency_ttl_seconds, settings.idempotency_max_keys
+)
+
+
+def is_storable(status: int) -> bool:
+    return status < 500 and status not in TRANSIENT_STATUSES
+
+
+def get_idempotency_key(scope) -> Optional[bytes]:
+    for name, value in scope.get("headers", []):
+        if name == b"idempotency-key":
+            return value
+    return None
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_stored(send, response: StoredResponse, replayed: bool) -> None:
+    body = response.get_body()
+    headers = [
+        (b"content-type", response.content_type),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response.status,
+            "headers": headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Для запросов с заголовком Idempotency-Key первый ответ запоминается,
+    а повторы получают его копию, не доходя до логики бронирования.
+    Одновременные запросы с одним ключом в этом воркере ждут первый и
+    получают его ответ, в других воркерах - 409.
+    """
+
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        key = None
+        if (
+            scope["type"] == "http"
+            and scope["method"] in IDEMPOTENT_METHODS
+            and scope["path"].startswith(IDEMPOTENT_PATH_PREFIX)
+        ):
+            key = get_idempotency_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Ключи разных пользователей и разных ручек не пересекаются
+        store_key = hashlib.sha256(
+            b"\n".join(
+                (
+                    get_client_key(scope).encode(),
+                    scope["method"].encode(),
+                    scope["path"].encode(),
+                    key,
+                )
+            )
+        ).hexdigest()
+        body = await read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        stored = self.store.get(store_key)
+        if stored is None and store_key in self.store.in_flight:
+            stored = await asyncio.shield(self.store.in_flight[store_key])
+        if stored is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self.store.in_flight[store_key] = waiter
+            reserved = False
+            try:
+                stored = await self.store.reserve(store_key, fingerprint)
+                if stored is None:
+                    reserved = True
+                    stored = await self._execute(
+                        scope, body, send, fingerprint
+                    )
+                    await self.store.finish(store_key, stored)
+                    waiter.set_result(stored)
+                    return
+                waiter.set_result(stored)
+            except BaseException as exc:
+                # Ожидающие запросы получат ответ об ошибке, а не повиснут
+                if not waiter.done():
+                    waiter.set_result(_failed_response(fingerprint))
+                if reserved and isinstance(exc, Exception):
+                    await self.store.finish(
+                        store_key, _failed_response(fingerprint)
+                    )
+                raise
+            finally:
+                del self.store.in_flight[store_key]
+
+        if stored.fingerprint != fingerprint:
+            await send_stored(send, _key_reused_response(), False)
+        elif stored.status is None:
+            await send_stored(send, _in_progress_response(), False)
+        else:
+            await send_stored(send, stored, True)
+
+    async def _execute(self, scope, body, send, fingerprint) -> StoredResponse:
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                # Тело уже отдано - дальше ждём только отключения клиента
+                return {"type": "http.disconnect"}
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status = 500
+        content_type = b"application/json"
+        chunks = []
+
+        async def capture_send(message):
+            nonlocal status, content_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type":
+                        content_type = value
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+        response_body = b"".join(chunks)
+        compressed = len(response_body) > COMPRESS_THRESHOLD
+        if compressed:
+            response_body = zlib.compress(response_body)
+        return StoredResponse(
+            fingerprint, status, content_type, compressed, response_body
+        )
+
+
+def _error_response(fingerprint: str, status: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    return StoredResponse(
+        fingerprint, status, b"application/json", False, body
+    )
+
+
+def _key_reused_response() -> StoredResponse:
+    return _error_response(
+        "",
+        422,
+        "Idempotency-Key уже использован с другим телом запроса",
+    )
+
+
+def _in_progress_response() -> StoredResponse:
+    return _error_response(
+        "",
+        409,
+        "Запрос с этим Idempotency-Key ещё выполняется, повторите позже",
+    )
+
+
+def _failed_response(fingerprint: str) -> StoredResponse:
+    return _error_response(
+        fingerprint, 500, "Исходный запрос завершился ошибкой"
+    )
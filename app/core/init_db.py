@@ -4,14 +4,23 @@ import datetime
 
 from fastapi_users.exceptions import UserAlreadyExists
 from pydantic import EmailStr
+from sqlalchemy import func, select
 
 from app.core.config import settings
-from app.core.db import get_async_session
+from app.core.db import (
+    AsyncReadSessionLocal,
+    get_async_read_session,
+    get_async_session,
+)
 from app.core.user import get_user_db, get_user_manager
+from app.models import User
 from app.schemas.user import UserCreate
 
 # Превращаем асинхронные генераторы в асинхронные менеджеры контекста.
 get_async_session_context = contextlib.asynccontextmanager(get_async_session)
+get_async_read_session_context = contextlib.asynccontextmanager(
+    get_async_read_session
+)
 get_user_db_context = contextlib.asynccontextmanager(get_user_db)
 get_user_manager_context = contextlib.asynccontextmanager(get_user_manager)
 
@@ -26,33 +35,51 @@ async def create_user(
     is_superuser: bool = False,
 ):
     try:
-        # Получение объекта асинхронной сессии.
+        # Получение объектов асинхронных сессий: пишущей и читающей.
         async with get_async_session_context() as session:
-            # Получение объекта класса SQLAlchemyUserDatabase.
-            async with get_user_db_context(session) as user_db:
-                # Получение объекта класса UserManager.
-                async with get_user_manager_context(user_db) as user_manager:
-                    # Создание пользователя.
-                    await user_manager.create(
-                        UserCreate(
-                            email=email,
-                            password=password,
-                            is_superuser=is_superuser,
-                            first_name=first_name,
-                            birthdate=birthdate,
+            async with get_async_read_session_context() as read_session:
+                # Получение объекта класса SQLAlchemyUserDatabase.
+                async with get_user_db_context(
+                    session, read_session
+                ) as user_db:
+                    # Получение объекта класса UserManager.
+                    async with get_user_manager_context(
+                        user_db
+                    ) as user_manager:
+                        # Создание пользователя.
+                        await user_manager.create(
+                            UserCreate(
+                                email=email,
+                                password=password,
+                                is_superuser=is_superuser,
+                                first_name=first_name,
+                                birthdate=birthdate,
+                            )
                         )
-                    )
     # В случае, если такой пользователь уже есть, ничего не предпринимать.
     except UserAlreadyExists:
         pass
 
 
+# Есть ли пользователь с таким email. Сравнение без учёта регистра,
+# как у поиска по email в fastapi-users.
+async def user_exists(email: str) -> bool:
+    async with AsyncReadSessionLocal() as session:
+        user_id = await session.scalar(
+            select(User.id).where(func.lower(User.email) == func.lower(email))
+        )
+    return user_id is not None
+
+
 # Корутина, проверяющая, указаны ли в настройках данные для суперюзера.
 # Если да, то вызывается корутина create_user для создания суперпользователя.
 async def create_first_superuser():
     if (
         settings.first_superuser_email is not None
         and settings.first_superuser_password is not None
+        # Обычно суперюзер уже создан: хватает одного SELECT по индексу,
+        # без сессий, менеджера пользователей и проверки пароля
+        and not await user_exists(settings.first_superuser_email)
     ):
         await create_user(
             email=settings.first_superuser_email,
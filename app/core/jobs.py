@@ -0,0 +1,379 @@
+# app/core/jobs.py
+"""
+Очередь фоновых задач внутри процесса: письма, подтверждения броней,
+обновления календарей - всё, что не должно задерживать ответ клиенту.
+
+Ручка ставит задачу через enqueue и сразу отвечает, задачу выполняет
+один из job_queue_workers воркеров. Упавшая задача повторяется с
+удваивающейся паузой, пока не кончатся job_max_attempts попыток.
+Очередь ограничена: когда в ней job_queue_capacity задач, новые
+отклоняются, а не копятся в памяти без предела.
+
+С настройкой JOB_QUEUE_DB задачи до выполнения хранятся в отдельном
+файле SQLite и после рестарта ставятся в очередь заново. Задача,
+прерванная остановкой, выполнится ещё раз, поэтому обработчики должны
+спокойно переносить повтор. Файл не делится между процессами: каждому
+воркеру uvicorn - свой. Очередь и её счётчики (/admin/jobs) тоже у
+каждого воркера свои.
+"""
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором растёт вдвое, но не дальше этого предела (сек)
+MAX_RETRY_DELAY = 300
+# По скольким последним задачам считаются задержки
+LATENCY_WINDOW = 1000
+
+PENDING = "pending"
+FAILED = "failed"
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class JobStore:
+    """Задачи в файле SQLite. Методы блокирующие - вызываются в потоке."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS job ("
+                "id INTEGER PRIMARY KEY, "
+                "name TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "run_at REAL NOT NULL, "
+                "error TEXT)"
+            )
+
+    def add(self, name: str, payload: dict, run_at: float) -> int:
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO job (name, payload, status, run_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, json.dumps(payload), PENDING, run_at),
+            )
+            return cursor.lastrowid
+
+    def done(self, job_id: int) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM job WHERE id = ?", (job_id,))
+
+    def retry(
+        self, job_id: int, attempts: int, run_at: float, error: str
+    ) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE job SET attempts = ?, run_at = ?, error = ? "
+                "WHERE id = ?",
+                (attempts, run_at, error, job_id),
+            )
+
+    def fail(self, job_id: int, attempts: int, error: str) -> None:
+        # Исчерпавшие попытки задачи остаются в файле для разбора
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE job SET status = ?, attempts = ?, error = ? "
+                "WHERE id = ?",
+                (FAILED, attempts, error, job_id),
+            )
+
+    def pending(self) -> list[tuple]:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, name, payload, attempts, run_at FROM job "
+                "WHERE status = ? ORDER BY id",
+                (PENDING,),
+            ).fetchall()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class Job:
+    __slots__ = ("id", "name", "payload", "attempts", "ready_at")
+
+    def __init__(
+        self,
+        name: str,
+        payload: dict,
+        id: Optional[int] = None,
+        attempts: int = 0,
+    ):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+        # Когда задача встала в очередь (time.monotonic), для задержек
+        self.ready_at = time.monotonic()
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    values = sorted(values)
+    return {
+        "p50": round(values[len(values) // 2], 2),
+        "p95": round(values[int(len(values) * 0.95)], 2),
+        "max": round(values[-1], 2),
+    }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        capacity: int,
+        workers: int,
+        max_attempts: int,
+        retry_delay: float,
+        timeout: float,
+        store_path: Optional[str] = None,
+        drain_timeout: float = 10,
+    ):
+        self.capacity = capacity
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.store_path = store_path
+        self.drain_timeout = drain_timeout
+        self.store: Optional[JobStore] = None
+        self.handlers: dict[str, Handler] = {}
+        self.jobs: deque[Job] = deque()
+        # Задачи, ждущие повтора: задача -> отложенный вызов
+        self.delayed: dict[Job, asyncio.TimerHandle] = {}
+        self.running = 0
+        self.workers: list[asyncio.Task] = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.closing = False
+        self.counters = Counter()
+        # Ожидание в очереди и время выполнения последних задач, мс
+        self.wait_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.run_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def register(self, name: str) -> Callable[[Handler], Handler]:
+        """Декоратор: async-функция обработчик задач с этим именем."""
+
+        def decorator(handler: Handler) -> Handler:
+            self.handlers[name] = handler
+            return handler
+
+        return decorator
+
+    @property
+    def depth(self) -> int:
+        return len(self.jobs) + len(self.delayed) + self.running
+
+    async def enqueue(self, name: str, payload: dict) -> bool:
+        """
+        Ставит задачу в очередь. False - очередь переполнена и задача
+        отброшена; ошибку клиенту не отдаём, запрос уже выполнен.
+        """
+        if name not in self.handlers:
+            raise ValueError(f"Нет обработчика задач {name!r}")
+        if self.depth >= self.capacity:
+            self.counters["rejected"] += 1
+            logger.warning("Очередь задач переполнена, %s отброшена", name)
+            return False
+        job = Job(name, payload)
+        if self.store is not None:
+            try:
+                job.id = await asyncio.to_thread(
+                    self.store.add, name, payload, time.time()
+                )
+            except Exception:
+                # Не сохранилась - выполним хотя бы из памяти
+                logger.exception("Не удалось сохранить задачу %s", name)
+        self.counters["enqueued"] += 1
+        self._push(job)
+        return True
+
+    async def start(self) -> None:
+        self.closing = False
+        self.wakeup = asyncio.Event()
+        if self.store_path is not None:
+            self.store = JobStore(self.store_path)
+            now = time.time()
+            for job_id, name, payload, attempts, run_at in (
+                await asyncio.to_thread(self.store.pending)
+            ):
+                job = Job(name, json.loads(payload), job_id, attempts)
+                if run_at > now:
+                    self._delay(job, run_at - now)
+                else:
+                    self.jobs.append(job)
+        self.workers = [
+            asyncio.create_task(self._run_worker())
+            for _ in range(self.worker_count)
+        ]
+        if self.jobs:
+            self.wakeup.set()
+
+    async def stop(self) -> None:
+        """Доделывает очередь (не дольше drain_timeout) и гасит воркеры."""
+        if not self.workers:
+            return
+        self.closing = True
+        self.wakeup.set()
+        _, unfinished = await asyncio.wait(
+            self.workers, timeout=self.drain_timeout
+        )
+        # Оставшиеся воркеры заняты задачами, их прерываем
+        left = len(self.jobs) + len(self.delayed) + len(unfinished)
+        for worker in unfinished:
+            worker.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        for handle in self.delayed.values():
+            handle.cancel()
+        if left:
+            logger.warning(
+                "Остановка: не выполнено задач - %s%s",
+                left,
+                "" if self.store is not None else ", они потеряны",
+            )
+        self.jobs.clear()
+        self.delayed.clear()
+        self.workers = []
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self.jobs),
+            "running": self.running,
+            "delayed": len(self.delayed),
+            "capacity": self.capacity,
+            "workers": self.worker_count,
+            "persistent": self.store is not None,
+            **{
+                name: self.counters[name]
+                for name in (
+                    "enqueued",
+                    "completed",
+                    "retried",
+                    "failed",
+                    "rejected",
+                )
+            },
+            "wait_ms": percentiles(self.wait_ms),
+            "run_ms": percentiles(self.run_ms),
+        }
+
+    def _push(self, job: Job) -> None:
+        job.ready_at = time.monotonic()
+        self.jobs.append(job)
+        # До start() задачи копятся и берутся воркерами при запуске
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def _delay(self, job: Job, delay: float) -> None:
+        def ready():
+            del self.delayed[job]
+            self._push(job)
+
+        self.delayed[job] = asyncio.get_running_loop().call_later(
+            delay, ready
+        )
+
+    async def _run_worker(self) -> None:
+        while True:
+            while not self.jobs:
+                if self.closing:
+                    return
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            job = self.jobs.popleft()
+            self.running += 1
+            try:
+                await self._run(job)
+            finally:
+                self.running -= 1
+
+    async def _run(self, job: Job) -> None:
+        started = time.monotonic()
+        self.wait_ms.append((started - job.ready_at) * 1000)
+        job.attempts += 1
+        try:
+            await asyncio.wait_for(
+                self.handlers[job.name](job.payload), self.timeout
+            )
+        except Exception as error:
+            await self._on_error(job, error)
+            return
+        finally:
+            self.run_ms.append((time.monotonic() - started) * 1000)
+        self.counters["completed"] += 1
+        if job.id is not None:
+            await self._store_call(self.store.done, job.id)
+
+    async def _on_error(self, job: Job, error: Exception) -> None:
+        reason = repr(error)
+        if job.attempts >= self.max_attempts:
+            self.counters["failed"] += 1
+            logger.error(
+                "Задача %s не выполнена за %s попыток: %s",
+                job.name,
+                job.attempts,
+                reason,
+            )
+            if job.id is not None:
+                await self._store_call(
+                    self.store.fail, job.id, job.attempts, reason
+                )
+            return
+        # Случайная доля паузы, чтобы повторы не шли одной волной
+        delay = min(
+            self.retry_delay * 2 ** (job.attempts - 1), MAX_RETRY_DELAY
+        ) * random.uniform(0.5, 1)
+        self.counters["retried"] += 1
+        logger.warning(
+            "Задача %s упала (%s), повтор через %.1f с",
+            job.name,
+            reason,
+            delay,
+        )
+        if job.id is not None:
+            await self._store_call(
+                self.store.retry,
+                job.id,
+                job.attempts,
+                time.time() + delay,
+                reason,
+            )
+        self._delay(job, delay)
+
+    async def _store_call(self, method, *args) -> None:
+        try:
+            await asyncio.to_thread(method, *args)
+        except Exception:
+            logger.exception(
+                "Не удалось обновить задачу в %s", self.store_path
+            )
+
+
+job_queue = JobQueue(
+    settings.job_queue_capacity,
+    settings.job_queue_workers,
+    settings.job_max_attempts,
+    settings.job_retry_delay,
+    settings.job_timeout_seconds,
+    settings.job_queue_db,
+    settings.job_queue_drain_timeout,
+)
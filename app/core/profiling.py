@@ -0,0 +1,268 @@
+# app/core/profiling.py
+"""
+Профилирование отдельных запросов по требованию суперпользователя.
+
+Запрос с заголовком X-Profile: 1 (или параметром ?_profile=1) от
+суперпользователя выполняется под cProfile. Заодно записываются все
+SQL-запросы с длительностью: ожидание БД идёт в потоке драйвера и в дерево
+вызовов не попадает. Профиль сохраняется в памяти, его номер приходит
+в заголовке X-Profile-Id, а сам профиль отдают ручки /admin/profiles.
+Остальные запросы проходят без профилировщика. Хранилище и номера
+профилей у каждого воркера свои: ручки отдают только профили того
+воркера, который на них ответил.
+
+pydantic собран Cython и своих строк в профиле не даёт: время валидации
+и сериализации видно у вызывающих функций FastAPI (solve_dependencies,
+serialize_response, jsonable_encoder).
+"""
+import asyncio
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+from sqlalchemy import event, select
+
+from app.core.config import settings
+from app.core.db import AsyncReadSessionLocal
+from app.core.revocation import token_revocations
+from app.core.shards import shard_router
+from app.core.user import get_user_id_from_token
+from app.models import User
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "_profile"
+# Сколько строк pstats показывать в отчёте по умолчанию
+REPORT_LINES = 60
+
+# Список SQL-запросов профилируемого запроса; у остальных - None
+profiled_statements: ContextVar[Optional[list]] = ContextVar(
+    "profiled_statements", default=None
+)
+
+
+class StatsSnapshot:
+    # pstats.Stats забирает статистику у профилировщика и очищает её,
+    # поэтому каждый отчёт строится из своей копии
+    def __init__(self, stats: dict):
+        self.stats = dict(stats)
+
+    def create_stats(self) -> None:
+        pass
+
+
+class RequestProfile(NamedTuple):
+    id: int
+    created_at: datetime
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    # (текст запроса, длительность в мс)
+    statements: list
+    # Статистика cProfile: {функция: (вызовы, ..., вызывающие)}
+    stats: dict
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "created_at": self.created_at,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 2),
+            "sql_count": len(self.statements),
+            "sql_ms": round(sum(ms for _, ms in self.statements), 2),
+        }
+
+    def report(self, sort: str = "cumulative", limit: int = REPORT_LINES):
+        """Текстовый отчёт: запрос, SQL по порядку и дерево вызовов."""
+        out = io.StringIO()
+        summary = self.summary()
+        out.write(
+            f"{self.method} {self.path} -> {self.status}, "
+            f"{summary['duration_ms']} мс, SQL: {summary['sql_count']} "
+            f"запросов, {summary['sql_ms']} мс\n\n"
+        )
+        for statement, ms in self.statements:
+            out.write(f"{ms:9.2f} мс  {' '.join(statement.split())}\n")
+        out.write("\n")
+        stats = pstats.Stats(StatsSnapshot(self.stats), stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        stats.print_callees(limit)
+        return out.getvalue()
+
+    def dump(self) -> bytes:
+        # Формат файлов .prof: открывается в snakeviz и pstats
+        return marshal.dumps(self.stats)
+
+
+class ProfileStore:
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self.profiles: OrderedDict = OrderedDict()
+        self.ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self.ids)
+
+    def put(self, profile: RequestProfile) -> None:
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        return self.profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        return [
+            profile.summary() for profile in reversed(self.profiles.values())
+        ]
+
+
+profile_store = ProfileStore(settings.profiling_max_profiles)
+
+
+def is_profile_requested(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0")
+    query_string = scope.get("query_string", b"")
+    if PROFILE_QUERY_PARAM.encode() not in query_string:
+        return False
+    query = query_string.decode("latin-1")
+    return any(
+        name == PROFILE_QUERY_PARAM and value not in ("", "0")
+        for name, value in parse_qsl(query)
+    )
+
+
+def get_bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                return token
+    return None
+
+
+async def is_superuser(scope) -> bool:
+    """То же, что current_superuser, но до маршрутизации запроса."""
+    await token_revocations.refresh()
+    user_id = get_user_id_from_token(get_bearer_token(scope))
+    if user_id is None:
+        return False
+    async with AsyncReadSessionLocal() as session:
+        user = await session.execute(
+            select(User.is_active, User.is_superuser).where(User.id == user_id)
+        )
+        user = user.first()
+    return user is not None and user.is_active and user.is_superuser
+
+
+def before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    if profiled_statements.get() is not None:
+        context.profile_started = time.perf_counter()
+
+
+def after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    statements = profiled_statements.get()
+    started = getattr(context, "profile_started", None)
+    if statements is not None and started is not None:
+        statements.append((statement, (time.perf_counter() - started) * 1000))
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запросы суперпользователей с флагом X-Profile. Профили
+    снимаются по одному: cProfile в потоке может быть только один, и он
+    видит все корутины цикла событий, поэтому в профиль попадут и
+    одновременные запросы - профилировать стоит на спокойном сервере.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store):
+        self.app = app
+        self.store = store
+        self.lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not is_profile_requested(scope)
+            or not await is_superuser(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        async with self.lock:
+            await self._profile(scope, receive, send)
+
+    async def _profile(self, scope, receive, send):
+        profile_id = self.store.next_id()
+        status = 500
+
+        async def profiled_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", str(profile_id).encode()),
+                ]
+            await send(message)
+
+        statements = []
+        token = profiled_statements.set(statements)
+        engines = {
+            shard_engine.sync_engine
+            for shard in shard_router.shards
+            for shard_engine in (shard.engine, shard.read_engine)
+        }
+        for sync_engine in engines:
+            event.listen(
+                sync_engine, "before_cursor_execute", before_cursor_execute
+            )
+            event.listen(
+                sync_engine, "after_cursor_execute", after_cursor_execute
+            )
+        profiler = cProfile.Profile()
+        created_at = datetime.now()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            profiler.disable()
+            duration_ms = (time.perf_counter() - started) * 1000
+            profiled_statements.reset(token)
+            for sync_engine in engines:
+                event.remove(
+                    sync_engine, "before_cursor_execute", before_cursor_execute
+                )
+                event.remove(
+                    sync_engine, "after_cursor_execute", after_cursor_execute
+                )
+            profiler.create_stats()
+            self.store.put(
+                RequestProfile(
+                    profile_id,
+                    created_at,
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    duration_ms,
+                    statements,
+                    profiler.stats,
+                )
+            )
@@ -0,0 +1,181 @@
+# app/core/rate_limit.py
+"""Контроль допуска запросов: token bucket на пользователя и сброс нагрузки."""
+import json
+import math
+import time
+from collections import defaultdict
+from typing import Optional
+
+from app.core.config import settings
+from app.core.user import get_user_id_from_token
+
+WRITE_METHODS = {"POST", "PATCH", "PUT", "DELETE"}
+# Когда корзин становится больше, чистим те, что давно простаивают
+MAX_BUCKETS = 10_000
+
+
+def get_route_group(method: str, path: str) -> str:
+    """Группа маршрутов, к которой применяется свой лимит из настроек."""
+    if path.startswith("/auth"):
+        return "auth"
+    if path.startswith("/reservations") and method in WRITE_METHODS:
+        return "reservations_write"
+    return "default"
+
+
+def get_client_key(scope) -> str:
+    """Ключ корзины: id пользователя из токена, либо IP для анонимов."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                user_id = get_user_id_from_token(token)
+                if user_id is not None:
+                    return f"user:{user_id}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def consume(self, now: float) -> Optional[float]:
+        """Забирает токен. Если токенов нет - возвращает, сколько ждать."""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self.buckets: dict = {}
+        # Счётчики для мониторинга
+        self.allowed = defaultdict(int)
+        self.limited = defaultdict(int)
+        self.shed = 0
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+
+    def _get_bucket(self, group: str, key: str, now: float) -> TokenBucket:
+        bucket = self.buckets.get((group, key))
+        if bucket is None:
+            if len(self.buckets) >= MAX_BUCKETS:
+                self._prune(now)
+            rate, capacity = self.limits.get(group, self.limits["default"])
+            bucket = self.buckets[(group, key)] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        # Корзина, которая успела наполниться до краёв, ничем не отличается
+        # от новой - её можно забыть
+        for bucket_key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[bucket_key]
+
+    def check(self, group: str, key: str) -> Optional[float]:
+        now = time.monotonic()
+        retry_after = self._get_bucket(group, key, now).consume(now)
+        if retry_after is None:
+            self.allowed[group] += 1
+        else:
+            self.limited[group] += 1
+        return retry_after
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": settings.max_in_flight_requests,
+            "max_in_flight_seen": self.max_in_flight_seen,
+            "shed": self.shed,
+            "buckets": len(self.buckets),
+            "groups": {
+                group: {
+                    "rate": rate,
+                    "burst": capacity,
+                    "allowed": self.allowed[group],
+                    "limited": self.limited[group],
+                }
+                for group, (rate, capacity) in self.limits.items()
+            },
+        }
+
+
+rate_limiter = RateLimiter(settings.rate_limits)
+
+
+async def send_rejection(send, status_code: int, retry_after: float, detail):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """
+    Отсекает лишние запросы до того, как они дойдут до БД:
+    сначала ограничение числа одновременных запросов (503),
+    потом персональная корзина токенов для группы маршрутов (429).
+    """
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        # Preflight-запросы CORS не ограничиваем
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter
+        if limiter.in_flight >= settings.max_in_flight_requests:
+            limiter.shed += 1
+            await send_rejection(
+                send,
+                503,
+                settings.load_shed_retry_after,
+                "Сервер перегружен, повторите запрос позже",
+            )
+            return
+        retry_after = limiter.check(
+            get_route_group(scope["method"], scope["path"]),
+            get_client_key(scope),
+        )
+        if retry_after is not None:
+            await send_rejection(
+                send, 429, retry_after, "Слишком много запросов"
+            )
+            return
+        limiter.in_flight += 1
+        limiter.max_in_flight_seen = max(
+            limiter.max_in_flight_seen, limiter.in_flight
+        )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
@@ -0,0 +1,208 @@
+# app/core/revocation.py
+"""
+Отзыв токенов входа без запроса к БД на каждый запрос.
+
+Токен входа - JWT, который живёт час и сам по себе не отзывается.
+Поэтому у каждого токена есть jti (номер) и iat (время выдачи), а
+воркер держит в памяти два словаря: отозванные jti и для пользователя
+момент, раньше которого выданные токены недействительны (так отзывает
+токены деактивация). Проверка токена - два поиска в словаре.
+Бессрочные токены календарных лент отзываются вместе с токенами
+пользователя: отзыв увеличивает User.feed_version. Версию ссылок и
+активность пользователя лента сверяет по словарю feed_links, который
+сбрасывается по версии (FEED, id пользователя), - частый опрос ленты
+не читает пользователя из БД.
+
+Запись живёт, пока не истекли токены, которые она отзывает, и лежит
+в таблице revokedtoken - отзыв переживает рестарт. Запись меняет
+версию TOKEN_LIST в той же транзакции, и воркеры, увидев новую версию,
+перечитывают таблицу - это несколько сотен строк за час.
+"""
+import asyncio
+import heapq
+import time
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncReadSessionLocal
+from app.core.versions import data_versions
+from app.models import RevokedToken, User
+
+# Версия списка отзывов
+TOKEN_LIST = ("token", "*")
+# Версия ссылок на календарь пользователя: её меняют новая ссылка,
+# деактивация, повторная активация и удаление пользователя
+FEED = "feed"
+
+
+class TokenRevocations:
+    def __init__(self, lifetime_seconds: int):
+        self.lifetime_seconds = lifetime_seconds
+        # jti -> когда токен истекает
+        self.tokens: dict[str, int] = {}
+        # id пользователя -> токены, выданные раньше, недействительны
+        self.not_before: dict[int, int] = {}
+        # Куча (когда запись больше не нужна, jti, id пользователя):
+        # для отзыва токена id равен 0, для отзыва пользователя jti - ""
+        self.expiry: list[tuple] = []
+        self.version: Optional[tuple] = None
+        self.lock = asyncio.Lock()
+
+    def is_revoked(self, payload: dict) -> bool:
+        """payload - проверенное содержимое токена входа."""
+        now = time.time()
+        if self.expiry and self.expiry[0][0] <= now:
+            self._purge(now)
+        if payload.get("jti") in self.tokens:
+            return True
+        user_id = int(payload["user_id"])
+        if user_id not in self.not_before:
+            return False
+        # Токены без iat выданы до появления отзыва
+        return payload.get("iat", 0) < self.not_before[user_id]
+
+    async def refresh(self) -> None:
+        if data_versions.get(*TOKEN_LIST) == self.version:
+            return
+        async with self.lock:
+            if data_versions.get(*TOKEN_LIST) != self.version:
+                await self.load()
+
+    async def load(self) -> None:
+        version = data_versions.get(*TOKEN_LIST)
+        async with AsyncReadSessionLocal() as session:
+            rows = await session.execute(
+                select(
+                    RevokedToken.user_id,
+                    RevokedToken.jti,
+                    RevokedToken.issued_before,
+                    RevokedToken.expires_at,
+                ).where(RevokedToken.expires_at > time.time())
+            )
+            rows = rows.all()
+        self.tokens = {}
+        self.not_before = {}
+        self.expiry = []
+        for user_id, jti, issued_before, expires_at in rows:
+            self._add(user_id, jti, issued_before, expires_at)
+        self.version = version
+
+    async def revoke_token(self, payload: dict, session: AsyncSession) -> None:
+        """
+        Отзывает один токен (выход). Как и остальные отзывы - в
+        транзакции session, без коммита: словари в памяти всех воркеров
+        обновятся, когда они увидят новую версию TOKEN_LIST.
+        """
+        jti = payload.get("jti")
+        if jti is None:
+            # Токен выдан до появления jti - отзываем все такие токены
+            await self.revoke_user(int(payload["user_id"]), session)
+            return
+        await self._stage(
+            RevokedToken(
+                user_id=int(payload["user_id"]),
+                jti=jti,
+                expires_at=payload["exp"],
+            ),
+            session,
+        )
+
+    async def revoke_user(self, user_id: int, session: AsyncSession) -> None:
+        """
+        Отзывает все токены пользователя, выданные до этого момента, и
+        все ссылки на его календарь.
+        """
+        # Ссылки живут дольше записи об отзыве, поэтому меняется версия
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(feed_version=User.feed_version + 1)
+        )
+        await feed_links.expire(user_id, session)
+        # iat - целые секунды: отзываем и всё, что выдано в эту секунду
+        issued_before = int(time.time()) + 1
+        # Новый момент отзыва перекрывает прежний
+        await session.execute(
+            delete(RevokedToken).where(
+                RevokedToken.user_id == user_id,
+                RevokedToken.jti.is_(None),
+            )
+        )
+        await self._stage(
+            RevokedToken(
+                user_id=user_id,
+                issued_before=issued_before,
+                expires_at=issued_before + self.lifetime_seconds,
+            ),
+            session,
+        )
+
+    async def _stage(self, row: RevokedToken, session: AsyncSession) -> None:
+        # Заодно убираем записи, токены которых уже истекли
+        await session.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at <= time.time())
+        )
+        session.add(row)
+        await data_versions.bump(session, TOKEN_LIST)
+
+    def _add(self, user_id, jti, issued_before, expires_at) -> None:
+        if jti is not None:
+            self.tokens[jti] = expires_at
+            heapq.heappush(self.expiry, (expires_at, jti, 0))
+            return
+        if issued_before <= self.not_before.get(user_id, 0):
+            return
+        self.not_before[user_id] = issued_before
+        heapq.heappush(self.expiry, (expires_at, "", user_id))
+
+    def _purge(self, now: float) -> None:
+        while self.expiry and self.expiry[0][0] <= now:
+            expires_at, jti, user_id = heapq.heappop(self.expiry)
+            if jti:
+                self.tokens.pop(jti, None)
+                continue
+            # Если пользователя отзывали ещё раз, запись пока нужна
+            not_before = self.not_before.get(user_id)
+            if not_before is not None and (
+                not_before + self.lifetime_seconds <= now
+            ):
+                del self.not_before[user_id]
+
+
+token_revocations = TokenRevocations(settings.jwt_lifetime_seconds)
+
+
+class FeedLinks:
+    def __init__(self):
+        # id пользователя -> (версия данных, версия ссылок, активен ли)
+        self.users: dict[int, tuple] = {}
+
+    async def check(
+        self, user_id: int, feed_version: int, session: AsyncSession
+    ) -> bool:
+        """Действует ли ссылка версии feed_version на календарь."""
+        # Версию берём до чтения: изменение во время чтения её сменит
+        version = data_versions.get(FEED, user_id)
+        entry = self.users.get(user_id)
+        if entry is None or entry[0] != version:
+            user = await session.execute(
+                select(User.feed_version, User.is_active).where(
+                    User.id == user_id
+                )
+            )
+            user = user.first()
+            entry = (version, *user) if user else (version, None, False)
+            self.users[user_id] = entry
+        _, current_version, is_active = entry
+        return is_active and current_version == feed_version
+
+    @staticmethod
+    async def expire(user_id: int, session: AsyncSession) -> None:
+        """В транзакции session, без коммита, как и отзывы токенов."""
+        await data_versions.bump(session, (FEED, user_id))
+
+
+feed_links = FeedLinks()
@@ -0,0 +1,95 @@
+# app/core/rooms.py
+"""
+Справочник переговорных комнат в памяти воркера.
+
+Комнаты меняются редко, а их существование и уникальность названия
+проверяются при каждой записи брони. Справочник держит словари
+id -> комната и название -> id и загружается целиком при старте.
+Записи CRUD комнат обновляют его сразу после коммита, а для остальных
+воркеров меняют версию (ROOM, "*") в той же транзакции - увидев новую
+версию, воркер перечитывает комнаты одним запросом. Гонки двух
+одинаковых названий по-прежнему ловит unique на meetingroom.name -
+запись тогда отвечает той же ошибкой 422, что и проверка названия.
+"""
+import asyncio
+from typing import NamedTuple, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.core.db import AsyncReadSessionLocal
+from app.core.versions import ROOM, data_versions
+from app.models import MeetingRoom
+
+# Версия списка комнат: её меняют создание, изменение и удаление
+ROOM_LIST = (ROOM, "*")
+ROOM_NAME_TAKEN = "Такая переговорная комната уже существует!"
+
+
+class RoomNameTaken(Exception):
+    """Название заняли между проверкой и записью - сработал unique."""
+
+
+class RoomEntry(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+
+
+class RoomRegistry:
+    def __init__(self):
+        self.rooms: dict[int, RoomEntry] = {}
+        self.ids_by_name: dict[str, int] = {}
+        # Версия данных, на которой справочник загружен
+        self.version: Optional[tuple] = None
+        self.lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        # Версию берём до чтения: запись во время загрузки её изменит,
+        # и следующая проверка перечитает комнаты ещё раз
+        version = data_versions.get(*ROOM_LIST)
+        async with AsyncReadSessionLocal() as session:
+            rows = await session.execute(
+                select(
+                    MeetingRoom.id, MeetingRoom.name, MeetingRoom.description
+                )
+            )
+            rooms = [RoomEntry(*row) for row in rows.all()]
+        self.rooms = {room.id: room for room in rooms}
+        self.ids_by_name = {room.name: room.id for room in rooms}
+        self.version = version
+
+    async def refresh(self) -> None:
+        if data_versions.get(*ROOM_LIST) == self.version:
+            return
+        async with self.lock:
+            if data_versions.get(*ROOM_LIST) != self.version:
+                await self.load()
+
+    async def get(self, room_id: int) -> Optional[RoomEntry]:
+        await self.refresh()
+        return self.rooms.get(room_id)
+
+    async def get_id_by_name(self, name: str) -> Optional[int]:
+        await self.refresh()
+        return self.ids_by_name.get(name)
+
+    async def get_ids(self, room_ids: Optional[Sequence[int]]) -> list[int]:
+        """Id комнат из room_ids, которые существуют; без списка - все."""
+        await self.refresh()
+        if room_ids is None:
+            return sorted(self.rooms)
+        return sorted(set(room_ids) & self.rooms.keys())
+
+    def put(self, room: MeetingRoom) -> None:
+        self.discard(room.id)
+        entry = RoomEntry(room.id, room.name, room.description)
+        self.rooms[entry.id] = entry
+        self.ids_by_name[entry.name] = entry.id
+
+    def discard(self, room_id: int) -> None:
+        room = self.rooms.pop(room_id, None)
+        if room is not None and self.ids_by_name.get(room.name) == room_id:
+            del self.ids_by_name[room.name]
+
+
+room_registry = RoomRegistry()
@@ -0,0 +1,365 @@
+# app/core/shards.py
+"""
+Шардирование броней по нескольким файлам SQLite.
+
+У SQLite один писатель на файл, поэтому брони разных комнат можно
+разнести по разным файлам, и записи в них пойдут параллельно. Комнаты,
+пользователи и карта "комната -> шард" остаются в основной БД (шард 0).
+Номера броней сквозные для всех шардов, поэтому бронь можно найти по id,
+опросив шарды параллельно, и перенести в другой шард без смены id.
+
+Карта комнат держится в памяти воркера. Каждое её изменение меняет
+версию ("shard", "*") в той же транзакции, а перед выбором шарда воркер
+сверяет версию и при необходимости перечитывает карту - так перенос
+комнаты видят все воркеры без перезапуска.
+
+Перенос комнат между шардами:
+    python -m app.core.shards move <meeting_room_id> <shard>
+    python -m app.core.shards rebalance [--dry-run]
+"""
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.db import (
+    AsyncReadSessionLocal,
+    AsyncSessionLocal,
+    Base,
+    create_engines,
+    engine,
+    read_engine,
+)
+from app.core.versions import data_versions
+from app.models import IdSequence, MeetingRoom, Reservation, RoomShard
+
+RESERVATION_SEQUENCE = "reservation"
+# Версия карты "комната -> шард": её меняет каждое назначение комнаты
+SHARD_MAP = ("shard", "*")
+
+
+class Shard:
+    def __init__(self, index: int, writer_engine, reader_engine):
+        self.index = index
+        self.engine = writer_engine
+        self.read_engine = reader_engine
+        # Объекты из шардов живут дольше сессии, поэтому не истекают
+        # после коммита
+        self.session_maker = sessionmaker(
+            writer_engine, class_=AsyncSession, expire_on_commit=False
+        )
+        self.read_session_maker = sessionmaker(
+            reader_engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+
+class ShardRouter:
+    def __init__(self, shard_urls: Iterable[str]):
+        self.shards = [Shard(0, engine, read_engine)] + [
+            Shard(index, *create_engines(url))
+            for index, url in enumerate(shard_urls, start=1)
+        ]
+        self.room_shards: dict[int, int] = {}
+        # Версия данных, на которой загружена карта комнат
+        self.version: Optional[tuple] = None
+        self.map_lock = asyncio.Lock()
+        # Ещё не розданные номера броней: [следующий, граница блока)
+        self.next_id = 0
+        self.id_limit = 0
+        self.id_lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.shards) > 1
+
+    def shard_for_room(self, room_id: int) -> int:
+        return self.room_shards.get(room_id, 0)
+
+    def group_rooms(self, room_ids: Iterable[int]) -> dict[int, list[int]]:
+        groups = defaultdict(list)
+        for room_id in room_ids:
+            groups[self.shard_for_room(room_id)].append(room_id)
+        return groups
+
+    def session(self, shard: int, read: bool = False) -> AsyncSession:
+        shard = self.shards[shard]
+        if read:
+            return shard.read_session_maker()
+        return shard.session_maker()
+
+    @staticmethod
+    def is_read_session(session: AsyncSession) -> bool:
+        return session.bind is not engine
+
+    async def gather(
+        self,
+        query: Callable[[AsyncSession], Awaitable],
+        session: AsyncSession,
+    ) -> list:
+        """
+        Выполняет query во всех шардах разом. Для основной БД используется
+        переданная session: у пишущего движка одно соединение, и открыть
+        вторую пишущую сессию, пока эта держит транзакцию, нельзя.
+        """
+        return await self.gather_groups(
+            {shard: None for shard in range(len(self.shards))},
+            lambda shard_session, _: query(shard_session),
+            session,
+        )
+
+    async def gather_groups(
+        self,
+        groups: dict,
+        query: Callable[[AsyncSession, list], Awaitable],
+        session: AsyncSession,
+    ) -> list:
+        """Как gather, но каждый шард получает свою часть данных из groups."""
+        read = self.is_read_session(session)
+
+        async def run(shard: int, items):
+            if shard == 0:
+                return await query(session, items)
+            async with self.session(shard, read) as shard_session:
+                return await query(shard_session, items)
+
+        return await asyncio.gather(
+            *(run(shard, items) for shard, items in groups.items())
+        )
+
+    async def create_schema(self) -> None:
+        # В дополнительных шардах только таблица броней
+        for shard in self.shards[1:]:
+            async with shard.engine.begin() as connection:
+                await connection.run_sync(
+                    Base.metadata.create_all, tables=[Reservation.__table__]
+                )
+
+    async def load_room_map(self) -> None:
+        # Версию берём до чтения, как в справочнике комнат. Читаем через
+        # читающий движок: вызывающий может держать единственное
+        # соединение пишущего
+        version = data_versions.get(*SHARD_MAP)
+        async with AsyncReadSessionLocal() as session:
+            rows = await session.execute(
+                select(RoomShard.meetingroom_id, RoomShard.shard)
+            )
+            self.room_shards = dict(rows.all())
+        self.version = version
+
+    async def refresh(self) -> None:
+        """Перечитывает карту, если её изменил другой воркер или CLI."""
+        if not self.enabled or data_versions.get(*SHARD_MAP) == self.version:
+            return
+        async with self.map_lock:
+            if data_versions.get(*SHARD_MAP) != self.version:
+                await self.load_room_map()
+
+    async def assign_room(self, room_id: int, session: AsyncSession) -> int:
+        """Новую комнату кладём в шард, где сейчас меньше всего комнат."""
+        await self.refresh()
+        load = Counter({index: 0 for index in range(len(self.shards))})
+        load.update(self.room_shards.values())
+        shard = min(load, key=lambda index: (load[index], index))
+        await self.set_room_shard(room_id, shard, session)
+        return shard
+
+    async def set_room_shard(
+        self, room_id: int, shard: int, session: AsyncSession
+    ) -> None:
+        updated = await session.execute(
+            update(RoomShard)
+            .where(RoomShard.meetingroom_id == room_id)
+            .values(shard=shard)
+        )
+        if updated.rowcount == 0:
+            session.add(RoomShard(meetingroom_id=room_id, shard=shard))
+        await data_versions.bump(session, SHARD_MAP)
+        await session.commit()
+        self.room_shards[room_id] = shard
+
+    async def forget_room(self, room_id: int, session: AsyncSession) -> None:
+        shard = self.room_shards.pop(room_id, 0)
+        # Брони удалённой комнаты в её шарде больше никому не нужны
+        async with self.session(shard) as shard_session:
+            await shard_session.execute(
+                Reservation.__table__.delete().where(
+                    Reservation.meetingroom_id == room_id
+                )
+            )
+            await shard_session.commit()
+        await session.execute(
+            RoomShard.__table__.delete().where(
+                RoomShard.meetingroom_id == room_id
+            )
+        )
+        await data_versions.bump(session, SHARD_MAP)
+        await session.commit()
+
+    async def allocate_ids(
+        self, count: int, session: AsyncSession
+    ) -> list[int]:
+        """
+        Сквозные номера для новых броней. session - пишущая сессия
+        основной БД: у неё единственное соединение, поэтому номера берутся
+        через неё, а не через новую сессию.
+        """
+        async with self.id_lock:
+            if self.id_limit - self.next_id < count:
+                size = max(count, settings.shard_id_block_size)
+                self.next_id = await self._take_id_block(size, session)
+                self.id_limit = self.next_id + size
+            ids = list(range(self.next_id, self.next_id + count))
+            self.next_id += count
+            return ids
+
+    async def _take_id_block(self, size: int, session: AsyncSession) -> int:
+        while True:
+            # UPDATE первым захватывает блокировку записи, поэтому
+            # два воркера не получат один и тот же блок
+            updated = await session.execute(
+                update(IdSequence)
+                .where(IdSequence.name == RESERVATION_SEQUENCE)
+                .values(next_value=IdSequence.next_value + size)
+            )
+            if updated.rowcount:
+                next_value = await session.execute(
+                    select(IdSequence.next_value).where(
+                        IdSequence.name == RESERVATION_SEQUENCE
+                    )
+                )
+                next_value = next_value.scalar_one()
+                await session.commit()
+                return next_value - size
+            # Первый запуск: продолжаем нумерацию после самой большой
+            # брони во всех шардах
+            max_ids = await self.gather(self._get_max_id, session)
+            start = max(max_ids) + 1
+            session.add(
+                IdSequence(name=RESERVATION_SEQUENCE, next_value=start + size)
+            )
+            try:
+                await session.commit()
+                return start
+            except IntegrityError:
+                # Другой воркер успел создать счётчик - повторим UPDATE
+                await session.rollback()
+
+    @staticmethod
+    async def _get_max_id(session: AsyncSession) -> int:
+        max_id = await session.execute(select(func.max(Reservation.id)))
+        return max_id.scalar() or 0
+
+    async def move_room(self, room_id: int, target: int) -> int:
+        """
+        Переносит брони комнаты в другой шард с сохранением id.
+        Воркеры перечитывают карту перед каждым выбором шарда, но бронь,
+        для которой шард выбран до переключения, ещё может записаться в
+        старый шард - такие брони переносятся повторным проходом, пока в
+        старом шарде не останется ничего.
+        """
+        source = self.shard_for_room(room_id)
+        if source == target:
+            return 0
+        table = Reservation.__table__
+        moved = 0
+        switched = False
+        # Сессии открываются по очереди: у пишущих движков по одному
+        # соединению, и вложенная сессия того же шарда ждала бы вечно
+        while True:
+            async with self.session(source) as source_session:
+                rows = await source_session.execute(
+                    select(table).where(table.c.meetingroom_id == room_id)
+                )
+                rows = [dict(row) for row in rows.mappings()]
+            if rows:
+                async with self.session(target) as target_session:
+                    await target_session.execute(insert(table), rows)
+                    await target_session.commit()
+            if not switched:
+                async with AsyncSessionLocal() as session:
+                    await self.set_room_shard(room_id, target, session)
+                switched = True
+            if not rows:
+                return moved
+            async with self.session(source) as source_session:
+                await source_session.execute(
+                    table.delete().where(
+                        table.c.id.in_([row["id"] for row in rows])
+                    )
+                )
+                await source_session.commit()
+            moved += len(rows)
+
+    async def plan_rebalance(self) -> list[tuple[int, int, int]]:
+        """
+        Раскладывает комнаты по шардам так, чтобы число броней было
+        примерно равным: самые нагруженные комнаты - в наименее
+        загруженный шард. Возвращает переносы (комната, откуда, куда).
+        """
+
+        async def count_reservations(session):
+            rows = await session.execute(
+                select(Reservation.meetingroom_id, func.count()).group_by(
+                    Reservation.meetingroom_id
+                )
+            )
+            return rows.all()
+
+        room_load = Counter()
+        async with self.session(0, read=True) as session:
+            for rows in await self.gather(count_reservations, session):
+                room_load.update(dict(rows))
+            room_ids = await session.execute(select(MeetingRoom.id))
+            room_ids = room_ids.scalars().all()
+        shard_load = [0] * len(self.shards)
+        moves = []
+        for room_id in sorted(room_ids, key=lambda room: -room_load[room]):
+            target = shard_load.index(min(shard_load))
+            shard_load[target] += room_load[room_id]
+            source = self.shard_for_room(room_id)
+            if source != target:
+                moves.append((room_id, source, target))
+        return moves
+
+
+shard_router = ShardRouter(settings.reservation_shard_urls)
+
+
+async def main(args) -> None:
+    await shard_router.create_schema()
+    await shard_router.load_room_map()
+    dry_run = getattr(args, "dry_run", False)
+    if args.command == "move":
+        source = shard_router.shard_for_room(args.room_id)
+        moves = [(args.room_id, source, args.shard)]
+    else:
+        moves = await shard_router.plan_rebalance()
+    if not moves:
+        print("Переносить нечего")
+        return
+    for room_id, source, target in moves:
+        print(f"Комната {room_id}: шард {source} -> {target}")
+        if not dry_run:
+            moved = await shard_router.move_room(room_id, target)
+            print(f"  перенесено броней: {moved}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Перенос комнат между шардами броней"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="Перенести одну комнату")
+    move.add_argument("room_id", type=int)
+    move.add_argument("shard", type=int)
+    rebalance = commands.add_parser(
+        "rebalance", help="Выровнять число броней между шардами"
+    )
+    rebalance.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
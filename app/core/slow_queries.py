@@ -0,0 +1,256 @@
+# app/core/slow_queries.py
+"""
+Журнал медленных SQL-запросов.
+
+Запросы дольше settings.slow_query_threshold_ms попадают в журнал
+(logging) и в сводку по нормализованному тексту: сколько раз, сколько
+времени, с каких маршрутов и с какими типами параметров. Для части
+записей снимается EXPLAIN QUERY PLAN - в потоке и через отдельное
+соединение только на чтение, чтобы не занимать пул и цикл событий.
+Сводку отдаёт ручка /admin/slow_queries. Сводка живёт в памяти
+воркера, и с несколькими воркерами ручка видит только свою; записи в
+журнале пишут все воркеры.
+"""
+import asyncio
+import logging
+import random
+import re
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import event
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Маршрут, который выполняет запросы; задаётся зависимостью приложения
+current_route: ContextVar[Optional[str]] = ContextVar(
+    "current_route", default=None
+)
+
+# Списки плейсхолдеров в IN (?, ?, ?) сворачиваются в один
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+# Числа и строки, вписанные прямо в текст (text(), FTS)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+# Сколько маршрутов и форм параметров держать на запрос
+MAX_ROUTES = 5
+MAX_SHAPES = 5
+
+
+async def set_current_route(request: Request) -> None:
+    # Зависимость асинхронная: синхронную FastAPI вызвал бы в другом
+    # потоке, и значение не дошло бы до запросов ручки.
+    # APIRoute кладёт себя в scope при маршрутизации - берём шаблон пути
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    current_route.set(f"{request.method} {path}")
+
+
+def normalize_sql(statement: str) -> str:
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = WHITESPACE.sub(" ", statement).strip()
+    return PLACEHOLDER_LIST.sub("(?...)", statement)
+
+
+def get_parameter_shape(parameters, executemany: bool) -> str:
+    if executemany:
+        rows = list(parameters)
+        first = get_parameter_shape(rows[0], False) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(
+            f"{name}: {type(value).__name__}"
+            for name, value in parameters.items()
+        ) + "}"
+    return "(" + ", ".join(
+        type(value).__name__ for value in parameters or ()
+    ) + ")"
+
+
+def explain_query_plan(
+    database: str, statement: str, parameters
+) -> list[str]:
+    # У читающего движка путь уже записан как URI file:...
+    if database.startswith("file:"):
+        database = database[len("file:"):]
+    connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).fetchall()
+    finally:
+        connection.close()
+    # Строки плана: (id, parent, notused, detail); вложенность - отступом
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+    return plan
+
+
+class SlowQuery:
+    __slots__ = (
+        "sql",
+        "count",
+        "total_ms",
+        "max_ms",
+        "last_ms",
+        "last_seen",
+        "routes",
+        "shapes",
+        "plan",
+        "plan_at",
+        "explaining",
+    )
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.last_seen: Optional[datetime] = None
+        self.routes = Counter()
+        self.shapes = Counter()
+        self.plan: Optional[list[str]] = None
+        self.plan_at: Optional[datetime] = None
+        self.explaining = False
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2),
+            "max_ms": round(self.max_ms, 2),
+            "last_ms": round(self.last_ms, 2),
+            "last_seen": self.last_seen,
+            "routes": dict(self.routes.most_common(MAX_ROUTES)),
+            "parameter_shapes": dict(self.shapes.most_common(MAX_SHAPES)),
+            "plan": self.plan,
+            "plan_at": self.plan_at,
+        }
+
+
+class SlowQueryLog:
+    def __init__(
+        self, threshold_ms: float, explain_rate: float, max_statements: int
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.max_statements = max_statements
+        self.queries: OrderedDict = OrderedDict()
+
+    def watch(self, engine) -> None:
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", self.before_execute
+        )
+        event.listen(
+            engine.sync_engine, "after_cursor_execute", self.after_execute
+        )
+
+    @staticmethod
+    def before_execute(
+        connection, cursor, statement, parameters, context, executemany
+    ):
+        context.slow_query_started = time.perf_counter()
+
+    def after_execute(
+        self, connection, cursor, statement, parameters, context, executemany
+    ):
+        started = getattr(context, "slow_query_started", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        route = current_route.get() or "-"
+        shape = get_parameter_shape(parameters, executemany)
+        query = self.record(
+            normalize_sql(statement), duration_ms, route, shape
+        )
+        logger.warning(
+            "Медленный запрос %.1f мс (%s, параметры %s): %s",
+            duration_ms,
+            route,
+            shape,
+            query.sql,
+        )
+        database = connection.engine.url.database
+        if (
+            connection.dialect.name == "sqlite"
+            and database
+            and not executemany
+            and not query.explaining
+            and (query.plan is None or random.random() < self.explain_rate)
+        ):
+            self.schedule_explain(query, database, statement, parameters)
+
+    def record(
+        self, sql: str, duration_ms: float, route: str, shape: str
+    ) -> SlowQuery:
+        query = self.queries.get(sql)
+        if query is None:
+            query = self.queries[sql] = SlowQuery(sql)
+            # Вытесняем запросы, которые дольше всех не появлялись
+            while len(self.queries) > self.max_statements:
+                self.queries.popitem(last=False)
+        self.queries.move_to_end(sql)
+        query.count += 1
+        query.total_ms += duration_ms
+        query.max_ms = max(query.max_ms, duration_ms)
+        query.last_ms = duration_ms
+        query.last_seen = datetime.now()
+        query.routes[route] += 1
+        query.shapes[shape] += 1
+        return query
+
+    def schedule_explain(
+        self, query: SlowQuery, database: str, statement: str, parameters
+    ) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        query.explaining = True
+        future = loop.run_in_executor(
+            None, explain_query_plan, database, statement, parameters
+        )
+
+        def store_plan(future):
+            query.explaining = False
+            try:
+                query.plan = future.result()
+            except Exception as error:
+                query.plan = [f"Не удалось получить план: {error}"]
+            query.plan_at = datetime.now()
+
+        future.add_done_callback(store_plan)
+
+    def top(self, limit: int, order_by: str = "total_ms") -> list[dict]:
+        queries = sorted(
+            self.queries.values(),
+            key=lambda query: getattr(query, order_by),
+            reverse=True,
+        )
+        return [query.as_dict() for query in queries[:limit]]
+
+    def clear(self) -> None:
+        self.queries.clear()
+
+
+slow_query_log = SlowQueryLog(
+    settings.slow_query_threshold_ms or 0,
+    settings.slow_query_explain_rate,
+    settings.slow_query_max_statements,
+)
@@ -1,29 +1,80 @@
 # app/core/user.py
+import secrets
+import time
 from typing import Optional, Union
 
+import jwt
+
 from fastapi import Depends, Request
 from fastapi_users import (
     BaseUserManager,
     FastAPIUsers,
     IntegerIDMixin,
     InvalidPasswordException,
+    exceptions,
 )
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
     JWTStrategy,
 )
+from fastapi_users.jwt import JWT_ALGORITHM, decode_jwt, generate_jwt
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.capture import note_user
 from app.core.config import settings
-from app.core.db import get_async_session
+from app.core.db import (
+    AsyncSessionLocal,
+    get_async_read_session,
+    get_async_session,
+)
+from app.core.revocation import feed_links, token_revocations
 from app.models.user import User
 from app.schemas.user import UserCreate
-
-
-async def get_user_db(session: AsyncSession = Depends(get_async_session)):
-    yield SQLAlchemyUserDatabase(session, User)
+from app.services.notifications import notify_user_registered
+
+
+class ReadWriteUserDatabase(SQLAlchemyUserDatabase):
+    """
+    Поиск пользователей идёт через читающую сессию, чтобы проверка токена
+    в каждом запросе не занимала единственное пишущее соединение.
+    Перед изменением объект переносится в пишущую сессию через merge.
+    """
+
+    def __init__(self, session, read_session, user_table):
+        super().__init__(session, user_table)
+        self.read_session = read_session
+
+    async def _get_user(self, statement):
+        results = await self.read_session.execute(statement)
+        user = results.first()
+        if user is None:
+            return None
+        return user[0]
+
+    async def update(self, user, update_dict):
+        user = await self.session.merge(user)
+        if update_dict.get("is_active") is False and user.is_active:
+            # Деактивация отзывает все выданные токены в той же транзакции:
+            # после повторной активации придётся войти заново
+            await token_revocations.revoke_user(user.id, self.session)
+        elif update_dict.get("is_active") and not user.is_active:
+            # Ссылки на календарь снова работают - с новой версией
+            await feed_links.expire(user.id, self.session)
+        return await super().update(user, update_dict)
+
+    async def delete(self, user) -> None:
+        user = await self.session.merge(user)
+        await feed_links.expire(user.id, self.session)
+        await super().delete(user)
+
+
+async def get_user_db(
+    session: AsyncSession = Depends(get_async_session),
+    read_session: AsyncSession = Depends(get_async_read_session),
+):
+    yield ReadWriteUserDatabase(session, read_session, User)
 
 
 # Определяем транспорт. Передавать токен будем через заголовок
@@ -31,11 +82,132 @@ async def get_user_db(session: AsyncSession = Depends(get_async_session)):
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
 
+class RevocableJWTStrategy(JWTStrategy):
+    """
+    JWT с номером (jti) и временем выдачи (iat), которые можно отозвать:
+    выход отзывает токен, деактивация - все токены пользователя.
+    Отзывы проверяются по словарям в памяти, без запроса к БД.
+    """
+
+    async def read_token(self, token, user_manager):
+        await token_revocations.refresh()
+        user_id = get_user_id_from_token(token)
+        if user_id is None:
+            return None
+        try:
+            user = await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+        note_user(user)
+        return user
+
+    async def write_token(self, user: User) -> str:
+        data = {
+            "user_id": str(user.id),
+            "aud": self.token_audience,
+            "jti": secrets.token_hex(8),
+            "iat": int(time.time()),
+        }
+        return generate_jwt(
+            data,
+            self.encode_key,
+            self.lifetime_seconds,
+            algorithm=self.algorithm,
+        )
+
+    async def destroy_token(self, token: str, user: User) -> None:
+        data = decode_jwt(
+            token,
+            self.decode_key,
+            self.token_audience,
+            algorithms=[self.algorithm],
+        )
+        async with AsyncSessionLocal() as session:
+            await token_revocations.revoke_token(data, session)
+            await session.commit()
+
+
 # Хранить токен будем в виде JWT
 def get_jwt_strategy() -> JWTStrategy:
     # Для генерации токена, передаём секретный ключи
     # и срок действия токена в секундах
-    return JWTStrategy(secret=settings.secret_key, lifetime_seconds=3600)
+    return RevocableJWTStrategy(
+        secret=settings.secret_key,
+        lifetime_seconds=settings.jwt_lifetime_seconds,
+    )
+
+
+# Достаём id пользователя из токена без обращения к БД: нужно там, где
+# пользователя надо опознать раньше зависимостей (например, в middleware)
+def get_user_id_from_token(token: Optional[str]) -> Optional[int]:
+    if not token:
+        return None
+    strategy = get_jwt_strategy()
+    try:
+        data = decode_jwt(
+            token,
+            strategy.decode_key,
+            strategy.token_audience,
+            algorithms=[strategy.algorithm],
+        )
+        # Список отзывов может отставать на запрос: свежим его делает
+        # RevocableJWTStrategy.read_token
+        if token_revocations.is_revoked(data):
+            return None
+        return int(data["user_id"])
+    except (jwt.PyJWTError, KeyError, ValueError):
+        return None
+
+
+# Календарные приложения не умеют передавать заголовок Authorization,
+# поэтому личная лента открывается по ссылке с собственным бессрочным
+# токеном. Аудитория отличается от токенов входа, так что такой токен
+# не подходит для доступа к API. В токене - версия ссылок пользователя
+# (User.feed_version): новая ссылка увеличивает версию, и прежние
+# ссылки перестают работать
+FEED_TOKEN_AUDIENCE = ["gkb24:calendar-feed"]
+
+
+def generate_feed_token(user: User) -> str:
+    return generate_jwt(
+        {
+            "user_id": str(user.id),
+            "aud": FEED_TOKEN_AUDIENCE,
+            "iat": int(time.time()),
+            "ver": user.feed_version,
+        },
+        settings.secret_key,
+    )
+
+
+def read_feed_token(token: str) -> Optional[tuple[int, int]]:
+    """
+    (id пользователя, версия ссылок) из токена ленты или None. Отзыв
+    токенов пользователя (деактивация) действует и на ленты.
+    """
+    try:
+        data = decode_jwt(
+            token,
+            settings.secret_key,
+            FEED_TOKEN_AUDIENCE,
+            algorithms=[JWT_ALGORITHM],
+        )
+        if token_revocations.is_revoked(data):
+            return None
+        # Ссылки, выданные до появления версий, - версии 0
+        return int(data["user_id"]), int(data.get("ver", 0))
+    except (jwt.PyJWTError, KeyError, ValueError):
+        return None
+
+
+async def rotate_feed_version(user: User, session: AsyncSession) -> User:
+    """Увеличивает версию ссылок на календарь: прежние ссылки отзываются."""
+    user = await session.merge(user)
+    user.feed_version = User.feed_version + 1
+    await feed_links.expire(user.id, session)
+    await session.commit()
+    await session.refresh(user)
+    return user
 
 
 # Создаём объект бэкенда аутентификации с выбранными параметрами
@@ -63,8 +235,8 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     async def on_after_register(
         self, user: User, request: Optional[Request] = None
     ):
-        # Вместо print можно настроить отправку письма, например
-        print(f"Пользователь {user.email} зарегистрирован!")
+        # Письмо уходит фоновой задачей, не задерживая ответ
+        await notify_user_registered(user)
 
 
 # Корутина возвращающая объект класса UserManager
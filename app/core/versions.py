@@ -0,0 +1,158 @@
+# app/core/versions.py
+"""
+Номера версий данных для кэшей.
+
+Каждая запись в БД увеличивает версию затронутой области (например,
+("room", 5) или ("user", 12)). Кэш хранит результат вместе с версией,
+на которой он был построен, и считается актуальным, пока версия не
+изменилась. Кроме версий областей есть общее поколение - его
+увеличивают изменения, которые затрагивают сразу всё.
+
+Чтобы кэши не расходились между воркерами uvicorn, версии лежат в
+таблице dataversion основной БД и меняются в той же транзакции, что и
+данные. Перед тем как отдать версию, воркер спрашивает у SQLite
+PRAGMA data_version: число меняется, только если файл БД изменило
+другое соединение, и проверка не читает ни одной страницы. Если оно
+изменилось, дочитываются версии новее последней увиденной - по индексу.
+Проверка идёт синхронно через своё соединение: это микросекунды, а
+версия нужна кэшу прямо сейчас.
+
+Если основная БД не файл SQLite, версии живут только в памяти процесса.
+"""
+import math
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import is_sqlite_file
+from app.models import DataVersion
+
+ROOM = "room"
+USER = "user"
+# Строка таблицы с общим поколением
+GENERATION = ("*", "*")
+
+version_table = DataVersion.__table__
+
+
+class DataVersions:
+    def __init__(self, database: Optional[str], check_interval_ms: float):
+        """
+        database - путь к файлу SQLite с таблицей версий или None, если
+        версии хранятся только в памяти процесса.
+        """
+        self.database = database
+        self.check_interval = check_interval_ms / 1000
+        self.versions: dict[tuple[str, str], int] = {}
+        self.generation = 0
+        self.connection: Optional[sqlite3.Connection] = None
+        self.data_version: Optional[int] = None
+        # Наибольшая версия, прочитанная из таблицы
+        self.last_seen = 0
+        self.checked_at = -math.inf
+
+    def get(self, scope: str, key) -> tuple:
+        self.refresh()
+        return self.generation, self.versions.get((scope, str(key)), 0)
+
+    async def bump(self, session: AsyncSession, *keys: tuple) -> None:
+        """
+        Новые версии для областей keys - пар (scope, key) - в текущей
+        транзакции session, без коммита: версии станут видны другим
+        воркерам вместе с данными.
+        """
+        for scope, key in keys:
+            if key is None:
+                continue
+            key = str(key)
+            if self.database is None:
+                self._bump_local(scope, key)
+                continue
+            # Номер следующего изменения - из той же таблицы; UPDATE
+            # первым берёт блокировку записи, поэтому номера не совпадут
+            versions = version_table.alias()
+            next_version = select(
+                func.coalesce(func.max(versions.c.version), 0) + 1
+            ).scalar_subquery()
+            updated = await session.execute(
+                update(DataVersion)
+                .where(DataVersion.scope == scope, DataVersion.key == key)
+                .values(version=next_version)
+            )
+            if updated.rowcount == 0:
+                await session.execute(
+                    insert(DataVersion).from_select(
+                        ["scope", "key", "version"],
+                        select(
+                            literal(scope),
+                            literal(key),
+                            func.coalesce(func.max(DataVersion.version), 0)
+                            + 1,
+                        ),
+                    )
+                )
+
+    async def bump_all(self, session: AsyncSession) -> None:
+        await self.bump(session, GENERATION)
+
+    def refresh(self) -> None:
+        if self.database is None:
+            return
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        try:
+            if self.connection is None:
+                self.connection = sqlite3.connect(
+                    f"file:{self.database}?mode=ro",
+                    uri=True,
+                    check_same_thread=False,
+                )
+            (data_version,) = self.connection.execute(
+                "PRAGMA data_version"
+            ).fetchone()
+            if data_version != self.data_version:
+                rows = self.connection.execute(
+                    "SELECT scope, key, version FROM dataversion "
+                    "WHERE version > ?",
+                    (self.last_seen,),
+                ).fetchall()
+                for scope, key, version in rows:
+                    self.versions[scope, key] = version
+                    self.last_seen = max(self.last_seen, version)
+                self.generation = self.versions.get(GENERATION, 0)
+                self.data_version = data_version
+        except sqlite3.Error:
+            # Лучше ошибка, чем ответ из устаревшего кэша
+            self.close()
+            raise
+        self.checked_at = now
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.data_version = None
+
+    def _bump_local(self, scope: str, key: str) -> None:
+        self.versions[scope, key] = self.versions.get((scope, key), 0) + 1
+        if (scope, key) == GENERATION:
+            self.generation += 1
+
+
+def get_database_path(database_url: str) -> Optional[str]:
+    if not is_sqlite_file(database_url):
+        return None
+    return os.path.abspath(make_url(database_url).database)
+
+
+data_versions = DataVersions(
+    get_database_path(settings.database_url),
+    settings.data_version_check_interval_ms,
+)
@@ -0,0 +1,135 @@
+# app/core/warmup.py
+"""
+Прогрев приложения после старта.
+
+Хук startup делает только то, без чего нельзя принимать запросы, а
+прогрев идёт фоновой задачей: догружает отложенные модули, открывает
+соединения всех пулов, выполняет частые запросы (список комнат и
+расписание на ближайшие дни - это заполняет кэш скомпилированных
+запросов SQLAlchemy и страничный кэш файла БД) и строит схему OpenAPI.
+Пока прогрев не закончен, /ready отвечает 503, и балансировщик не
+отправляет воркеру трафик.
+"""
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import AsyncExitStack
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.db import AsyncReadSessionLocal, utc_now
+from app.core.shards import shard_router
+from app.crud.meeting_room import meeting_room_crud
+from app.crud.reservation import reservation_crud
+
+logger = logging.getLogger(__name__)
+
+# Модули, которые ручки импортируют при первом вызове (numpy)
+DEFERRED_IMPORTS = ("app.services.availability",)
+# За сколько дней вперёд читаем расписание комнат
+SCHEDULE_DAYS = 7
+# Пауза перед повтором, если прогреть не удалось (например, нет БД)
+RETRY_DELAY = 5
+
+
+async def import_deferred(app) -> None:
+    for module in DEFERRED_IMPORTS:
+        await asyncio.to_thread(importlib.import_module, module)
+
+
+async def open_pools(app) -> None:
+    engines = {
+        shard_engine
+        for shard in shard_router.shards
+        for shard_engine in (shard.engine, shard.read_engine)
+    }
+
+    async def fill(engine):
+        # Держим все соединения сразу, иначе пул отдаст одно и то же
+        size = getattr(engine.sync_engine.pool, "size", lambda: 1)()
+        async with AsyncExitStack() as stack:
+            for _ in range(size):
+                connection = await stack.enter_async_context(
+                    engine.connect()
+                )
+                await connection.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(fill(engine) for engine in engines))
+
+
+async def prime_queries(app) -> None:
+    now = utc_now()
+    async with AsyncReadSessionLocal() as session:
+        rooms = await meeting_room_crud.get_multi(session)
+        await reservation_crud.get_reservations_in_window(
+            [room.id for room in rooms],
+            now,
+            now + timedelta(days=SCHEDULE_DAYS),
+            session,
+        )
+
+
+async def build_openapi(app) -> None:
+    # Схема кэшируется в app.openapi_schema, первый /docs её не ждёт
+    await asyncio.to_thread(app.openapi)
+
+
+STEPS = (
+    ("imports", import_deferred),
+    ("pools", open_pools),
+    ("queries", prime_queries),
+    ("openapi", build_openapi),
+)
+
+
+class WarmUp:
+    def __init__(self):
+        self.ready = False
+        self.started: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.steps: dict[str, float] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self, app) -> None:
+        self.ready = False
+        self.started = time.perf_counter()
+        self.task = asyncio.create_task(self._run(app))
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "warmup_ms": self.duration_ms,
+            "steps_ms": self.steps,
+        }
+
+    async def _run(self, app) -> None:
+        while True:
+            try:
+                for name, step in STEPS:
+                    started = time.perf_counter()
+                    await step(app)
+                    self.steps[name] = round(
+                        (time.perf_counter() - started) * 1000, 2
+                    )
+                break
+            except Exception:
+                logger.exception(
+                    "Прогрев не удался, повтор через %s с", RETRY_DELAY
+                )
+                await asyncio.sleep(RETRY_DELAY)
+        self.duration_ms = round(
+            (time.perf_counter() - self.started) * 1000, 2
+        )
+        self.ready = True
+
+
+warm_up = WarmUp()
@@ -1,5 +1,5 @@
 # app/crud/base.py
-from typing import Optional
+from typing import Optional, Sequence
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,7 +16,15 @@ class CRUDBase:
         )
         return db_obj.scalars().first()
 
-    async def get_multi(self, session: AsyncSession):
+    async def get_multi(
+        self, session: AsyncSession, fields: Optional[Sequence[str]] = None
+    ):
+        if fields is not None:
+            # Только нужные столбцы - строки вместо ORM-объектов
+            rows = await session.execute(
+                select(*(getattr(self.model, name) for name in fields))
+            )
+            return rows.all()
         db_objs = await session.execute(select(self.model))
         return db_objs.scalars().all()
 
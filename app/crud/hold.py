@@ -0,0 +1,126 @@
+# app/crud/hold.py
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.booking_engine import BookingConflict, booking_engine
+from app.core.config import settings
+from app.core.db import utc_now
+from app.core.holds import (
+    HOLD_LIST,
+    HoldConflict,
+    HoldEntry,
+    HoldNotFound,
+    hold_registry,
+    to_entry,
+)
+from app.core.versions import data_versions
+from app.crud.base import CRUDBase
+from app.crud.reservation import reservation_crud
+from app.models import ReservationHold, User
+from app.schemas.reservation import ReservationRoomCreate
+
+
+class CRUDReservationHold(CRUDBase):
+    async def create(
+        self,
+        obj_in,
+        session: AsyncSession,
+        user: Optional[User] = None,
+    ):
+        now = utc_now()
+        # Первая запись транзакции берёт блокировку записи SQLite: до
+        # коммита никто не поставит удержание, и проверка ниже надёжна
+        await session.execute(
+            delete(ReservationHold).where(ReservationHold.expires_at <= now)
+        )
+        held = await session.execute(
+            select(ReservationHold).where(
+                ReservationHold.meetingroom_id == obj_in.meetingroom_id,
+                ReservationHold.from_reserve <= obj_in.to_reserve,
+                ReservationHold.to_reserve >= obj_in.from_reserve,
+                ReservationHold.user_id != user.id,
+            )
+        )
+        held = held.scalars().all()
+        if held:
+            await session.rollback()
+            raise HoldConflict([to_entry(hold) for hold in held])
+        await self._check_reservations(obj_in, session)
+        lifetime = timedelta(seconds=settings.reservation_hold_seconds)
+        db_obj = ReservationHold(
+            **obj_in.dict(), user_id=user.id, expires_at=now + lifetime
+        )
+        session.add(db_obj)
+        await data_versions.bump(session, HOLD_LIST)
+        await session.commit()
+        await session.refresh(db_obj)
+        hold_registry.put(db_obj)
+        return db_obj
+
+    async def claim(self, hold: HoldEntry, session: AsyncSession) -> None:
+        """
+        Удаляет удержание первой записью транзакции. Блокировка записи
+        держится до коммита, поэтому проверки после claim и бронь в
+        confirm выполняются без гонок.
+        """
+        await self._delete(hold, session)
+        # Бронь могли создать в обход удержания, пока оно ставилось
+        await self._check_reservations(hold, session)
+
+    async def confirm(
+        self,
+        hold: HoldEntry,
+        comment: Optional[str],
+        session: AsyncSession,
+        user: User,
+    ):
+        """Превращает удержание, снятое через claim, в бронь."""
+        reservation = await reservation_crud.create(
+            # Время проверено, когда ставили удержание
+            ReservationRoomCreate.construct(
+                meetingroom_id=hold.meetingroom_id,
+                from_reserve=hold.from_reserve,
+                to_reserve=hold.to_reserve,
+                comment=comment,
+            ),
+            session,
+            user,
+        )
+        if booking_engine.running:
+            # Бронь записал движок, удаление удержания коммитим сами
+            await session.commit()
+        hold_registry.discard(hold.id)
+        return reservation
+
+    async def remove(self, db_obj: HoldEntry, session: AsyncSession):
+        await self._delete(db_obj, session)
+        await session.commit()
+        hold_registry.discard(db_obj.id)
+        return db_obj
+
+    async def _delete(self, hold: HoldEntry, session: AsyncSession) -> None:
+        deleted = await session.execute(
+            delete(ReservationHold).where(ReservationHold.id == hold.id)
+        )
+        if deleted.rowcount == 0:
+            # Удержание уже сняли в другом запросе
+            await session.rollback()
+            raise HoldNotFound(hold.id)
+        await data_versions.bump(session, HOLD_LIST)
+
+    async def _check_reservations(self, interval, session: AsyncSession):
+        conflicts = await reservation_crud.get_reservations_at_the_same_time(
+            meetingroom_id=interval.meetingroom_id,
+            from_reserve=interval.from_reserve,
+            to_reserve=interval.to_reserve,
+            session=session,
+        )
+        if conflicts:
+            # Текст ошибки собирается сразу: откат сбросит поля броней
+            conflict = BookingConflict(conflicts)
+            await session.rollback()
+            raise conflict
+
+
+hold_crud = CRUDReservationHold(ReservationHold)
@@ -1,31 +1,158 @@
 # app/crud/meeting_room.py
-from typing import Optional
-from sqlalchemy import select
+import re
+from datetime import datetime
+from typing import Optional, Sequence
+from sqlalchemy import column, exists, literal_column, select, table, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.booking_engine import booking_engine
+from app.core.rooms import ROOM_LIST, RoomNameTaken, room_registry
+from app.core.shards import shard_router
+from app.core.versions import GENERATION, ROOM, data_versions
 from app.crud.base import CRUDBase
+from app.crud.quota import quota_crud
+from app.crud.reservation import room_session
 from app.models.meeting_room import MeetingRoom
+from app.models.reservation import Reservation
+
+# Виртуальная таблица FTS5, создаётся миграцией вместе с триггерами
+meetingroom_fts = table("meetingroom_fts", column("rowid"))
+# Совпадение в названии весит больше, чем в описании
+FTS_RANK = literal_column("bm25(meetingroom_fts, 10.0, 1.0)")
+
+
+def build_fts_query(search: str) -> Optional[str]:
+    """Каждое слово запроса ищем как префикс, слова объединяются по И."""
+    words = re.findall(r"\w+", search)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
 
 
 # Дополним CRUD класс, наследовав от CRUDBase
 class CRUDMeetingRoom(CRUDBase):
 
-    # Преобразуем функцию в методы класса
-    async def get_room_id_by_name(
-        # указываем параметр self, либо декоратор @staticmethod
+    async def search(
         self,
-        room_name: str,
+        search: str,
         session: AsyncSession,
-    ) -> Optional[int]:
-        # Получаем объект класса Result
-        db_room_id = await session.execute(
-            select(MeetingRoom.id).where(MeetingRoom.name == room_name)
+        limit: int,
+        offset: int = 0,
+        free_from: Optional[datetime] = None,
+        free_to: Optional[datetime] = None,
+    ) -> list[MeetingRoom]:
+        fts_query = build_fts_query(search)
+        if fts_query is None:
+            return []
+        select_stmt = (
+            select(MeetingRoom)
+            .join(meetingroom_fts, meetingroom_fts.c.rowid == MeetingRoom.id)
+            .where(
+                text("meetingroom_fts MATCH :fts_query").bindparams(
+                    fts_query=fts_query
+                )
+            )
+            .order_by(FTS_RANK, MeetingRoom.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        if (
+            free_from is not None
+            and free_to is not None
+            and shard_router.enabled
+        ):
+            # Брони не в основной БД: занятые комнаты собираем по шардам
+            busy_room_ids = await self.get_busy_room_ids(
+                free_from, free_to, session
+            )
+            select_stmt = select_stmt.where(
+                MeetingRoom.id.not_in(busy_room_ids)
+            )
+        elif free_from is not None and free_to is not None:
+            # Оставляем только комнаты без пересекающихся броней; условие
+            # то же, что и в проверке пересечений при бронировании
+            select_stmt = select_stmt.where(
+                ~exists().where(
+                    Reservation.meetingroom_id == MeetingRoom.id,
+                    Reservation.from_reserve <= free_to,
+                    Reservation.to_reserve >= free_from,
+                )
+            )
+        db_rooms = await session.execute(select_stmt)
+        return db_rooms.scalars().all()
+
+    @staticmethod
+    async def get_busy_room_ids(
+        free_from: datetime, free_to: datetime, session: AsyncSession
+    ) -> set[int]:
+        async def get_busy(shard_session):
+            busy = await shard_session.execute(
+                select(Reservation.meetingroom_id)
+                .where(
+                    Reservation.from_reserve <= free_to,
+                    Reservation.to_reserve >= free_from,
+                )
+                .distinct()
+            )
+            return busy.scalars().all()
+
+        shard_ids = await shard_router.gather(get_busy, session)
+        return {room_id for room_ids in shard_ids for room_id in room_ids}
+
+    async def create(self, obj_in, session: AsyncSession, user=None):
+        # Другие воркеры перечитают справочник комнат
+        await data_versions.bump(session, ROOM_LIST)
+        try:
+            db_obj = await super().create(obj_in, session, user)
+        except IntegrityError:
+            # Такое же название успел записать параллельный запрос
+            await session.rollback()
+            raise RoomNameTaken
+        if shard_router.enabled:
+            await shard_router.assign_room(db_obj.id, session)
+            await session.refresh(db_obj)
+        room_registry.put(db_obj)
+        return db_obj
+
+    async def update(self, db_obj, obj_in, session: AsyncSession):
+        # Название комнаты попадает в расписания её пользователей
+        await data_versions.bump(session, ROOM_LIST, GENERATION)
+        try:
+            db_obj = await super().update(db_obj, obj_in, session)
+        except IntegrityError:
+            await session.rollback()
+            raise RoomNameTaken
+        room_registry.put(db_obj)
+        return db_obj
+
+    async def remove(self, db_obj, session: AsyncSession):
+        room_id = db_obj.id
+        # Брони комнаты удаляются вместе с ней - снимаем их со счётчиков
+        # квот в той же транзакции, что и удаление комнаты
+        async with room_session(room_id, session) as shard_session:
+            rows = await shard_session.execute(
+                select(
+                    Reservation.user_id,
+                    Reservation.from_reserve,
+                    Reservation.to_reserve,
+                ).where(Reservation.meetingroom_id == room_id)
+            )
+            rows = rows.all()
+        await quota_crud.record_removed(rows, session)
+        # Вместе с комнатой каскадно удаляются её брони, а они могли быть
+        # в расписаниях любых пользователей
+        await data_versions.bump(
+            session, (ROOM, room_id), ROOM_LIST, GENERATION
         )
-        # Извлекаем из него конкретное значение
-        db_room_id = db_room_id.scalars().first()
-        return db_room_id
+        db_obj = await super().remove(db_obj, session)
+        room_registry.discard(room_id)
+        if shard_router.enabled:
+            await shard_router.forget_room(room_id, session)
+        if booking_engine.running:
+            await booking_engine.drop_room(room_id)
+        return db_obj
 
 
 # Объект CRUD наследуем уже не от CRUDBase, а от
-# CRUDMeetingRoom, чтобы был доступен дополнительный
-# метод get_room_id_by_name
+# CRUDMeetingRoom, чтобы были доступны поиск и обновление справочника
 meeting_room_crud = CRUDMeetingRoom(MeetingRoom)
@@ -0,0 +1,221 @@
+# app/crud/quota.py
+"""
+Счётчики для квот бронирования: сколько броней и секунд у пользователя
+в каждой неделе. Счётчики меняются в той же транзакции, что и брони,
+поэтому проверка квоты читает одну-две строки вместо суммы по всем
+броням пользователя.
+
+Пересчитать счётчики с нуля (например, после ручной правки броней):
+    python -m app.crud.quota rebuild
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import Integer, func, insert, select, type_coerce, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db import (
+    AsyncSessionLocal,
+    from_epoch_seconds,
+    to_epoch_seconds,
+)
+from app.core.shards import shard_router
+from app.crud.base import CRUDBase
+from app.models import QuotaUsage, Reservation
+
+WEEK_SECONDS = 7 * 24 * 60 * 60
+# 1 января 1970 - четверг, первый понедельник эпохи на 4 дня позже
+MONDAY_SECONDS = 4 * 24 * 60 * 60
+
+
+def week_start(moment: datetime) -> datetime:
+    seconds = to_epoch_seconds(moment) - MONDAY_SECONDS
+    return from_epoch_seconds(
+        seconds // WEEK_SECONDS * WEEK_SECONDS + MONDAY_SECONDS
+    )
+
+
+def duration_seconds(from_reserve: datetime, to_reserve: datetime) -> int:
+    # Так же, как в БД: целые секунды
+    return to_epoch_seconds(to_reserve) - to_epoch_seconds(from_reserve)
+
+
+def weekly_usage(
+    added: Iterable[tuple[datetime, datetime]] = (),
+    removed: Iterable[tuple[datetime, datetime]] = (),
+) -> dict[datetime, list[int]]:
+    """Изменение счётчиков по неделям: [броней, секунд]."""
+    usage = defaultdict(lambda: [0, 0])
+    for sign, intervals in ((1, added), (-1, removed)):
+        for from_reserve, to_reserve in intervals:
+            week = usage[week_start(from_reserve)]
+            week[0] += sign
+            week[1] += sign * duration_seconds(from_reserve, to_reserve)
+    return usage
+
+
+class CRUDQuota(CRUDBase):
+    async def record(
+        self,
+        user_id: Optional[int],
+        session: AsyncSession,
+        added: Iterable[tuple[datetime, datetime]] = (),
+        removed: Iterable[tuple[datetime, datetime]] = (),
+    ) -> None:
+        """
+        Меняет счётчики в текущей транзакции session, без коммита:
+        коммит делает тот, кто записывает сами брони.
+        """
+        if user_id is None:
+            return
+        for week, (count, seconds) in weekly_usage(added, removed).items():
+            if not count and not seconds:
+                continue
+            # UPDATE первым захватывает блокировку записи, поэтому строку
+            # недели не создадут два воркера сразу
+            updated = await session.execute(
+                update(QuotaUsage)
+                .where(QuotaUsage.user_id == user_id, QuotaUsage.week == week)
+                .values(
+                    reservations=QuotaUsage.reservations + count,
+                    seconds=QuotaUsage.seconds + seconds,
+                )
+            )
+            if updated.rowcount == 0:
+                session.add(
+                    QuotaUsage(
+                        user_id=user_id,
+                        week=week,
+                        reservations=count,
+                        seconds=seconds,
+                    )
+                )
+
+    async def record_removed(
+        self,
+        rows: Iterable[tuple[Optional[int], datetime, datetime]],
+        session: AsyncSession,
+    ) -> None:
+        """Снимает со счётчиков брони разных пользователей."""
+        by_user = defaultdict(list)
+        for user_id, from_reserve, to_reserve in rows:
+            by_user[user_id].append((from_reserve, to_reserve))
+        for user_id, intervals in by_user.items():
+            await self.record(user_id, session, removed=intervals)
+
+    async def get_week_seconds(
+        self, user_id: int, weeks: Sequence[datetime], session: AsyncSession
+    ) -> dict[datetime, int]:
+        rows = await session.execute(
+            select(QuotaUsage.week, QuotaUsage.seconds).where(
+                QuotaUsage.user_id == user_id, QuotaUsage.week.in_(weeks)
+            )
+        )
+        return dict(rows.all())
+
+    async def count_future(
+        self, user_id: int, now: datetime, session: AsyncSession
+    ) -> int:
+        """
+        Число ещё не начавшихся броней: следующие недели - из счётчиков,
+        остаток текущей недели - подсчётом по индексу (user_id,
+        from_reserve).
+        """
+        next_week = week_start(now) + timedelta(days=7)
+        later = await session.execute(
+            select(func.coalesce(func.sum(QuotaUsage.reservations), 0)).where(
+                QuotaUsage.user_id == user_id, QuotaUsage.week >= next_week
+            )
+        )
+
+        async def count_this_week(shard_session):
+            count = await shard_session.execute(
+                select(func.count())
+                .select_from(Reservation)
+                .where(
+                    Reservation.user_id == user_id,
+                    Reservation.from_reserve >= now,
+                    Reservation.from_reserve < next_week,
+                )
+            )
+            return count.scalar_one()
+
+        if shard_router.enabled:
+            counts = await shard_router.gather(count_this_week, session)
+        else:
+            counts = [await count_this_week(session)]
+        return later.scalar_one() + sum(counts)
+
+    async def rebuild(self, session: AsyncSession) -> int:
+        """
+        Пересчитывает все счётчики по таблицам броней. Брони, созданные
+        во время пересчёта в других шардах, могут не попасть в счётчики,
+        поэтому лучше запускать его, пока приложение остановлено.
+        """
+        from_seconds = type_coerce(Reservation.from_reserve, Integer)
+        to_seconds = type_coerce(Reservation.to_reserve, Integer)
+        # Номер недели от первого понедельника эпохи, деление целочисленное
+        week = ((from_seconds - MONDAY_SECONDS) / WEEK_SECONDS).label("week")
+
+        async def aggregate(shard_session):
+            rows = await shard_session.execute(
+                select(
+                    Reservation.user_id,
+                    week,
+                    func.count(),
+                    func.sum(to_seconds - from_seconds),
+                )
+                .where(Reservation.user_id.isnot(None))
+                .group_by(Reservation.user_id, week)
+            )
+            return rows.all()
+
+        if shard_router.enabled:
+            shard_rows = await shard_router.gather(aggregate, session)
+        else:
+            shard_rows = [await aggregate(session)]
+        usage = defaultdict(lambda: [0, 0])
+        for rows in shard_rows:
+            for user_id, week_number, count, seconds in rows:
+                item = usage[user_id, week_number]
+                item[0] += count
+                item[1] += seconds
+        await session.execute(QuotaUsage.__table__.delete())
+        if usage:
+            await session.execute(
+                insert(QuotaUsage),
+                [
+                    dict(
+                        user_id=user_id,
+                        week=from_epoch_seconds(
+                            week_number * WEEK_SECONDS + MONDAY_SECONDS
+                        ),
+                        reservations=count,
+                        seconds=seconds,
+                    )
+                    for (user_id, week_number), (count, seconds) in (
+                        usage.items()
+                    )
+                ],
+            )
+        await session.commit()
+        return len(usage)
+
+
+quota_crud = CRUDQuota(QuotaUsage)
+
+
+async def main(args) -> None:
+    async with AsyncSessionLocal() as session:
+        rows = await quota_crud.rebuild(session)
+    print(f"Счётчики квот пересчитаны, строк: {rows}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Счётчики квот бронирования")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="Пересчитать счётчики с нуля")
+    asyncio.run(main(parser.parse_args()))
@@ -1,15 +1,235 @@
 # app/crud/reservation.py
-from typing import Optional
+import heapq
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from itertools import islice
+from typing import AsyncIterator, NamedTuple, Optional, Sequence
 from datetime import datetime
-from sqlalchemy import and_, between, or_, select
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.booking_engine import booking_engine
+from app.core.db import utc_now
+from app.core.shards import shard_router
+from app.core.versions import ROOM, USER, data_versions
 from app.crud.base import CRUDBase
-from app.models import User, Reservation
-from sqlalchemy.orm import joinedload
+from app.crud.quota import quota_crud
+from app.models import MeetingRoom, User, Reservation
+
+from app.schemas.reservation import ReservationPeriod
+
+# Столбцы броней пользователя; имя комнаты добавляется отдельно
+USER_RESERVATION_COLUMNS = (
+    Reservation.id,
+    Reservation.meetingroom_id,
+    Reservation.user_id,
+    Reservation.from_reserve,
+    Reservation.to_reserve,
+    Reservation.comment,
+)
+
+
+def get_columns(fields: Optional[Sequence[str]]) -> list:
+    # Без списка полей выбираем ORM-объекты целиком
+    if fields is None:
+        return [Reservation]
+    return [getattr(Reservation, name) for name in fields]
+
+
+class UserReservation(NamedTuple):
+    # Бронь пользователя, собранная из нескольких шардов
+    id: int
+    meetingroom_id: int
+    user_id: Optional[int]
+    from_reserve: datetime
+    to_reserve: datetime
+    comment: Optional[str]
+    meeting_room_name: str
+
+
+async def bump_versions(
+    session: AsyncSession, room_id: int, user_id: Optional[int]
+) -> None:
+    # Вызывается до коммита: кэши расписаний комнаты и пользователя
+    # устаревают в той же транзакции, что и брони
+    await data_versions.bump(session, (ROOM, room_id), (USER, user_id))
+
+
+async def bump_batch_versions(
+    session: AsyncSession, items: Sequence[dict], user_id: int
+) -> None:
+    room_ids = sorted({item["meetingroom_id"] for item in items})
+    await data_versions.bump(
+        session, *((ROOM, room_id) for room_id in room_ids), (USER, user_id)
+    )
+
+
+@asynccontextmanager
+async def room_session(room_id: int, session: AsyncSession):
+    """
+    Сессия шарда, в котором лежат брони комнаты. Для основной БД
+    (и когда шардирования нет) это переданная сессия.
+    """
+    await shard_router.refresh()
+    shard = shard_router.shard_for_room(room_id)
+    if shard == 0:
+        yield session
+        return
+    async with shard_router.session(
+        shard, read=shard_router.is_read_session(session)
+    ) as shard_session:
+        yield shard_session
+
+
+def merge_by_start(shard_rows: list, limit: Optional[int]) -> list:
+    # Каждый шард уже отсортирован по (from_reserve, id)
+    merged = heapq.merge(
+        *shard_rows, key=lambda row: (row.from_reserve, row.id)
+    )
+    return list(islice(merged, limit))
+
+
+async def get_room_names(
+    room_ids: set, session: AsyncSession
+) -> dict[int, str]:
+    if not room_ids:
+        return {}
+    names = await session.execute(
+        select(MeetingRoom.id, MeetingRoom.name).where(
+            MeetingRoom.id.in_(room_ids)
+        )
+    )
+    return dict(names.all())
+
+
+async def with_room_names(rows: list, session: AsyncSession) -> list:
+    names = await get_room_names({row.meetingroom_id for row in rows}, session)
+    return [
+        UserReservation(*row, names[row.meetingroom_id])
+        for row in rows
+        if row.meetingroom_id in names
+    ]
 
-from app.schemas.reservation import ReservationWithRoomName
 
 class CRUDReservation(CRUDBase):
+    async def get(self, obj_id: int, session: AsyncSession):
+        if booking_engine.running:
+            return booking_engine.get(obj_id)
+        if not shard_router.enabled:
+            return await super().get(obj_id, session)
+        # Номера броней сквозные, поэтому бронь есть ровно в одном шарде
+        found = await shard_router.gather(
+            lambda shard_session: CRUDBase.get(self, obj_id, shard_session),
+            session,
+        )
+        return next((db_obj for db_obj in found if db_obj is not None), None)
+
+    async def get_multi(
+        self, session: AsyncSession, fields: Optional[Sequence[str]] = None
+    ):
+        if not shard_router.enabled:
+            return await super().get_multi(session, fields)
+        if fields is not None and "id" not in fields:
+            # Общий список шардов сортируется по id
+            fields = ["id", *fields]
+        shard_objs = await shard_router.gather(
+            lambda shard_session: CRUDBase.get_multi(
+                self, shard_session, fields
+            ),
+            session,
+        )
+        return sorted(
+            (db_obj for db_objs in shard_objs for db_obj in db_objs),
+            key=lambda db_obj: db_obj.id,
+        )
+
+    async def create(
+        self,
+        obj_in,
+        session: AsyncSession,
+        user: Optional[User] = None,
+    ):
+        if booking_engine.running:
+            # Версии кэшей движок увеличит сам после записи в таблицу
+            return await booking_engine.create(
+                obj_in.dict(), user.id if user is not None else None
+            )
+        user_id = user.id if user is not None else None
+        interval = (obj_in.from_reserve, obj_in.to_reserve)
+        if not shard_router.enabled:
+            # Счётчики квот и версии попадут в ту же транзакцию, что и бронь
+            await quota_crud.record(user_id, session, added=[interval])
+            await bump_versions(session, obj_in.meetingroom_id, user_id)
+            db_obj = await super().create(obj_in, session, user)
+        else:
+            [obj_id] = await shard_router.allocate_ids(1, session)
+            db_obj = Reservation(**obj_in.dict(), id=obj_id, user_id=user_id)
+            # Счётчики и версии лежат в основной БД и коммитятся после брони
+            await quota_crud.record(user_id, session, added=[interval])
+            await bump_versions(session, obj_in.meetingroom_id, user_id)
+            async with room_session(
+                db_obj.meetingroom_id, session
+            ) as shard_session:
+                shard_session.add(db_obj)
+                await shard_session.commit()
+                await shard_session.refresh(db_obj)
+                if shard_session is not session:
+                    await session.commit()
+        return db_obj
+
+    async def update(
+        self,
+        db_obj,
+        obj_in,
+        session: AsyncSession,
+    ):
+        if booking_engine.running:
+            return await booking_engine.update(
+                db_obj.id, obj_in.dict(exclude_unset=True)
+            )
+        changes = obj_in.dict(exclude_unset=True)
+        await quota_crud.record(
+            db_obj.user_id,
+            session,
+            added=[
+                (
+                    changes.get("from_reserve", db_obj.from_reserve),
+                    changes.get("to_reserve", db_obj.to_reserve),
+                )
+            ],
+            removed=[(db_obj.from_reserve, db_obj.to_reserve)],
+        )
+        await bump_versions(session, db_obj.meetingroom_id, db_obj.user_id)
+        async with room_session(
+            db_obj.meetingroom_id, session
+        ) as shard_session:
+            if shard_router.enabled:
+                # При шардировании get отдаёт объект из другой сессии
+                db_obj = await shard_session.merge(db_obj)
+            db_obj = await super().update(db_obj, obj_in, shard_session)
+            if shard_session is not session:
+                # Бронь в другом шарде - счётчики коммитим отдельно
+                await session.commit()
+        return db_obj
+
+    async def remove(self, db_obj, session: AsyncSession):
+        if booking_engine.running:
+            return await booking_engine.cancel(db_obj.id)
+        room_id, user_id = db_obj.meetingroom_id, db_obj.user_id
+        await quota_crud.record(
+            user_id,
+            session,
+            removed=[(db_obj.from_reserve, db_obj.to_reserve)],
+        )
+        await bump_versions(session, room_id, user_id)
+        async with room_session(room_id, session) as shard_session:
+            if shard_router.enabled:
+                db_obj = await shard_session.merge(db_obj)
+            db_obj = await super().remove(db_obj, shard_session)
+            if shard_session is not session:
+                await session.commit()
+        return db_obj
+
     async def get_reservations_at_the_same_time(
         self,
         # Через * обозначим что все дальнейшие параметры должны передаваться по
@@ -24,71 +244,365 @@ class CRUDReservation(CRUDBase):
         comment: Optional[str] = None,
         session: AsyncSession,
     ) -> list[Reservation]:
-
+        if booking_engine.running:
+            # Состояние движка свежее проекции в таблице
+            return booking_engine.conflicts(
+                meetingroom_id,
+                from_reserve,
+                to_reserve,
+                exclude_id=reservation_id,
+            )
+        # Интервалы пересекаются (касание тоже считается), если каждый
+        # начинается не позже конца другого. Время передаётся справа от
+        # столбца, чтобы параметр получил его тип и стал целым числом
         select_stmt = select(Reservation).where(
             Reservation.meetingroom_id == meetingroom_id,
-            or_(
-                between(
-                    from_reserve,
-                    Reservation.from_reserve,
-                    Reservation.to_reserve,
-                ),
-                between(
-                    to_reserve,
-                    Reservation.from_reserve,
-                    Reservation.to_reserve,
-                ),
-                and_(
-                    from_reserve <= Reservation.from_reserve,
-                    to_reserve >= Reservation.to_reserve,
-                ),
-            ),
+            Reservation.from_reserve <= to_reserve,
+            Reservation.to_reserve >= from_reserve,
         )
         # Если передан id бронирования, то проверим условие
         if reservation_id is not None:
             select_stmt = select_stmt.where(Reservation.id != reservation_id)
-        reservations = await session.execute(select_stmt)
-        reservations = reservations.scalars().all()
+        async with room_session(meetingroom_id, session) as shard_session:
+            reservations = await shard_session.execute(select_stmt)
+            reservations = reservations.scalars().all()
         return reservations
 
     async def get_future_reservations_for_room(
-        self, room_id: int, session: AsyncSession
+        self,
+        room_id: int,
+        session: AsyncSession,
+        fields: Optional[Sequence[str]] = None,
     ):
-        reservations = await session.execute(
-            # Получим все объекты Reservation
-            select(Reservation).where(
-                # где id равен запрашиваему room_id
-                Reservation.meetingroom_id == room_id,
-                #  И время окончания бронирования больше текущего времени
-                Reservation.to_reserve > datetime.now(),
+        async with room_session(room_id, session) as shard_session:
+            reservations = await shard_session.execute(
+                # Получим все объекты Reservation или только нужные столбцы
+                select(*get_columns(fields)).where(
+                    # где id равен запрашиваему room_id
+                    Reservation.meetingroom_id == room_id,
+                    #  И время окончания бронирования больше текущего времени
+                    Reservation.to_reserve > utc_now(),
+                )
             )
-        )
-        reservations = reservations.scalars().all()
+            if fields is not None:
+                return reservations.all()
+            reservations = reservations.scalars().all()
         return reservations
 
-    async def get_by_user(
-        self, session: AsyncSession, user: User
-    ) -> list[ReservationWithRoomName]:
-        reservations = await session.execute(
-            select(Reservation)
-            # Добавил тут join
-            .options(joinedload(Reservation.meeting_room))
-            .where(Reservation.user_id == user.id)
+    async def get_future_reservations_for_rooms(
+        self,
+        room_ids: Sequence[int],
+        session: AsyncSession,
+        from_time: Optional[datetime] = None,
+        to_time: Optional[datetime] = None,
+    ) -> dict[int, list[Reservation]]:
+        """
+        Будущие брони многих комнат одним запросом (по запросу на шард),
+        сгруппированные по комнатам в порядке room_ids. Если задано окно,
+        остаются только брони, которые с ним пересекаются.
+        """
+
+        async def get_future(shard_session, shard_room_ids):
+            select_stmt = (
+                select(Reservation)
+                .where(
+                    Reservation.meetingroom_id.in_(shard_room_ids),
+                    Reservation.to_reserve > utc_now(),
+                )
+                .order_by(Reservation.from_reserve, Reservation.id)
+            )
+            if from_time is not None:
+                select_stmt = select_stmt.where(
+                    Reservation.to_reserve >= from_time
+                )
+            if to_time is not None:
+                select_stmt = select_stmt.where(
+                    Reservation.from_reserve <= to_time
+                )
+            reservations = await shard_session.execute(select_stmt)
+            return reservations.scalars().all()
+
+        if shard_router.enabled:
+            await shard_router.refresh()
+            shard_rows = await shard_router.gather_groups(
+                shard_router.group_rooms(room_ids), get_future, session
+            )
+        else:
+            shard_rows = [await get_future(session, room_ids)]
+        schedule = {room_id: [] for room_id in room_ids}
+        for reservations in shard_rows:
+            for reservation in reservations:
+                schedule[reservation.meetingroom_id].append(reservation)
+        return schedule
+
+    async def get_reservations_in_window(
+        self,
+        room_ids: Sequence[int],
+        from_time: datetime,
+        to_time: datetime,
+        session: AsyncSession,
+    ) -> list[tuple]:
+        async def get_window(shard_session, shard_room_ids):
+            # Только нужные столбцы, без создания ORM-объектов
+            reservations = await shard_session.execute(
+                select(
+                    Reservation.meetingroom_id,
+                    Reservation.from_reserve,
+                    Reservation.to_reserve,
+                ).where(
+                    Reservation.meetingroom_id.in_(shard_room_ids),
+                    Reservation.from_reserve <= to_time,
+                    Reservation.to_reserve >= from_time,
+                )
+            )
+            return reservations.all()
+
+        if booking_engine.running:
+            return booking_engine.in_window(room_ids, from_time, to_time)
+        if not shard_router.enabled:
+            return await get_window(session, room_ids)
+        # Каждый шард опрашиваем только о своих комнатах
+        await shard_router.refresh()
+        groups = shard_router.group_rooms(room_ids)
+        shard_rows = await shard_router.gather_groups(
+            groups, get_window, session
         )
-        reservations = reservations.scalars().all()
-
-        return [
-            ReservationWithRoomName(
-                id=reservation.id,
-                meetingroom_id=reservation.meetingroom_id,
-                user_id=reservation.user_id,
-                from_reserve=reservation.from_reserve,
-                to_reserve=reservation.to_reserve,
-                meeting_room_name=reservation.meeting_room.name, # Добавляем имя комнаты
-                comment=reservation.comment
-            )
-            for reservation in reservations
+        return [row for rows in shard_rows for row in rows]
+
+    async def create_many(
+        self,
+        objs_in: list[dict],
+        session: AsyncSession,
+        user: User,
+    ) -> list[dict]:
+        if booking_engine.running:
+            reservations = await booking_engine.create_many(objs_in, user.id)
+            return [
+                dict(
+                    id=reservation.id,
+                    meetingroom_id=reservation.meetingroom_id,
+                    from_reserve=reservation.from_reserve,
+                    to_reserve=reservation.to_reserve,
+                )
+                for reservation in reservations
+            ]
+        if shard_router.enabled:
+            return await self._create_many_sharded(objs_in, session, user)
+        # Все брони пакета сохраняются одной транзакцией
+        db_objs = [
+            Reservation(**obj_in, user_id=user.id) for obj_in in objs_in
         ]
+        session.add_all(db_objs)
+        await quota_crud.record(
+            user.id,
+            session,
+            added=[
+                (item["from_reserve"], item["to_reserve"]) for item in objs_in
+            ],
+        )
+        await bump_batch_versions(session, objs_in, user.id)
+        # flush выдаёт id до коммита, пока атрибуты объектов не истекли
+        await session.flush()
+        result = [
+            dict(
+                id=db_obj.id,
+                meetingroom_id=db_obj.meetingroom_id,
+                from_reserve=db_obj.from_reserve,
+                to_reserve=db_obj.to_reserve,
+            )
+            for db_obj in db_objs
+        ]
+        await session.commit()
+        return result
+
+    async def _create_many_sharded(
+        self, objs_in: list[dict], session: AsyncSession, user: User
+    ) -> list[dict]:
+        # Номера выдаются заранее, и каждый шард пишется своей транзакцией
+        # параллельно с остальными
+        ids = await shard_router.allocate_ids(len(objs_in), session)
+        result = [
+            dict(obj_in, id=obj_id, user_id=user.id)
+            for obj_id, obj_in in zip(ids, objs_in)
+        ]
+        by_shard = defaultdict(list)
+        await shard_router.refresh()
+        for item in result:
+            shard = shard_router.shard_for_room(item["meetingroom_id"])
+            by_shard[shard].append(item)
+
+        async def insert_shard(shard_session, items):
+            shard_session.add_all(Reservation(**item) for item in items)
+            await shard_session.commit()
+
+        await quota_crud.record(
+            user.id,
+            session,
+            added=[
+                (item["from_reserve"], item["to_reserve"]) for item in result
+            ],
+        )
+        await bump_batch_versions(session, result, user.id)
+        await shard_router.gather_groups(by_shard, insert_shard, session)
+        await session.commit()
+        return result
+
+    async def stream_room_schedule(
+        self, room_id: int, since: datetime, session: AsyncSession
+    ) -> AsyncIterator[Row]:
+        # Строки читаются по мере отправки ответа, по индексу
+        # (meetingroom_id, from_reserve)
+        async with room_session(room_id, session) as shard_session:
+            reservations = await shard_session.stream(
+                select(
+                    Reservation.id,
+                    Reservation.from_reserve,
+                    Reservation.to_reserve,
+                )
+                .where(
+                    Reservation.meetingroom_id == room_id,
+                    Reservation.from_reserve >= since,
+                )
+                .order_by(Reservation.from_reserve)
+            )
+            async for reservation in reservations:
+                yield reservation
+
+    async def stream_user_schedule(
+        self, user_id: int, since: datetime, session: AsyncSession
+    ) -> AsyncIterator[Row]:
+        if shard_router.enabled:
+            # Брони пользователя разбросаны по шардам - собираем их целиком
+            # и сливаем по времени начала
+            reservations = await self._get_by_user_id(
+                session, user_id, from_time=since
+            )
+            for reservation in reservations:
+                yield reservation
+            return
+        # По индексу (user_id, from_reserve), имя комнаты - отдельным столбцом
+        reservations = await session.stream(
+            select(
+                Reservation.id,
+                Reservation.from_reserve,
+                Reservation.to_reserve,
+                Reservation.comment,
+                MeetingRoom.name.label("meeting_room_name"),
+            )
+            .join(MeetingRoom, MeetingRoom.id == Reservation.meetingroom_id)
+            .where(
+                Reservation.user_id == user_id,
+                Reservation.from_reserve >= since,
+            )
+            .order_by(Reservation.from_reserve)
+        )
+        async for reservation in reservations:
+            yield reservation
+
+    async def get_by_user(
+        self,
+        session: AsyncSession,
+        user: User,
+        from_time: Optional[datetime] = None,
+        to_time: Optional[datetime] = None,
+        period: Optional[ReservationPeriod] = None,
+        after: Optional[tuple[datetime, int]] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> list[Row]:
+        return await self._get_by_user_id(
+            session, user.id, from_time, to_time, period, after, limit, fields
+        )
+
+    async def _get_by_user_id(
+        self,
+        session: AsyncSession,
+        user_id: int,
+        from_time: Optional[datetime] = None,
+        to_time: Optional[datetime] = None,
+        period: Optional[ReservationPeriod] = None,
+        after: Optional[tuple[datetime, int]] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> list[Row]:
+        columns = USER_RESERVATION_COLUMNS
+        with_name = True
+        if fields is not None:
+            with_name = "meeting_room_name" in fields
+            columns = [
+                getattr(Reservation, name)
+                for name in fields
+                if name != "meeting_room_name"
+            ]
+            # Слиянию шардов нужен ключ (from_reserve, id), а имена
+            # комнат подставляются в полные строки
+            if shard_router.enabled and with_name:
+                columns = USER_RESERVATION_COLUMNS
+            elif shard_router.enabled:
+                columns = [Reservation.id, Reservation.from_reserve] + [
+                    column
+                    for column in columns
+                    if column.key not in ("id", "from_reserve")
+                ]
+        # Вместо загрузки целых объектов MeetingRoom через joinedload
+        # забираем только имя комнаты отдельным столбцом. Все условия
+        # ложатся на индекс (user_id, from_reserve), а сортировка по нему
+        # позволяет листать страницы по ключу (from_reserve, id) без OFFSET
+        select_stmt = (
+            select(*columns)
+            .select_from(Reservation)
+            .where(Reservation.user_id == user_id)
+            .order_by(Reservation.from_reserve, Reservation.id)
+        )
+        if from_time is not None:
+            select_stmt = select_stmt.where(
+                Reservation.from_reserve >= from_time
+            )
+        if to_time is not None:
+            select_stmt = select_stmt.where(Reservation.from_reserve < to_time)
+        if period == ReservationPeriod.upcoming:
+            select_stmt = select_stmt.where(
+                Reservation.from_reserve >= utc_now()
+            )
+        elif period == ReservationPeriod.past:
+            select_stmt = select_stmt.where(
+                Reservation.from_reserve < utc_now()
+            )
+        if after is not None:
+            # Типы столбцов нужны явно: иначе время уйдёт в запрос строкой
+            select_stmt = select_stmt.where(
+                tuple_(Reservation.from_reserve, Reservation.id)
+                > tuple_(
+                    *after,
+                    types=[Reservation.from_reserve.type, Reservation.id.type],
+                )
+            )
+        if limit is not None:
+            select_stmt = select_stmt.limit(limit)
+        if shard_router.enabled:
+            # Каждый шард отдаёт свою первую страницу, после слияния
+            # остаётся limit самых ранних; имена комнат - из основной БД
+            shard_rows = await shard_router.gather(
+                lambda shard_session: self._fetch_all(
+                    select_stmt, shard_session
+                ),
+                session,
+            )
+            rows = merge_by_start(shard_rows, limit)
+            if not with_name:
+                return rows
+            return await with_room_names(rows, session)
+        if with_name:
+            select_stmt = select_stmt.add_columns(
+                MeetingRoom.name.label("meeting_room_name")
+            ).join(MeetingRoom, MeetingRoom.id == Reservation.meetingroom_id)
+        reservations = await session.execute(select_stmt)
+        return reservations.all()
+
+    @staticmethod
+    async def _fetch_all(select_stmt, session: AsyncSession) -> list[Row]:
+        rows = await session.execute(select_stmt)
+        return rows.all()
 
 
 reservation_crud = CRUDReservation(Reservation)
@@ -0,0 +1,474 @@
+# app/launcher.py
+"""
+Запуск приложения в продакшене: несколько воркеров uvicorn на одном
+сокете.
+
+Мастер-процесс открывает сокет, импортирует приложение (и модули,
+которые ручки догружают при первом вызове) и только потом форкает
+воркеры - код и данные модулей у воркеров общие, пока не изменятся.
+Соединений с БД мастер не открывает: пулы наполняются уже в воркерах.
+
+У SQLite один писатель на файл, поэтому у воркера пишущий пул - одно
+соединение, как и без лаунчера, а читающий пул уменьшается так, чтобы
+читателей всех воркеров было около двух на ядро (если размер не задан
+явно через DATABASE_READ_POOL_SIZE). Файл очереди задач и журнал
+трафика у каждого воркера свои: у первого - как в настройках, у
+остальных - с номером воркера в имени.
+
+Корзины токенов и счётчик одновременных запросов контроля допуска живут
+в памяти воркера, поэтому лимиты RATE_LIMITS и MAX_IN_FLIGHT_REQUESTS
+делятся между воркерами поровну: вместе воркеры пропускают примерно
+столько, сколько задано. Соединение клиента обслуживает один воркер,
+так что клиенту с одним keep-alive соединением достаётся только доля
+его лимита.
+
+Часть состояния по-прежнему своя у каждого воркера: профили запросов
+(/admin/profiles), сводка медленных запросов (/admin/slow_queries),
+счётчики /admin/rate_limits и /admin/jobs - ручки показывают данные
+того воркера, который ответил. Поэтому по умолчанию воркер один, а
+число воркеров задаётся явно через --workers.
+
+Сигналы мастеру:
+    SIGTERM, SIGINT - воркеры перестают принимать соединения, доделывают
+        начатые запросы (не дольше --graceful-timeout секунд), фоновые
+        задачи и закрывают пулы соединений;
+    SIGHUP - мастер проверяет, что новый код импортируется, и
+        перезапускает себя с тем же сокетом, а затем по одному меняет
+        воркеры: старый доделывает запросы и выходит, на его место
+        стартует новый, и следующий старый останавливается только
+        после его прогрева. Пока воркер меняется, соединения ждут в
+        очереди сокета или уходят другим воркерам.
+Упавший воркер запускается заново.
+
+Запуск из корня проекта:
+    python -m app.launcher --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+from typing import Optional
+
+from app.core.config import settings
+
+# Логи uvicorn уже настроены, пишем в тот же логгер
+logger = logging.getLogger("uvicorn.error")
+
+# Читающих соединений SQLite на ядро, на все воркеры вместе
+READ_CONNECTIONS_PER_CORE = 2
+MIN_READ_POOL_SIZE = 2
+# Сколько воркер ждёт прогрева, прежде чем считаться готовым
+WARMUP_WAIT = 30
+# Запас сверх времени на запросы и фоновые задачи перед SIGKILL
+KILL_MARGIN = 5
+# Сколько ждать проверочного импорта нового кода при SIGHUP
+IMPORT_CHECK_TIMEOUT = 60
+
+
+def cpu_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def tune_read_pool(workers: int) -> None:
+    """Размер читающего пула воркера; вызывается до импорта app.core.db."""
+    if "database_read_pool_size" in settings.__fields_set__:
+        return
+    default = settings.__fields__["database_read_pool_size"].default
+    settings.database_read_pool_size = min(
+        default,
+        max(
+            MIN_READ_POOL_SIZE,
+            math.ceil(READ_CONNECTIONS_PER_CORE * cpu_count() / workers),
+        ),
+    )
+
+
+def split_admission_limits(workers: int) -> None:
+    """Лимиты контроля допуска одного воркера; вызывается до preload."""
+    settings.rate_limits = {
+        group: (rate / workers, math.ceil(capacity / workers))
+        for group, (rate, capacity) in settings.rate_limits.items()
+    }
+    settings.max_in_flight_requests = math.ceil(
+        settings.max_in_flight_requests / workers
+    )
+
+
+def preload():
+    import importlib
+
+    from app.core.warmup import DEFERRED_IMPORTS
+    from app.main import app
+
+    for module in DEFERRED_IMPORTS:
+        importlib.import_module(module)
+    return app
+
+
+def slot_path(path: str, slot: int) -> str:
+    if slot == 0:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-{slot}{extension}"
+
+
+def isolate_files(slot: int) -> None:
+    from app.core.capture import traffic_capture
+    from app.core.jobs import job_queue
+
+    if job_queue.store_path is not None:
+        job_queue.store_path = slot_path(job_queue.store_path, slot)
+    traffic_capture.path = slot_path(traffic_capture.path, slot)
+
+
+async def dispose_engines() -> None:
+    from app.core.shards import shard_router
+
+    engines = {
+        shard_engine
+        for shard in shard_router.shards
+        for shard_engine in (shard.engine, shard.read_engine)
+    }
+    await asyncio.gather(*(engine.dispose() for engine in engines))
+
+
+async def watch_worker(server, ready_fd: int, graceful_timeout: float):
+    """Сообщает мастеру о готовности и ограничивает время остановки."""
+    from app.core.warmup import warm_up
+
+    while not server.started and not server.should_exit:
+        await asyncio.sleep(0.05)
+    deadline = time.monotonic() + WARMUP_WAIT
+    while not (warm_up.ready or server.should_exit) and (
+        time.monotonic() < deadline
+    ):
+        await asyncio.sleep(0.05)
+    if not server.should_exit:
+        os.write(ready_fd, b"1")
+    os.close(ready_fd)
+    while not server.should_exit:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(graceful_timeout)
+    # Запросы так и не закончились: обрываем их, но фоновые задачи
+    # и журналы всё равно доделываем
+    logger.warning("Воркер %d не дождался конца запросов", os.getpid())
+    server.force_exit = True
+
+
+async def serve_worker(config, sock, ready_fd: int, graceful_timeout):
+    import uvicorn
+
+    server = uvicorn.Server(config)
+    watcher = asyncio.create_task(
+        watch_worker(server, ready_fd, graceful_timeout)
+    )
+    try:
+        await server.serve(sockets=[sock])
+        # uvicorn после force_exit пропускает shutdown приложения
+        if watcher.done() and server.started:
+            await server.lifespan.shutdown()
+    finally:
+        watcher.cancel()
+        await dispose_engines()
+
+
+def run_worker(config, sock, slot: int, ready_fd: int, graceful_timeout):
+    # Обработчики мастера воркеру не нужны; SIGHUP - только для мастера
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    isolate_files(slot)
+    config.setup_event_loop()
+    asyncio.run(serve_worker(config, sock, ready_fd, graceful_timeout))
+
+
+class Worker:
+    def __init__(self, slot: int, ready_fd: Optional[int]):
+        self.slot = slot
+        # Канал, по которому воркер сообщит о готовности
+        self.ready_fd = ready_fd
+        self.ready = ready_fd is None
+
+
+class Launcher:
+    def __init__(self, config, sock, args):
+        self.config = config
+        self.sock = sock
+        self.args = args
+        self.workers: dict[int, Worker] = {}
+        # Воркеры прошлого запуска: меняются на новые по одному
+        self.retire: deque[int] = deque()
+        self.stopping: Optional[int] = None
+        self.signals: deque[int] = deque()
+        self.booted = False
+        self.failed = False
+        self.shutdown_deadline: Optional[float] = None
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_write, False)
+
+    def adopt(self, pids: list[int]) -> None:
+        """Воркеры, унаследованные после SIGHUP, - в порядке слотов."""
+        for slot, pid in enumerate(pids):
+            self.workers[pid] = Worker(slot, None)
+            self.retire.append(pid)
+        self.booted = bool(pids)
+
+    def run(self) -> int:
+        signal.set_wakeup_fd(self.wakeup_write)
+        for signum in (
+            signal.SIGTERM,
+            signal.SIGINT,
+            signal.SIGHUP,
+            signal.SIGCHLD,
+        ):
+            signal.signal(signum, self.on_signal)
+        self.maintain()
+        while self.workers or self.shutdown_deadline is None:
+            self.wait()
+            self.reap()
+            while self.signals:
+                self.handle(self.signals.popleft())
+            if self.shutdown_deadline is not None:
+                if time.monotonic() > self.shutdown_deadline:
+                    self.kill(signal.SIGKILL)
+                continue
+            if self.failed and not self.workers:
+                logger.error("Не осталось ни одного воркера")
+                return 1
+            self.maintain()
+        self.sock.close()
+        return 1 if self.failed else 0
+
+    def on_signal(self, signum, frame) -> None:
+        self.signals.append(signum)
+
+    @property
+    def rolling(self) -> bool:
+        return bool(self.retire) or self.stopping in self.workers
+
+    def maintain(self) -> None:
+        if self.failed:
+            return
+        if self.rolling and (
+            self.stopping in self.workers
+            or not all(worker.ready for worker in self.workers.values())
+        ):
+            return
+        busy = {worker.slot for worker in self.workers.values()}
+        for slot in range(self.args.workers):
+            if slot not in busy:
+                self.spawn(slot)
+                # При замене воркеров новый стартует только один
+                if self.rolling:
+                    return
+        if self.retire:
+            self.stopping = self.retire.popleft()
+            os.kill(self.stopping, signal.SIGTERM)
+
+    def spawn(self, slot: int) -> None:
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.set_wakeup_fd(-1)
+                for fd in [
+                    ready_read,
+                    self.wakeup_read,
+                    self.wakeup_write,
+                ] + [worker.ready_fd for worker in self.workers.values()]:
+                    if fd is not None:
+                        os.close(fd)
+                run_worker(
+                    self.config,
+                    self.sock,
+                    slot,
+                    ready_write,
+                    self.args.graceful_timeout,
+                )
+                code = 0
+            except BaseException:
+                logger.exception("Воркер %d упал", os.getpid())
+            finally:
+                os._exit(code)
+        os.close(ready_write)
+        self.workers[pid] = Worker(slot, ready_read)
+
+    def wait(self) -> None:
+        fds = [self.wakeup_read] + [
+            worker.ready_fd
+            for worker in self.workers.values()
+            if worker.ready_fd is not None
+        ]
+        try:
+            readable, _, _ = select.select(fds, [], [], 1)
+        except InterruptedError:
+            return
+        for fd in readable:
+            if fd == self.wakeup_read:
+                os.read(fd, 512)
+                continue
+            for worker in self.workers.values():
+                if worker.ready_fd != fd:
+                    continue
+                # Пустое чтение - воркер вышел, не успев стартовать
+                worker.ready = bool(os.read(fd, 1))
+                os.close(fd)
+                worker.ready_fd = None
+                self.booted = self.booted or worker.ready
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+                worker.ready_fd = None
+            if self.shutdown_deadline is not None or pid == self.stopping:
+                continue
+            if pid in self.retire:
+                self.retire.remove(pid)
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if worker.ready:
+                logger.error("Воркер %d вышел с кодом %d", pid, code)
+                continue
+            # Новый код не стартует: повторять бессмысленно, а старые
+            # воркеры пусть работают, пока не придёт новый SIGHUP
+            logger.error("Воркер %d не смог стартовать", pid)
+            self.failed = True
+            self.retire.clear()
+            if not self.booted:
+                self.stop()
+
+    def handle(self, signum: int) -> None:
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stop()
+        elif signum == signal.SIGHUP and self.shutdown_deadline is None:
+            self.reload()
+
+    def stop(self) -> None:
+        if self.shutdown_deadline is not None:
+            return
+        logger.info("Останавливаем воркеры")
+        self.shutdown_deadline = (
+            time.monotonic()
+            + self.args.graceful_timeout
+            + settings.job_queue_drain_timeout
+            + KILL_MARGIN
+        )
+        self.kill(signal.SIGTERM)
+
+    def kill(self, signum: int) -> None:
+        for pid in self.workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reload(self) -> None:
+        if self.rolling:
+            logger.warning("Воркеры ещё меняются, SIGHUP пропущен")
+            return
+        logger.info("Проверяем, что новый код импортируется")
+        try:
+            subprocess.run(
+                [sys.executable, "-c", "import app.main"],
+                check=True,
+                timeout=IMPORT_CHECK_TIMEOUT,
+            )
+        except (subprocess.SubprocessError, OSError):
+            logger.exception("Новый код не импортируется, работаем дальше")
+            return
+        pids = sorted(self.workers, key=lambda pid: self.workers[pid].slot)
+        self.sock.set_inheritable(True)
+        argv = [sys.executable, "-m", "app.launcher"]
+        argv += argument_list(self.args, self.sock.fileno(), pids)
+        logger.info("Перезапуск мастера, воркеры поменяются по одному")
+        os.execv(sys.executable, argv)
+
+
+def argument_list(args, fd: int, pids: list[int]) -> list[str]:
+    return [
+        "--host",
+        args.host,
+        "--port",
+        str(args.port),
+        "--workers",
+        str(args.workers),
+        "--graceful-timeout",
+        str(args.graceful_timeout),
+        "--fd",
+        str(fd),
+        "--retire",
+        ",".join(map(str, pids)),
+    ]
+
+
+def main(args) -> int:
+    import uvicorn
+
+    tune_read_pool(args.workers)
+    split_admission_limits(args.workers)
+    config = uvicorn.Config(
+        preload(), host=args.host, port=args.port, lifespan="on"
+    )
+    config.load()
+    if args.fd is None:
+        sock = config.bind_socket()
+    else:
+        sock = socket.socket(fileno=args.fd)
+    launcher = Launcher(config, sock, args)
+    if args.retire:
+        launcher.adopt([int(pid) for pid in args.retire.split(",")])
+    logger.info(
+        "Мастер %d: воркеров %d, читающий пул воркера %d",
+        os.getpid(),
+        args.workers,
+        settings.database_read_pool_size,
+    )
+    return launcher.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Несколько воркеров uvicorn с плавным перезапуском"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=f"По умолчанию - один; ядер на машине: {cpu_count()}",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=30,
+        help="Сколько секунд доделывать начатые запросы при остановке",
+    )
+    # Для перезапуска по SIGHUP: унаследованный сокет и старые воркеры
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--retire", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.workers > 1 and settings.booking_engine_enabled:
+        parser.error("с движком бронирований нужен один воркер")
+    sys.exit(main(args))
@@ -1,17 +1,37 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.core.config import settings
 
 # Импортируем роутер
 # и корутину для создания первого суперюзера
 from app.api.routers import main_router
+from app.core.booking_engine import (
+    BookingConflict,
+    BookingNotFound,
+    booking_engine,
+)
+from app.core.capture import CaptureMiddleware, traffic_capture
+from app.core.compression import CompressionMiddleware
+from app.core.holds import HoldConflict, HoldNotFound, hold_registry
+from app.core.idempotency import IdempotencyMiddleware
 from app.core.init_db import create_first_superuser
+from app.core.jobs import job_queue
+from app.core.profiling import ProfilingMiddleware
+from app.core.rate_limit import AdmissionControlMiddleware
+from app.core.revocation import token_revocations
+from app.core.rooms import ROOM_NAME_TAKEN, RoomNameTaken, room_registry
+from app.core.shards import shard_router
+from app.core.slow_queries import set_current_route
+from app.core.warmup import warm_up
 
 app = FastAPI(
     title=settings.app_title,
     description=settings.app_description,
     version=settings.app_version,
     redoc_url=None,
+    # Маршрут запроса нужен журналу медленных SQL-запросов
+    dependencies=[Depends(set_current_route)],
 )
 
 # Для работы фронта
@@ -23,6 +43,14 @@ origins = [
     "http://127.0.0.1",  # Если запущено через Apache
 ]
 
+# Повторы запросов с Idempotency-Key отдаются из хранилища ответов
+app.add_middleware(IdempotencyMiddleware)
+
+# Контроль допуска добавляем раньше CORS, чтобы ответы 429/503
+# тоже получали CORS-заголовки и были видны фронту
+if settings.rate_limit_enabled:
+    app.add_middleware(AdmissionControlMiddleware)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,11 +60,93 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PATCH", "PUT", "DELETE"],  # Явное указание разрешенных методов
 )
 
+# Сжатие снаружи хранилища Idempotency-Key: там лежат несжатые ответы,
+# и повтор получает ту кодировку, которую принимает его клиент
+if settings.compression_enabled:
+    app.add_middleware(CompressionMiddleware)
+
+# Запись трафика снаружи допуска и сжатия: в запись попадают и 429/503,
+# а длительность - полная, как её видит клиент
+if settings.capture_enabled:
+    app.add_middleware(CaptureMiddleware)
+
+# Профилировщик снаружи всех остальных слоёв, чтобы в профиль попало всё
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware)
+
 
 # Подключаем роутер
 app.include_router(main_router)
 
 
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    # Для балансировщика: 503, пока не закончился прогрев
+    if not warm_up.ready:
+        return JSONResponse(status_code=503, content=warm_up.status())
+    return warm_up.status()
+
+
+# Движок бронирований перепроверяет пересечения в момент записи
+@app.exception_handler(BookingConflict)
+async def booking_conflict_handler(request: Request, exc: BookingConflict):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.exception_handler(BookingNotFound)
+async def booking_not_found_handler(request: Request, exc: BookingNotFound):
+    return JSONResponse(
+        status_code=404, content={"detail": "Бронь не найдена!"}
+    )
+
+
+# Удержание поставили, пока шли проверки, или уже сняли
+@app.exception_handler(HoldConflict)
+async def hold_conflict_handler(request: Request, exc: HoldConflict):
+    return JSONResponse(status_code=422, content={"detail": str(exc.holds)})
+
+
+@app.exception_handler(HoldNotFound)
+async def hold_not_found_handler(request: Request, exc: HoldNotFound):
+    return JSONResponse(
+        status_code=404, content={"detail": "Удержание не найдено или истекло"}
+    )
+
+
+# Комнату с тем же названием записали между проверкой и коммитом
+@app.exception_handler(RoomNameTaken)
+async def room_name_taken_handler(request: Request, exc: RoomNameTaken):
+    return JSONResponse(status_code=422, content={"detail": ROOM_NAME_TAKEN})
+
+
 @app.on_event("startup")
 async def startup():
+    # Очередь задач раньше всего: регистрация суперюзера уже ставит задачу
+    await job_queue.start()
+    if settings.capture_enabled:
+        traffic_capture.start()
     await create_first_superuser()
+    # Проверки комнат при записи броней идут по справочнику в памяти
+    await room_registry.load()
+    # Отозванные токены проверяются по словарям в памяти
+    await token_revocations.load()
+    # Удержания комнат тоже проверяются по памяти
+    await hold_registry.load()
+    if shard_router.enabled:
+        await shard_router.create_schema()
+        await shard_router.load_room_map()
+    if settings.booking_engine_enabled:
+        await booking_engine.start()
+    # Остальное догревается в фоне, готовность показывает /ready
+    warm_up.start(app)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warm_up.stop()
+    # Доделываем фоновые задачи, пока ещё работает всё остальное
+    await job_queue.stop()
+    # Дописываем журнал и проекцию, сохраняем снимок для быстрого старта
+    await booking_engine.stop()
+    # Дописываем в файл строки, оставшиеся в очереди
+    traffic_capture.stop()
@@ -1,4 +1,10 @@
 # app/models/__init__.py
+from .hold import ReservationHold
+from .idempotency import IdempotencyKey
 from .meeting_room import MeetingRoom
+from .quota import QuotaUsage
 from .reservation import Reservation
+from .revocation import RevokedToken
+from .shard import IdSequence, RoomShard
 from .user import User
+from .version import DataVersion
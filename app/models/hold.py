@@ -0,0 +1,16 @@
+# app/models/hold.py
+from sqlalchemy import Column, ForeignKey, Integer
+from app.core.db import Base, EpochSeconds
+
+
+class ReservationHold(Base):
+    # Временное удержание интервала комнаты: пока не истекло, другие
+    # не могут его забронировать, а владелец может подтвердить бронь.
+    # Истёкшие строки удаляются при следующей записи удержаний
+    meetingroom_id = Column(
+        Integer, ForeignKey("meetingroom.id"), nullable=False
+    )
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    from_reserve = Column(EpochSeconds, nullable=False)
+    to_reserve = Column(EpochSeconds, nullable=False)
+    expires_at = Column(EpochSeconds, nullable=False, index=True)
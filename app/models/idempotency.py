@@ -0,0 +1,17 @@
+# app/models/idempotency.py
+from sqlalchemy import Boolean, Column, Integer, LargeBinary, String
+from app.core.db import Base
+
+
+class IdempotencyKey(Base):
+    # Ответы по Idempotency-Key, общие для всех воркеров. Строку без
+    # status занимает запрос, который выполняется прямо сейчас; unique
+    # на key не даёт двум воркерам выполнить его дважды
+    key = Column(String(64), unique=True, nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(Integer)
+    content_type = Column(String(255))
+    compressed = Column(Boolean)
+    body = Column(LargeBinary)
+    # Секунды от эпохи; истёкшие строки удаляются при следующей записи
+    expires_at = Column(Integer, nullable=False, index=True)
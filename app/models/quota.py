@@ -0,0 +1,15 @@
+# app/models/quota.py
+from sqlalchemy import Column, ForeignKey, Integer, UniqueConstraint
+from app.core.db import Base, EpochSeconds
+
+
+class QuotaUsage(Base):
+    # Счётчики броней пользователя за неделю, которые обновляются вместе
+    # с самими бронями. Бронь учитывается в неделе, в которую начинается
+    __table_args__ = (UniqueConstraint("user_id", "week"),)
+
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    # Понедельник 00:00 UTC
+    week = Column(EpochSeconds, nullable=False)
+    reservations = Column(Integer, nullable=False, default=0)
+    seconds = Column(Integer, nullable=False, default=0)
@@ -1,11 +1,33 @@
 # app/models/reservation.py
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
-from app.core.db import Base
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+)
+from app.core.db import Base, EpochSeconds
 from sqlalchemy.orm import relationship
 
 class Reservation(Base):
-    from_reserve = Column(DateTime)
-    to_reserve = Column(DateTime)
+    __table_args__ = (
+        # Для выборки "моих бронирований" по пользователю в порядке времени
+        Index(
+            "ix_reservation_user_id_from_reserve", "user_id", "from_reserve"
+        ),
+        # Для расписания комнаты и проверки пересечений
+        Index(
+            "ix_reservation_meetingroom_id_from_reserve",
+            "meetingroom_id",
+            "from_reserve",
+        ),
+    )
+
+    # Целые секунды UTC: ключи индексов короче ISO-строк и сравниваются
+    # как числа
+    from_reserve = Column(EpochSeconds)
+    to_reserve = Column(EpochSeconds)
     # Столбец с внешним ключом: ссылка на таблицу meetingroom
     meetingroom_id = Column(Integer, ForeignKey("meetingroom.id"))
     # Поле с указанием внешнего ключа пользователей
@@ -0,0 +1,14 @@
+# app/models/revocation.py
+from sqlalchemy import Column, ForeignKey, Integer, String
+from app.core.db import Base
+
+
+class RevokedToken(Base):
+    # Отозванные токены входа. Строка с jti отзывает один токен, без
+    # jti - все токены пользователя, выданные раньше issued_before.
+    # После expires_at все такие токены истекли сами, и строка не нужна
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    jti = Column(String(32), unique=True)
+    # Моменты времени - секунды от эпохи, как iat и exp в самих токенах
+    issued_before = Column(Integer)
+    expires_at = Column(Integer, nullable=False, index=True)
@@ -0,0 +1,18 @@
+# app/models/shard.py
+from sqlalchemy import Column, ForeignKey, Integer, String
+from app.core.db import Base
+
+
+class RoomShard(Base):
+    # В каком файле БД лежат брони комнаты. Комнаты без записи - в основной
+    meetingroom_id = Column(
+        Integer, ForeignKey("meetingroom.id"), unique=True, nullable=False
+    )
+    shard = Column(Integer, nullable=False)
+
+
+class IdSequence(Base):
+    # Сквозная нумерация броней для всех шардов: воркеры забирают отсюда
+    # сразу блок номеров и раздают их из памяти
+    name = Column(String(50), unique=True, nullable=False)
+    next_value = Column(Integer, nullable=False)
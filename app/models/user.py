@@ -1,9 +1,14 @@
 # app/models/user.py
 from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
-from sqlalchemy import Column, DateTime, String
+from sqlalchemy import Column, DateTime, Integer, String
 from app.core.db import Base
 
 
 class User(SQLAlchemyBaseUserTable[int], Base):
     first_name = Column(String, nullable=False)
     birthdate = Column(DateTime)
+    # Версия личных ссылок на календарь: ссылка с другой версией
+    # недействительна, поэтому увеличение отзывает все выданные ссылки
+    feed_version = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
@@ -0,0 +1,14 @@
+# app/models/version.py
+from sqlalchemy import Column, Integer, String, UniqueConstraint
+from app.core.db import Base
+
+
+class DataVersion(Base):
+    # Версии данных для кэшей всех воркеров: запись меняет версию
+    # затронутой области в той же транзакции, что и сами данные
+    __table_args__ = (UniqueConstraint("scope", "key"),)
+
+    scope = Column(String(16), nullable=False)
+    key = Column(String(64), nullable=False)
+    # Сквозной номер изменения: больше, чем у всех прежних изменений
+    version = Column(Integer, nullable=False, index=True)
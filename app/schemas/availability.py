@@ -0,0 +1,18 @@
+# app/schemas/availability.py
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+
+class RoomAvailability(BaseModel):
+    meetingroom_id: int
+    # Строка вида "0110...": символ на каждый слот из списка slots
+    free: str = Field(
+        ...,
+        example="0011110",
+        description="1 - комната свободна в слоте, 0 - занята",
+    )
+
+
+class AvailabilityGrid(BaseModel):
+    slots: list[datetime]
+    rooms: list[RoomAvailability]
@@ -1,19 +1,39 @@
 # app/schemas/reservation.py
+from enum import Enum
 from typing import Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Extra, root_validator, validator, Field
+from pydantic.datetime_parse import parse_datetime
+from app.core.db import to_naive_utc, utc_now
 
 
-FROM_TIME = (datetime.now() + timedelta(minutes=10)).isoformat(
-    timespec="minutes"
-)
-TO_TIME = (datetime.now() + timedelta(hours=10)).isoformat(timespec="minutes")
+FROM_TIME = (utc_now() + timedelta(minutes=10)).isoformat(timespec="minutes")
+TO_TIME = (utc_now() + timedelta(hours=10)).isoformat(timespec="minutes")
+
+
+class UTCDateTime(datetime):
+    """
+    Время в запросе. Приводится к наивному datetime в UTC, как в БД:
+    время с часовым поясом переводится в UTC, без пояса - считается UTC.
+    """
+
+    @classmethod
+    def __get_validators__(cls):
+        yield parse_datetime
+        yield to_naive_utc
+
+
+class ReservationPeriod(str, Enum):
+    # Ещё не начавшиеся бронирования
+    upcoming = "upcoming"
+    # Уже начавшиеся бронирования
+    past = "past"
 
 
 # Базовый класс, от которого будем наследоваться
 class ReservationRoomBase(BaseModel):
-    from_reserve: datetime = Field(..., example=FROM_TIME)
-    to_reserve: datetime = Field(..., example=TO_TIME)
+    from_reserve: UTCDateTime = Field(..., example=FROM_TIME)
+    to_reserve: UTCDateTime = Field(..., example=TO_TIME)
 
     class Config:
         # Запрещает передавать параметры, которые не будут описаны в схеме
@@ -23,7 +43,7 @@ class ReservationRoomBase(BaseModel):
 class ReservationRoomUpdate(ReservationRoomBase):
     @validator("from_reserve")
     def check_from_reserve_later_than_now(cls, value):
-        if value <= datetime.now():
+        if value <= utc_now():
             raise ValueError(
                 "Время начала бронирования не "
                 "может быть меньше текущего времени"
@@ -61,6 +81,11 @@ class ReservationRoomDB(ReservationRoomBase):
         orm_mode = True
 
 
+class RoomReservations(BaseModel):
+    meetingroom_id: int
+    reservations: list[ReservationRoomDB]
+
+
 class ReservationWithRoomName(ReservationRoomBase):
     id: int
     meetingroom_id: int
@@ -72,4 +97,31 @@ class ReservationWithRoomName(ReservationRoomBase):
     meeting_room_name: str
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+# Удержание интервала: те же проверки времени, что и у брони
+class ReservationHoldCreate(ReservationRoomUpdate):
+    meetingroom_id: int
+
+
+class ReservationHoldConfirm(BaseModel):
+    comment: Optional[str] = None
+
+    class Config:
+        extra = Extra.forbid
+
+
+class ReservationHoldDB(ReservationRoomBase):
+    id: int
+    meetingroom_id: int
+    user_id: int
+    # Когда удержание истечёт, если его не подтвердить
+    expires_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class CalendarFeedLink(BaseModel):
+    url: str
@@ -0,0 +1,53 @@
+# app/schemas/schedule.py
+from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Extra, Field, root_validator
+from app.schemas.reservation import UTCDateTime
+
+# Сколько заявок можно передать в одном пакете
+MAX_BATCH_SIZE = 5000
+
+
+class FlexibleReservationRequest(BaseModel):
+    duration: int = Field(
+        ..., ge=1, le=24 * 60, description="Длительность встречи в минутах"
+    )
+    window_start: UTCDateTime
+    window_end: UTCDateTime
+    # Если не указано - подойдёт любая комната
+    room_ids: Optional[list[int]] = Field(None, min_items=1)
+    comment: Optional[str] = None
+
+    class Config:
+        extra = Extra.forbid
+
+    @root_validator(skip_on_failure=True)
+    def check_window_fits_duration(cls, values):
+        length = values["window_end"] - values["window_start"]
+        if length.total_seconds() < values["duration"] * 60:
+            raise ValueError("Встреча не помещается в указанное окно")
+        return values
+
+
+class BatchScheduleRequest(BaseModel):
+    requests: list[FlexibleReservationRequest] = Field(
+        ..., min_items=1, max_items=MAX_BATCH_SIZE
+    )
+    # Начала встреч выравниваются по сетке с этим шагом в минутах
+    granularity: int = Field(5, ge=1, le=60)
+    # Если хотя бы одну заявку разместить не удалось - не бронировать ничего
+    all_or_nothing: bool = False
+
+
+class ScheduledReservation(BaseModel):
+    request_index: int
+    id: int
+    meetingroom_id: int
+    from_reserve: datetime
+    to_reserve: datetime
+
+
+class BatchScheduleResult(BaseModel):
+    assigned: list[ScheduledReservation]
+    # Индексы заявок из запроса, для которых не нашлось места
+    unassigned: list[int]
@@ -0,0 +1,79 @@
+# app/services/ical.py
+"""Отрисовка расписаний в формате iCalendar (RFC 5545)."""
+from datetime import datetime
+from typing import Optional
+
+PRODID = "-//gkb24//Reservation Service//RU"
+UID_DOMAIN = "gkb24-reservation"
+CALENDAR_FOOTER = "END:VCALENDAR\r\n"
+
+
+def escape_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """Строки длиннее 75 байт переносятся, продолжение начинается с пробела."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Не режем многобайтовый символ UTF-8 посередине
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        # У строк продолжения первый байт занят пробелом
+        limit = 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_datetime(value: datetime) -> str:
+    # Время в БД хранится в UTC (наивным datetime), поэтому отдаём его
+    # с суффиксом Z - календарь переведёт его в пояс того, кто смотрит
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_calendar_header(name: str) -> str:
+    return "".join(
+        fold_line(line)
+        for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{escape_text(name)}",
+        )
+    )
+
+
+def render_event(
+    reservation_id: int,
+    from_reserve: datetime,
+    to_reserve: datetime,
+    summary: str,
+    stamp: datetime,
+    description: Optional[str] = None,
+) -> str:
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:reservation-{reservation_id}@{UID_DOMAIN}",
+        f"DTSTAMP:{format_datetime(stamp)}",
+        f"DTSTART:{format_datetime(from_reserve)}",
+        f"DTEND:{format_datetime(to_reserve)}",
+        f"SUMMARY:{escape_text(summary)}",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
@@ -0,0 +1,85 @@
+# app/services/notifications.py
+"""
+Побочные действия после регистрации и изменений броней. Выполняются
+очередью фоновых задач, после ответа клиенту; каждое действие - своя
+задача, чтобы повтор одного не повторял другие.
+"""
+import logging
+from typing import Optional
+
+from app.core.jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+USER_REGISTERED = "user_registered"
+BOOKING_CONFIRMATION = "booking_confirmation"
+CALENDAR_PUSH = "calendar_push"
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+
+@job_queue.register(USER_REGISTERED)
+async def send_welcome_email(payload: dict) -> None:
+    # Вместо записи в лог можно настроить отправку письма
+    logger.info("Пользователь %s зарегистрирован!", payload["email"])
+
+
+@job_queue.register(BOOKING_CONFIRMATION)
+async def send_booking_confirmation(payload: dict) -> None:
+    logger.info(
+        "Бронь %s (%s): комната %s, %s - %s, пользователь %s",
+        payload["id"],
+        payload["action"],
+        payload["meetingroom_id"],
+        payload["from_reserve"],
+        payload["to_reserve"],
+        payload["user_id"],
+    )
+
+
+@job_queue.register(CALENDAR_PUSH)
+async def push_calendar_update(payload: dict) -> None:
+    # Календарные ленты и так строятся по текущим броням; здесь место
+    # для уведомления внешних календарей об изменении
+    logger.info(
+        "Календарь комнаты %s: бронь %s %s",
+        payload["meetingroom_id"],
+        payload["id"],
+        payload["action"],
+    )
+
+
+def get_reservation_payload(
+    reservation, action: str, user_id: Optional[int] = None
+) -> dict:
+    # Бронь приходит моделью, записью движка бронирований или словарём
+    if isinstance(reservation, dict):
+        get = reservation.get
+    else:
+        def get(name):
+            return getattr(reservation, name, None)
+    return {
+        "action": action,
+        "id": get("id"),
+        "meetingroom_id": get("meetingroom_id"),
+        "from_reserve": get("from_reserve").isoformat(),
+        "to_reserve": get("to_reserve").isoformat(),
+        "user_id": get("user_id") or user_id,
+    }
+
+
+async def notify_user_registered(user) -> None:
+    await job_queue.enqueue(
+        USER_REGISTERED, {"user_id": user.id, "email": user.email}
+    )
+
+
+async def notify_reservations_changed(
+    reservations, action: str, user_id: Optional[int] = None
+) -> None:
+    for reservation in reservations:
+        payload = get_reservation_payload(reservation, action, user_id)
+        await job_queue.enqueue(BOOKING_CONFIRMATION, payload)
+        await job_queue.enqueue(CALENDAR_PUSH, payload)
@@ -0,0 +1,230 @@
+# app/services/scheduler.py
+"""
+Жадное распределение пакета гибких заявок по переговоркам.
+
+Заявка - это "любая комната (или одна из списка) на duration в окне".
+Заявки обрабатываются по возрастанию начала окна, и каждая достаётся
+комнате, где её можно начать раньше всего. Внутри комнаты промежуток
+ищется от начала окна бинарным поиском по уже занятым интервалам - как
+существующим броням, так и назначенным в этом пакете, - поэтому
+свободные промежутки перед уже назначенными встречами не теряются.
+Чтобы не искать во всех комнатах, они лежат в куче по первому моменту,
+с которого в комнате помещается самая короткая встреча пакета: раньше
+него встречу в комнате не начать, а с ростом начала окна и расписания
+он только растёт. Комнаты достаются из кучи, пока этот момент раньше
+лучшего найденного начала, и поиск в комнате продолжается с него, а не
+перебирает заново промежутки, в которые ничего не помещается.
+
+Все времена - целые секунды от эпохи. Как и при обычном бронировании,
+касание интервалов считается пересечением, поэтому новая бронь начинается
+строго позже окончания предыдущей (на ближайшей отметке сетки granularity).
+"""
+import heapq
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Sequence
+
+from app.core.db import from_epoch_seconds, to_epoch_seconds
+
+
+class FlexibleRequest(NamedTuple):
+    index: int
+    duration: int
+    window_start: int
+    window_end: int
+    room_ids: Optional[Sequence[int]]
+
+
+class Assignment(NamedTuple):
+    index: int
+    room_id: int
+    start: int
+    end: int
+
+
+class RoomTimeline:
+    """Отсортированные непересекающиеся занятые интервалы одной комнаты."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+    def add(self, start: int, end: int) -> None:
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+
+    def find_slot(
+        self, earliest: int, latest_end: int, duration: int, granularity: int
+    ) -> Optional[int]:
+        """Самое раннее начало >= earliest, при котором бронь влезает."""
+        start = align_up(earliest, granularity)
+        position = bisect_right(self.starts, start)
+        # Предыдущий интервал мог ещё не закончиться к start
+        if position and self.ends[position - 1] >= start:
+            start = align_after(self.ends[position - 1], granularity)
+        while start + duration <= latest_end:
+            if (
+                position == len(self.starts)
+                or self.starts[position] > start + duration
+            ):
+                return start
+            start = max(
+                start, align_after(self.ends[position], granularity)
+            )
+            position += 1
+        return None
+
+
+def align_up(value: int, granularity: int) -> int:
+    return -(-value // granularity) * granularity
+
+
+def align_after(value: int, granularity: int) -> int:
+    return (value // granularity + 1) * granularity
+
+
+def allocate(
+    room_ids: Sequence[int],
+    busy: Sequence[tuple],
+    requests: Sequence[FlexibleRequest],
+    granularity: int,
+) -> tuple:
+    """
+    room_ids - комнаты, между которыми распределяем заявки;
+    busy - существующие брони (room_id, start, end).
+    Возвращает список назначений и индексы заявок, которые не удалось
+    разместить.
+    """
+    timelines = {room_id: RoomTimeline() for room_id in room_ids}
+    for room_id, start, end in sorted(busy, key=lambda row: row[1]):
+        if room_id in timelines:
+            timelines[room_id].add(start, end)
+    # Куча (с какого момента помещается самая короткая встреча, id
+    # комнаты). Значение могло устареть, но только в меньшую сторону:
+    # раньше него места по-прежнему нет
+    free_at = [(0, room_id) for room_id in room_ids]
+    heapq.heapify(free_at)
+    shortest = min(
+        (item.duration for item in requests if item.room_ids is None),
+        default=0,
+    )
+
+    assignments = []
+    unassigned = []
+    for request in sorted(requests, key=lambda item: item.window_start):
+        if request.room_ids is not None:
+            assignment = _assign_to_listed_rooms(
+                timelines, request, granularity
+            )
+        else:
+            assignment = _assign_from_heap(
+                timelines, free_at, request, shortest, granularity
+            )
+        if assignment is None:
+            unassigned.append(request.index)
+            continue
+        timelines[assignment.room_id].add(assignment.start, assignment.end)
+        assignments.append(assignment)
+    return assignments, unassigned
+
+
+def _assign_from_heap(timelines, free_at, request, shortest, granularity):
+    best = None
+    checked = []
+    # Раньше начала окна на сетке встречу не начать ни в одной комнате
+    earliest = align_up(request.window_start, granularity)
+    # Комната, свободная не раньше лучшего начала, его не улучшит
+    while free_at and (
+        best is None or max(free_at[0][0], earliest) < best.start
+    ):
+        bound, room_id = heapq.heappop(free_at)
+        timeline = timelines[room_id]
+        # После последнего интервала место есть всегда, так что найдётся
+        free = timeline.find_slot(
+            max(request.window_start, bound), math.inf, shortest, granularity
+        )
+        if free > bound and free > earliest:
+            # Граница устарела: уточняем её и возвращаем комнату в кучу
+            heapq.heappush(free_at, (free, room_id))
+            continue
+        checked.append((free, room_id))
+        start = timeline.find_slot(
+            max(request.window_start, free),
+            request.window_end,
+            request.duration,
+            granularity,
+        )
+        if start is not None and (best is None or start < best.start):
+            best = Assignment(
+                request.index, room_id, start, start + request.duration
+            )
+    for item in checked:
+        heapq.heappush(free_at, item)
+    return best
+
+
+def _assign_to_listed_rooms(timelines, request, granularity):
+    best = None
+    for room_id in request.room_ids:
+        timeline = timelines.get(room_id)
+        if timeline is None:
+            continue
+        start = timeline.find_slot(
+            request.window_start,
+            request.window_end,
+            request.duration,
+            granularity,
+        )
+        if start is not None and (best is None or start < best.start):
+            best = Assignment(
+                request.index, room_id, start, start + request.duration
+            )
+    return best
+
+
+def plan_batch(
+    requests: Sequence,
+    room_ids: Sequence[int],
+    reservations: Sequence[tuple],
+    granularity: timedelta,
+    not_before: datetime,
+) -> tuple:
+    """
+    Переводит заявки из схемы FlexibleReservationRequest и брони
+    (meetingroom_id, from_reserve, to_reserve) в секунды, распределяет
+    и возвращает данные новых броней вместе с индексами неразмещённых
+    заявок. Встречи начинаются не раньше not_before.
+    """
+    earliest = to_epoch_seconds(not_before)
+    flexible = [
+        FlexibleRequest(
+            index,
+            item.duration * 60,
+            max(to_epoch_seconds(item.window_start), earliest),
+            to_epoch_seconds(item.window_end),
+            item.room_ids,
+        )
+        for index, item in enumerate(requests)
+    ]
+    busy = [
+        (room_id, to_epoch_seconds(start), to_epoch_seconds(end))
+        for room_id, start, end in reservations
+    ]
+    assignments, unassigned = allocate(
+        room_ids, busy, flexible, int(granularity.total_seconds())
+    )
+    planned = [
+        dict(
+            request_index=assignment.index,
+            meetingroom_id=assignment.room_id,
+            from_reserve=from_epoch_seconds(assignment.start),
+            to_reserve=from_epoch_seconds(assignment.end),
+            comment=requests[assignment.index].comment,
+        )
+        for assignment in assignments
+    ]
+    return planned, sorted(unassigned)
@@ -0,0 +1,150 @@
+# benchmarks/batch_schedule.py
+"""
+Скорость и корректность пакетного распределения заявок по комнатам.
+
+Генерируется неделя существующих броней в N комнатах и пакет гибких
+заявок со случайными окнами, а app.services.scheduler.allocate
+распределяет их. Кроме времени проверяется результат: назначения не
+пересекаются ни между собой, ни с бронями (касание - тоже пересечение)
+и лежат в своих окнах, а для каждой неразмещённой заявки в итоговом
+расписании действительно нет места - расписание только растёт, значит,
+места не было и в момент, когда заявку разбирали. Плюс отдельные
+случаи, на которых решатель ошибался раньше. При любой ошибке скрипт
+завершается с ненулевым кодом.
+
+Запуск из корня проекта:
+    python -m benchmarks.batch_schedule --requests 5000 --rooms 50
+"""
+import argparse
+import random
+import sys
+import time
+
+from app.services.scheduler import (
+    Assignment,
+    FlexibleRequest,
+    RoomTimeline,
+    allocate,
+)
+
+HOUR = 60 * 60
+WEEK = 7 * 24 * HOUR
+GRANULARITY = 5 * 60
+# (комнаты, брони, заявки, назначения, которые должны получиться)
+REGRESSIONS = (
+    # Промежуток 11:05-11:35 перед уже назначенной встречей 13:05-15:05
+    (
+        [1],
+        [(1, 12 * HOUR, 13 * HOUR)],
+        [
+            FlexibleRequest(0, 2 * HOUR, 11 * HOUR, 17 * HOUR, None),
+            FlexibleRequest(1, HOUR // 2, 11 * HOUR + 60, 12 * HOUR, None),
+        ],
+        [
+            Assignment(0, 1, 13 * HOUR + 300, 15 * HOUR + 300),
+            Assignment(1, 1, 11 * HOUR + 300, 11 * HOUR + 35 * 60),
+        ],
+    ),
+)
+
+
+def make_batch(rooms: int, reservations: int, requests: int, seed: int):
+    randomizer = random.Random(seed)
+    room_ids = list(range(1, rooms + 1))
+    busy = []
+    for room_id in room_ids:
+        moment = 0
+        for _ in range(reservations // rooms):
+            moment += randomizer.randrange(HOUR, 8 * HOUR, GRANULARITY)
+            end = moment + randomizer.randrange(1, 4) * HOUR // 2
+            busy.append((room_id, moment, end))
+            moment = end
+    batch = []
+    for index in range(requests):
+        start = randomizer.randrange(0, WEEK, GRANULARITY)
+        duration = randomizer.randrange(15, 121, 15) * 60
+        listed = None
+        if randomizer.random() < 0.2:
+            listed = randomizer.sample(room_ids, 3)
+        batch.append(
+            FlexibleRequest(
+                index,
+                duration,
+                start,
+                start + duration + randomizer.randrange(0, 8 * HOUR),
+                listed,
+            )
+        )
+    return room_ids, busy, batch
+
+
+def find_errors(room_ids, busy, requests, assignments, unassigned) -> list:
+    errors = []
+    by_index = {request.index: request for request in requests}
+    intervals = sorted(
+        [(room_id, start, end) for room_id, start, end in busy]
+        + [(item.room_id, item.start, item.end) for item in assignments]
+    )
+    for previous, current in zip(intervals, intervals[1:]):
+        if previous[0] == current[0] and previous[2] >= current[1]:
+            errors.append(f"пересечение {previous} и {current}")
+    timelines = {room_id: RoomTimeline() for room_id in room_ids}
+    for room_id, start, end in intervals:
+        timelines[room_id].add(start, end)
+    for item in assignments:
+        request = by_index[item.index]
+        if not (
+            request.window_start <= item.start
+            and item.end <= request.window_end
+            and item.end - item.start == request.duration
+        ):
+            errors.append(f"назначение вне окна: {item}")
+    for index in unassigned:
+        request = by_index[index]
+        for room_id in request.room_ids or room_ids:
+            if timelines[room_id].find_slot(
+                request.window_start,
+                request.window_end,
+                request.duration,
+                GRANULARITY,
+            ) is not None:
+                errors.append(f"заявка {index} не размещена, хотя есть место")
+                break
+    return errors
+
+
+def main(args) -> None:
+    errors = []
+    for room_ids, busy, requests, expected in REGRESSIONS:
+        assignments, _ = allocate(room_ids, busy, requests, GRANULARITY)
+        if sorted(assignments) != sorted(expected):
+            errors.append(f"ожидалось {expected}, получено {assignments}")
+    room_ids, busy, requests = make_batch(
+        args.rooms, args.reservations, args.requests, args.seed
+    )
+    started = time.perf_counter()
+    assignments, unassigned = allocate(room_ids, busy, requests, GRANULARITY)
+    elapsed = time.perf_counter() - started
+    errors += find_errors(room_ids, busy, requests, assignments, unassigned)
+    print(
+        f"Комнат: {args.rooms}, броней: {len(busy)}, заявок: {args.requests}"
+    )
+    print(
+        f"Размещено: {len(assignments)}, не размещено: {len(unassigned)}, "
+        f"время: {elapsed * 1000:.1f} мс"
+    )
+    for error in errors[:20]:
+        print(error)
+    if errors:
+        sys.exit(f"Ошибок распределения: {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Пакетное распределение заявок по комнатам"
+    )
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--reservations", type=int, default=2_000)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
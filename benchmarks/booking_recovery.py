@@ -0,0 +1,160 @@
+# benchmarks/booking_recovery.py
+"""
+Время восстановления движка бронирований после сбоя.
+
+Во временном каталоге создаются БД и журнал, движок в дочернем
+процессе принимает заданное число броней, после чего процесс "падает"
+без stop(): без финального снимка и с обрывком строки в конце журнала.
+Затем замеряется старт нового движка - загрузка снимка и доигрывание
+хвоста - для нескольких значений booking_snapshot_every, в том числе
+без промежуточных снимков.
+
+Запуск из корня проекта:
+    python -m benchmarks.booking_recovery --reservations 100000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.booking_engine import BookingEngine
+from app.core.config import settings
+from app.core.db import Base
+
+BATCH_SIZE = 500
+CONCURRENT_CLIENTS = 50
+
+
+def make_requests(count: int, rooms: int) -> list[dict]:
+    # Встречи по 30 минут подряд в каждой комнате, без пересечений
+    start = datetime(2030, 1, 1, 8, 0)
+    return [
+        dict(
+            meetingroom_id=index % rooms + 1,
+            from_reserve=start + timedelta(minutes=40 * (index // rooms)),
+            to_reserve=start
+            + timedelta(minutes=40 * (index // rooms) + 30),
+            comment=None,
+        )
+        for index in range(count)
+    ]
+
+
+async def fill(engine: BookingEngine, requests: list[dict]) -> float:
+    started = time.perf_counter()
+    # Часть броней - пакетами, часть - одиночными командами от
+    # конкурирующих клиентов, чтобы журнал писался группами
+    half = len(requests) // 2
+    for offset in range(0, half, BATCH_SIZE):
+        await engine.create_many(requests[offset:offset + BATCH_SIZE], 1)
+    singles = requests[half:]
+
+    async def client(index: int):
+        for data in singles[index::CONCURRENT_CLIENTS]:
+            await engine.create(data, 1)
+
+    await asyncio.gather(
+        *(client(index) for index in range(CONCURRENT_CLIENTS))
+    )
+    return time.perf_counter() - started
+
+
+def make_session_maker(database: str):
+    db_engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    return db_engine, sessionmaker(db_engine, class_=AsyncSession)
+
+
+async def fill_and_crash(
+    log_dir: str, database: str, count: int, rooms: int, results
+) -> None:
+    _, session_maker = make_session_maker(database)
+    engine = BookingEngine(log_dir, session_maker)
+    await engine.start()
+    fill_time = await fill(engine, make_requests(count, rooms))
+    while engine.projected_seq < engine.state.seq:
+        await asyncio.sleep(0.05)
+    # Сбой: процесс завершается без stop(), в журнале остаётся обрывок
+    engine.log.file.write(b'{"seq": ')
+    engine.log.file.flush()
+    results.put((fill_time, engine.snapshot_seq))
+    results.close()
+    results.join_thread()
+    os._exit(0)
+
+
+def run_child(*args) -> None:
+    asyncio.run(fill_and_crash(*args))
+
+
+async def run(count: int, rooms: int, snapshot_every: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="booking-")
+    database = os.path.join(directory, "bench.db")
+    sync_engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    log_dir = os.path.join(directory, "log")
+    # Дочерний процесс получает настройку при fork
+    settings.booking_snapshot_every = snapshot_every
+
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(
+        target=run_child, args=(log_dir, database, count, rooms, results)
+    )
+    child.start()
+    fill_time, snapshot_seq = results.get()
+    child.join()
+
+    db_engine, session_maker = make_session_maker(database)
+    recovered = BookingEngine(log_dir, session_maker)
+    started = time.perf_counter()
+    await recovered.start()
+    recovery_time = time.perf_counter() - started
+    assert len(recovered.state.reservations) == count
+    await recovered.stop()
+    await db_engine.dispose()
+    shutil.rmtree(directory)
+    return dict(
+        snapshot_every=snapshot_every,
+        fill_time=fill_time,
+        tail=count - snapshot_seq,
+        recovery_time=recovery_time,
+    )
+
+
+async def main(args) -> None:
+    print(
+        f"Броней: {args.reservations}, комнат: {args.rooms}\n"
+        f"{'снимок каждые':>14} {'запись, с':>10} {'команд/с':>9} "
+        f"{'хвост':>7} {'старт, мс':>10}"
+    )
+    for snapshot_every in args.snapshot_every:
+        result = await run(args.reservations, args.rooms, snapshot_every)
+        print(
+            f"{result['snapshot_every']:>14} {result['fill_time']:>10.2f} "
+            f"{args.reservations / result['fill_time']:>9.0f} "
+            f"{result['tail']:>7} {result['recovery_time'] * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Время восстановления движка бронирований"
+    )
+    parser.add_argument("--reservations", type=int, default=100_000)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        nargs="+",
+        # Последнее значение больше числа броней - только начальный снимок
+        default=[1_000, 10_000, 50_000, 10**9],
+    )
+    asyncio.run(main(parser.parse_args()))
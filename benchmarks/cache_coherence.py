@@ -0,0 +1,224 @@
+# benchmarks/cache_coherence.py
+"""
+Согласованность кэшей между процессами.
+
+Несколько процессов с приложением работают с одной временной БД, как
+воркеры uvicorn за балансировщиком. Один процесс по очереди создаёт и
+удаляет брони комнаты, остальные после каждой записи читают
+календарную ленту комнаты - она кэшируется в памяти каждого процесса.
+Чтение считается устаревшим, если в ленте не то число броней, что
+в БД после записи. Каждый читатель запрашивает ленту дважды: первый
+раз после записи (кэш должен обновиться), второй - из кэша.
+
+Для сравнения прогон повторяется с огромным интервалом проверки версий
+- так воркеры не видят чужих записей, и устаревшие чтения появляются.
+Если же устаревшее чтение попалось при проверке версий на каждом
+чтении, скрипт завершается с ненулевым кодом - его можно запускать
+как проверку согласованности в CI.
+
+Запуск из корня проекта:
+    python -m benchmarks.cache_coherence --readers 4 --writes 200
+    python -m benchmarks.cache_coherence --writes 50 --coherent-only
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import create_engine, insert
+
+from app.core.db import Base
+from app.models import MeetingRoom
+
+FEED_PATH = "/meeting_rooms/1/reservations.ics"
+# Сколько раз замерить проверку версий без изменений
+CHECKS = 10_000
+# "Выключенная" проверка: интервал больше времени прогона
+NO_CHECK_INTERVAL_MS = 10**9
+
+
+async def serve(role: str, connection) -> None:
+    # Настройки читаются при импорте приложения, уже в дочернем процессе
+    import httpx
+
+    from app.api.feeds import feed_cache
+    from app.core.db import utc_now
+    from app.core.versions import ROOM, data_versions
+    from app.main import app
+
+    await app.router.startup()
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        headers = None
+        if role == "writer":
+            credentials = {
+                "username": "writer@example.com",
+                "password": "writer-password",
+            }
+            await client.post(
+                "/auth/register",
+                json={
+                    "email": credentials["username"],
+                    "password": credentials["password"],
+                    "first_name": "Writer",
+                },
+            )
+            token = await client.post("/auth/jwt/login", data=credentials)
+            headers = {
+                "Authorization": f"Bearer {token.json()['access_token']}"
+            }
+        start = utc_now() + timedelta(days=1)
+        created = []
+        while True:
+            command = await asyncio.to_thread(connection.recv)
+            if command is None:
+                break
+            if command == "create":
+                moment = start + timedelta(hours=len(created))
+                response = await client.post(
+                    "/reservations/",
+                    json={
+                        "from_reserve": moment.isoformat(),
+                        "to_reserve": (
+                            moment + timedelta(minutes=30)
+                        ).isoformat(),
+                        "meetingroom_id": 1,
+                    },
+                    headers=headers,
+                )
+                created.append(response.json()["id"])
+                connection.send(response.status_code)
+            elif command == "delete":
+                response = await client.delete(
+                    f"/reservations/{created.pop()}", headers=headers
+                )
+                connection.send(response.status_code)
+            else:
+                response = await client.get(FEED_PATH)
+                connection.send(response.text.count("BEGIN:VEVENT"))
+    started = time.perf_counter()
+    for _ in range(CHECKS):
+        data_versions.get(ROOM, 1)
+    check_us = (time.perf_counter() - started) / CHECKS * 1_000_000
+    connection.send((feed_cache.hits, feed_cache.misses, check_us))
+    await app.router.shutdown()
+
+
+def run_child(role: str, connection) -> None:
+    asyncio.run(serve(role, connection))
+
+
+def run(readers: int, writes: int, check_interval_ms: float) -> dict:
+    directory = tempfile.mkdtemp(prefix="coherence-")
+    database = os.path.join(directory, "bench.db")
+    sync_engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as connection:
+        connection.execute(insert(MeetingRoom), [dict(name="Комната")])
+    sync_engine.dispose()
+    # spawn: дочерний процесс заново импортирует этот модуль, а с ним и
+    # настройки, поэтому окружение задаётся до запуска процессов
+    os.environ.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+        RATE_LIMIT_ENABLED="false",
+        DATA_VERSION_CHECK_INTERVAL_MS=str(check_interval_ms),
+    )
+    context = multiprocessing.get_context("spawn")
+    channels = []
+    processes = []
+    for role in ["writer"] + ["reader"] * readers:
+        parent_end, child_end = context.Pipe()
+        process = context.Process(
+            target=run_child, args=(role, child_end)
+        )
+        process.start()
+        channels.append(parent_end)
+        processes.append(process)
+    writer, reader_channels = channels[0], channels[1:]
+
+    def read_all() -> list[int]:
+        for channel in reader_channels:
+            channel.send("read")
+        return [channel.recv() for channel in reader_channels]
+
+    expected = 0
+    stale = reads = 0
+    started = time.perf_counter()
+    try:
+        read_all()
+        for index in range(writes):
+            # Брони то добавляются, то удаляются: 0, 1, 2, 1, 2, 3, 2, ...
+            command = "delete" if index % 3 == 2 else "create"
+            writer.send(command)
+            status = writer.recv()
+            assert status == 200, status
+            expected += 1 if command == "create" else -1
+            for _ in range(2):
+                counts = read_all()
+                reads += len(counts)
+                stale += sum(count != expected for count in counts)
+        elapsed = time.perf_counter() - started
+        stats = []
+        for channel in channels:
+            channel.send(None)
+            stats.append(channel.recv())
+    finally:
+        # Закрытый канал завершает и процессы, оставшиеся после ошибки
+        for channel in channels:
+            channel.close()
+        for process in processes:
+            process.join()
+        shutil.rmtree(directory)
+    reader_stats = stats[1:]
+    return dict(
+        reads=reads,
+        stale=stale,
+        hits=sum(hits for hits, _, _ in reader_stats),
+        misses=sum(misses for _, misses, _ in reader_stats),
+        check_us=max(check_us for _, _, check_us in reader_stats),
+        elapsed=elapsed,
+    )
+
+
+def main(args) -> None:
+    print(f"Читателей: {args.readers}, записей: {args.writes}")
+    print(
+        f"{'проверка версий':>24} {'чтений':>7} {'устаревших':>11} "
+        f"{'из кэша':>8} {'промахов':>9} {'проверка, мкс':>14} {'время, с':>9}"
+    )
+    stale = 0
+    for title, interval, coherent in (
+        ("при каждом чтении", 0, True),
+        ("выключена", NO_CHECK_INTERVAL_MS, False),
+    ):
+        if args.coherent_only and not coherent:
+            continue
+        result = run(args.readers, args.writes, interval)
+        print(
+            f"{title:>24} {result['reads']:>7} {result['stale']:>11} "
+            f"{result['hits']:>8} {result['misses']:>9} "
+            f"{result['check_us']:>14.2f} {result['elapsed']:>9.2f}"
+        )
+        if coherent:
+            stale = result["stale"]
+    if stale:
+        # Без отложенной проверки версий устаревших чтений быть не должно
+        sys.exit(f"Устаревших чтений при проверке версий: {stale}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Согласованность кэшей между процессами"
+    )
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument(
+        "--coherent-only",
+        action="store_true",
+        help="Только прогон с проверкой версий, без сравнения",
+    )
+    main(parser.parse_args())
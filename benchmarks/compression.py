@@ -0,0 +1,105 @@
+# benchmarks/compression.py
+"""
+Размер и время ответов со сжатием и без.
+
+Во временной БД с расписанием броней запрашиваются список броней всех
+комнат (JSON одним куском) и календарная лента комнаты (потоковый
+ответ; первый запрос строит ленту, остальные берут её из кэша уже
+сжатой) - с каждой доступной кодировкой и без сжатия.
+
+Запуск из корня проекта:
+    python -m benchmarks.compression --rooms 50 --reservations 20000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+PATHS = ("/meeting_rooms/reservations", "/meeting_rooms/1/reservations.ics")
+
+
+def prepare(database: str, rooms: int, reservations: int) -> None:
+    from sqlalchemy import create_engine, insert
+
+    from app.core.db import Base, utc_now
+    from app.models import MeetingRoom, Reservation
+
+    sync_engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(sync_engine)
+    start = utc_now().replace(minute=0, second=0, microsecond=0)
+    with sync_engine.begin() as connection:
+        connection.execute(
+            insert(MeetingRoom),
+            [dict(name=f"Комната {index}") for index in range(rooms)],
+        )
+        connection.execute(
+            insert(Reservation),
+            [
+                dict(
+                    meetingroom_id=index % rooms + 1,
+                    from_reserve=start + timedelta(hours=index // rooms),
+                    to_reserve=start
+                    + timedelta(hours=index // rooms, minutes=45),
+                )
+                for index in range(reservations)
+            ],
+        )
+    sync_engine.dispose()
+
+
+async def measure(requests: int) -> None:
+    import httpx
+
+    from app.core.compression import ENCODINGS
+    from app.main import app
+
+    await app.router.startup()
+    print(
+        f"{'ответ':<36} {'кодировка':>9} {'размер, КБ':>11} "
+        f"{'медиана, мс':>12}"
+    )
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for path in PATHS:
+            for encoding in ("identity",) + ENCODINGS:
+                headers = {"Accept-Encoding": encoding}
+                timings = []
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    response = await client.get(path, headers=headers)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.text
+                # httpx распаковывает тело, сжатый размер - из потока
+                size = response.num_bytes_downloaded / 1024
+                print(
+                    f"{path:<36} {encoding:>9} {size:>11.1f} "
+                    f"{statistics.median(timings):>12.1f}"
+                )
+    await app.router.shutdown()
+
+
+def main(args) -> None:
+    directory = tempfile.mkdtemp(prefix="compression-")
+    database = os.path.join(directory, "bench.db")
+    # Настройки читаются при импорте приложения, поэтому окружение - раньше
+    os.environ.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+        RATE_LIMIT_ENABLED="false",
+    )
+    try:
+        prepare(database, args.rooms, args.reservations)
+        print(f"Комнат: {args.rooms}, броней: {args.reservations}")
+        asyncio.run(measure(args.requests))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сжатие ответов")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--reservations", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=10)
+    main(parser.parse_args())
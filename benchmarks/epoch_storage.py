@@ -0,0 +1,175 @@
+# benchmarks/epoch_storage.py
+"""
+Хранение времени броней: ISO-строки против целых секунд UTC.
+
+В двух временных БД SQLite создаётся одинаковая таблица reservation
+с теми же индексами, что и в модели: в первой время записано так, как
+его сохранял столбец DateTime, во второй - как EpochSeconds. Сравнивается
+размер индексов (по виртуальной таблице dbstat) и скорость запросов
+по диапазону времени: проверки пересечений в комнате и страницы
+"моих бронирований".
+
+Запуск из корня проекта:
+    python -m benchmarks.epoch_storage --reservations 500000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.core.db import EPOCH, SECOND
+
+SCHEMA = """
+CREATE TABLE reservation (
+    id INTEGER PRIMARY KEY,
+    from_reserve {time_type},
+    to_reserve {time_type},
+    meetingroom_id INTEGER,
+    user_id INTEGER,
+    comment TEXT
+);
+CREATE INDEX ix_reservation_user_id_from_reserve
+    ON reservation (user_id, from_reserve);
+CREATE INDEX ix_reservation_meetingroom_id_from_reserve
+    ON reservation (meetingroom_id, from_reserve);
+"""
+OVERLAP_QUERY = (
+    "SELECT id FROM reservation WHERE meetingroom_id = ? "
+    "AND from_reserve <= ? AND to_reserve >= ?"
+)
+USER_PAGE_QUERY = (
+    "SELECT id, from_reserve, to_reserve FROM reservation "
+    "WHERE user_id = ? AND from_reserve >= ? "
+    "ORDER BY from_reserve, id LIMIT 50"
+)
+
+
+def as_text(value: datetime) -> str:
+    # Формат, в котором DateTime в SQLAlchemy пишет время в SQLite
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def as_epoch(value: datetime) -> int:
+    return (value - EPOCH) // SECOND
+
+
+def make_rows(count: int, rooms: int, users: int, seed: int) -> list:
+    randomizer = random.Random(seed)
+    start = datetime(2024, 1, 1, 8, 0)
+    rows = []
+    for index in range(count):
+        begin = start + timedelta(
+            minutes=30 * (index // rooms), seconds=randomizer.randrange(60)
+        )
+        rows.append(
+            (
+                index + 1,
+                begin,
+                begin + timedelta(minutes=25),
+                index % rooms + 1,
+                randomizer.randrange(users) + 1,
+            )
+        )
+    return rows
+
+
+def build(path: str, time_type: str, convert, rows: list):
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA.format(time_type=time_type))
+    connection.executemany(
+        "INSERT INTO reservation VALUES (?, ?, ?, ?, ?, NULL)",
+        [
+            (id_, convert(begin), convert(end), room, user)
+            for id_, begin, end, room, user in rows
+        ],
+    )
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.execute("ANALYZE")
+    return connection
+
+
+def sizes(connection: sqlite3.Connection) -> dict:
+    return dict(
+        connection.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+        ).fetchall()
+    )
+
+
+def time_queries(connection, query: str, params: list) -> float:
+    started = time.perf_counter()
+    for item in params:
+        connection.execute(query, item).fetchall()
+    return (time.perf_counter() - started) / len(params) * 1e6
+
+
+def main(args) -> None:
+    rows = make_rows(args.reservations, args.rooms, args.users, args.seed)
+    first, last = rows[0][1], rows[-1][1]
+    randomizer = random.Random(args.seed + 1)
+    windows = []
+    for _ in range(args.queries):
+        begin = first + (last - first) * randomizer.random()
+        windows.append(
+            (
+                randomizer.randrange(args.rooms) + 1,
+                begin,
+                begin + timedelta(hours=2),
+                randomizer.randrange(args.users) + 1,
+            )
+        )
+    directory = tempfile.mkdtemp(prefix="epoch-")
+    variants = [
+        ("ISO-строки", "DATETIME", as_text),
+        ("секунды", "INTEGER", as_epoch),
+    ]
+    print(
+        f"Броней: {args.reservations}, комнат: {args.rooms}, "
+        f"запросов: {args.queries}"
+    )
+    print(
+        f"{'хранение':>12} {'таблица, КБ':>12} {'индекс user, КБ':>16} "
+        f"{'индекс room, КБ':>16} {'пересечения, мкс':>17} "
+        f"{'страница, мкс':>14}"
+    )
+    for name, time_type, convert in variants:
+        path = os.path.join(directory, f"{time_type.lower()}.db")
+        connection = build(path, time_type, convert, rows)
+        size = sizes(connection)
+        overlap = time_queries(
+            connection,
+            OVERLAP_QUERY,
+            [(room, convert(end), convert(begin))
+             for room, begin, end, _ in windows],
+        )
+        page = time_queries(
+            connection,
+            USER_PAGE_QUERY,
+            [(user, convert(begin)) for _, begin, _, user in windows],
+        )
+        user_index = size["ix_reservation_user_id_from_reserve"]
+        room_index = size["ix_reservation_meetingroom_id_from_reserve"]
+        print(
+            f"{name:>12} {size['reservation'] / 1024:>12.0f} "
+            f"{user_index / 1024:>16.0f} {room_index / 1024:>16.0f} "
+            f"{overlap:>17.1f} {page:>14.1f}"
+        )
+        connection.close()
+        os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Размер индексов и скорость запросов по времени"
+    )
+    parser.add_argument("--reservations", type=int, default=500_000)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
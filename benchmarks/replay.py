@@ -0,0 +1,241 @@
+# benchmarks/replay.py
+"""
+Воспроизведение записанного трафика на разных версиях кода.
+
+Журнал пишет приложение с CAPTURE_ENABLED=true (app/core/capture.py).
+Для каждой версии кода (каталога с проектом, например git worktree)
+запускается отдельный процесс: снимок БД копируется во временный файл,
+приложение стартует в процессе, а запросы из журнала уходят в него
+через httpx в том же порядке и с теми же паузами - или в speed раз
+быстрее (--speed 0 - подряд, без пауз и параллельности). В конце -
+распределение задержек по маршрутам для каждой версии рядом с
+записанными в журнале.
+
+Пользователей журнала (хэши id) заменяют новые пользователи, которые
+создаются в копии БД, с теми же правами суперпользователя. Поэтому
+запросы к чужим броням из снимка могут получить другой статус - доля
+совпавших статусов тоже выводится. Запросы /auth/ не повторяются.
+
+Запуск из корня проекта:
+    git worktree add ../baseline HEAD~1
+    python -m benchmarks.replay capture/requests.ndjson.1 \\
+        capture/requests.ndjson --snapshot fastapi.db \\
+        --tree ../baseline --tree . --speed 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+# Запросы этих маршрутов не повторяются: пользователи создаются заранее
+SKIPPED_PREFIXES = ("/auth/",)
+REPLAY_PASSWORD = "replay-password"
+# Сколько ждать готовности (/ready) после старта, секунд
+READY_TIMEOUT = 60
+PERCENTILES = (50, 95, 99)
+
+
+def read_log(paths: list[str]) -> list[dict]:
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as log:
+            entries.extend(json.loads(line) for line in log if line.strip())
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share / 100))]
+
+
+def copy_snapshot(source: str, target: str) -> None:
+    # backup даёт согласованную копию и у файла в режиме WAL
+    with sqlite3.connect(source) as source_db, sqlite3.connect(
+        target
+    ) as target_db:
+        source_db.backup(target_db)
+
+
+async def create_users(entries: list[dict]) -> dict[str, str]:
+    """Пользователь для каждого хэша из журнала: хэш -> email."""
+    from app.core.init_db import create_user
+
+    users = {}
+    for entry in entries:
+        if entry["user"] is None or entry["user"] in users:
+            continue
+        users[entry["user"]] = f"replay-{entry['user']}@example.com"
+        await create_user(
+            email=users[entry["user"]],
+            password=REPLAY_PASSWORD,
+            first_name="Replay",
+            birthdate=date(2000, 1, 1),
+            is_superuser=entry["superuser"],
+        )
+    return users
+
+
+async def wait_ready(client) -> None:
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        # В версиях без /ready ответ 404 - ждать нечего
+        if (await client.get("/ready")).status_code != 503:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def replay(entries: list[dict], speed: float) -> dict:
+    import httpx
+
+    from app.main import app
+
+    await app.router.startup()
+    users = await create_users(entries)
+    results = defaultdict(lambda: {"ms": [], "matched": 0})
+    async with httpx.AsyncClient(app=app, base_url="http://replay") as client:
+        await wait_ready(client)
+        headers = {}
+        for user_hash, email in users.items():
+            response = await client.post(
+                "/auth/jwt/login",
+                data={"username": email, "password": REPLAY_PASSWORD},
+            )
+            token = response.json()["access_token"]
+            headers[user_hash] = {"Authorization": f"Bearer {token}"}
+
+        async def issue(entry):
+            started = time.perf_counter()
+            response = await client.request(
+                entry["method"],
+                entry["path"],
+                params=entry["query"],
+                json=entry["body"],
+                headers=headers.get(entry["user"]),
+            )
+            result = results[f"{entry['method']} {entry['route']}"]
+            result["ms"].append((time.perf_counter() - started) * 1000)
+            result["matched"] += response.status_code == entry["status"]
+
+        entries = [
+            entry
+            for entry in entries
+            if not entry["path"].startswith(SKIPPED_PREFIXES)
+        ]
+        started = time.monotonic()
+        tasks = []
+        for entry in entries:
+            if speed == 0:
+                await issue(entry)
+                continue
+            delay = (entry["t"] - entries[0]["t"]) / speed
+            await asyncio.sleep(delay - (time.monotonic() - started))
+            tasks.append(asyncio.create_task(issue(entry)))
+        await asyncio.gather(*tasks)
+    await app.router.shutdown()
+    return dict(results)
+
+
+def run_tree(tree: str, args) -> dict:
+    directory = tempfile.mkdtemp(prefix="replay-")
+    database = os.path.join(directory, "replay.db")
+    try:
+        copy_snapshot(args.snapshot, database)
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.path.abspath(tree),
+            DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+            CAPTURE_ENABLED="false",
+            # Все запросы идут от одного клиента - лимиты бы их отсекли
+            RATE_LIMIT_ENABLED="false",
+        )
+        # Скрипт берём из текущей версии: в старой его может не быть
+        output = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--child",
+                "--speed",
+                str(args.speed),
+                *args.logs,
+            ],
+            cwd=tree,
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory)
+
+
+def report(entries: list[dict], trees: list[str], results: list[dict]):
+    recorded = defaultdict(list)
+    for entry in entries:
+        if not entry["path"].startswith(SKIPPED_PREFIXES):
+            recorded[f"{entry['method']} {entry['route']}"].append(
+                entry["ms"]
+            )
+    columns = ["запись"] + [os.path.basename(os.path.abspath(tree)) or tree
+                            for tree in trees]
+    print(f"Запросов: {sum(map(len, recorded.values()))}, мс - p50/p95/p99")
+    for route, durations in sorted(
+        recorded.items(), key=lambda item: -len(item[1])
+    ):
+        print(f"\n{route} ({len(durations)})")
+        rows = [(columns[0], durations, None)]
+        for column, result in zip(columns[1:], results):
+            replayed = result.get(route, {"ms": [], "matched": 0})
+            rows.append((column, replayed["ms"], replayed["matched"]))
+        for column, values, matched in rows:
+            line = "/".join(
+                f"{percentile(values, share):.1f}" for share in PERCENTILES
+            )
+            if matched is not None:
+                line += f", статус совпал у {matched}/{len(values)}"
+            print(f"  {column:<20} {line}")
+
+
+def main(args) -> None:
+    entries = read_log(args.logs)
+    if args.child:
+        print(json.dumps(asyncio.run(replay(entries, args.speed))))
+        return
+    results = [run_tree(tree, args) for tree in args.tree]
+    report(entries, args.tree, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Воспроизведение записанного трафика"
+    )
+    parser.add_argument("logs", nargs="+", help="Файлы журнала по порядку")
+    parser.add_argument("--snapshot", help="Файл БД, с которого начинаем")
+    parser.add_argument(
+        "--tree",
+        action="append",
+        help="Каталог с версией кода, можно несколько раз",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="Во сколько раз быстрее записи; 0 - подряд без пауз",
+    )
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+    args.tree = args.tree or ["."]
+    if not args.child and args.snapshot is None:
+        parser.error("нужен --snapshot")
+    main(args)
@@ -0,0 +1,170 @@
+# benchmarks/startup.py
+"""
+Время старта воркера и первые запросы после него.
+
+Во временной БД с уже созданным суперпользователем каждый замер идёт
+в отдельном процессе, чтобы импорт был холодным: импорт app.main,
+хук startup, время до готовности (/ready) и длительность первых
+запросов - с прогревом и без него. Для сравнения замеряется и прежний
+путь создания суперюзера, который хэшировал пароль на каждом старте.
+
+Запуск из корня проекта:
+    python -m benchmarks.startup --rooms 200 --reservations 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# app импортируется только в дочерних процессах: импорт тоже замеряется
+SUPERUSER_EMAIL = "admin@example.com"
+SUPERUSER_PASSWORD = "benchmark-password"
+FIRST_REQUESTS = (
+    "/openapi.json",
+    "/meeting_rooms/",
+    "/meeting_rooms/availability?from_time={start}&to_time={end}",
+)
+
+
+def elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+async def prepare(rooms: int, reservations: int) -> None:
+    from sqlalchemy import create_engine, insert
+
+    from app.core.db import Base, utc_now
+    from app.core.init_db import create_first_superuser
+    from app.models import MeetingRoom, Reservation
+
+    sync_engine = create_engine(os.environ["BENCH_SYNC_URL"])
+    Base.metadata.create_all(sync_engine)
+    start = utc_now().replace(minute=0, second=0, microsecond=0)
+    with sync_engine.begin() as connection:
+        connection.execute(
+            insert(MeetingRoom),
+            [dict(name=f"Комната {index}") for index in range(rooms)],
+        )
+        connection.execute(
+            insert(Reservation),
+            [
+                dict(
+                    meetingroom_id=index % rooms + 1,
+                    from_reserve=start + timedelta(hours=index // rooms),
+                    to_reserve=start
+                    + timedelta(hours=index // rooms, minutes=45),
+                )
+                for index in range(reservations)
+            ],
+        )
+    sync_engine.dispose()
+    await create_first_superuser()
+
+
+async def measure(import_ms: float, warm: bool) -> dict:
+    import httpx
+
+    from app.core import warmup
+    from app.core.db import utc_now
+    from app.core.init_db import create_user
+    from app.main import app
+
+    if not warm:
+        warmup.STEPS = ()
+    result = {"import_ms": import_ms}
+    started = time.perf_counter()
+    await app.router.startup()
+    result["startup_ms"] = elapsed_ms(started)
+    await warmup.warm_up.task
+    result["ready_ms"] = elapsed_ms(started)
+    start = utc_now().replace(minute=0, second=0, microsecond=0)
+    end = start + timedelta(days=1)
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for path in FIRST_REQUESTS:
+            path = path.format(start=start.isoformat(), end=end.isoformat())
+            started = time.perf_counter()
+            response = await client.get(path)
+            assert response.status_code == 200, response.text
+            result[path.split("?")[0]] = elapsed_ms(started)
+    if warm:
+        # Прежний старт: пароль хэшировался до проверки, что юзер есть
+        started = time.perf_counter()
+        await create_user(
+            email=SUPERUSER_EMAIL,
+            password=SUPERUSER_PASSWORD,
+            is_superuser=True,
+            first_name="Administrator",
+            birthdate=datetime.now(),
+        )
+        result["legacy_superuser_ms"] = elapsed_ms(started)
+    await app.router.shutdown()
+    return result
+
+
+def run_child(mode: str, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", mode],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def child(mode: str, args) -> None:
+    if mode == "prepare":
+        asyncio.run(prepare(args.rooms, args.reservations))
+        print("{}")
+        return
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+
+    import_ms = elapsed_ms(started)
+    print(json.dumps(asyncio.run(measure(import_ms, mode == "warm"))))
+
+
+def main(args) -> None:
+    directory = tempfile.mkdtemp(prefix="startup-")
+    database = os.path.join(directory, "bench.db")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+        BENCH_SYNC_URL=f"sqlite:///{database}",
+        FIRST_SUPERUSER_EMAIL=SUPERUSER_EMAIL,
+        FIRST_SUPERUSER_PASSWORD=SUPERUSER_PASSWORD,
+        RATE_LIMIT_ENABLED="false",
+    )
+    try:
+        run_child("prepare", env)
+        print(
+            f"Комнат: {args.rooms}, броней: {args.reservations}, "
+            f"запусков: {args.runs}"
+        )
+        for mode in ("warm", "cold"):
+            runs = [run_child(mode, env) for _ in range(args.runs)]
+            print(f"\n{'с прогревом' if mode == 'warm' else 'без прогрева'}")
+            for name in runs[0]:
+                values = sorted(run[name] for run in runs)
+                print(f"  {name:<32} {values[len(values) // 2]:>9.1f} мс")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время старта приложения")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--reservations", type=int, default=20_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", choices=("prepare", "warm", "cold"))
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args)
+    else:
+        main(args)
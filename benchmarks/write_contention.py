@@ -0,0 +1,195 @@
+# benchmarks/write_contention.py
+"""
+Записи броней из нескольких процессов в одну БД.
+
+Несколько процессов с приложением работают с одной временной БД, как
+воркеры лаунчера, и одновременно создают и удаляют брони одного
+пользователя с включёнными квотами - каждая запись читает и меняет
+счётчики квот. У SQLite один писатель на файл: транзакция, которая
+сначала читала, а потом пытается писать, пока файл менял другой
+процесс, получает "database is locked", а проверка квоты, прочитанная
+вне транзакции записи, пропускает лишние брони.
+
+Ошибки - любой ответ 5xx и будущих броней в итоге больше квоты:
+скрипт печатает статусы ответов и завершается с ненулевым кодом.
+
+Запуск из корня проекта:
+    python -m benchmarks.write_contention --processes 4 --requests 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+from fastapi_users.password import PasswordHelper
+from sqlalchemy import create_engine, func, insert, select
+
+from app.core.db import Base
+from app.models import MeetingRoom, Reservation, User
+
+ROOMS = 10
+CREDENTIALS = {
+    "username": "writer@example.com",
+    "password": "writer-password",
+}
+
+
+async def serve(index: int, args, connection) -> None:
+    # Настройки читаются при импорте приложения, уже в дочернем процессе
+    import httpx
+
+    from app.core.db import utc_now
+    from app.main import app
+
+    await app.router.startup()
+    randomizer = random.Random(index)
+    statuses = Counter()
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        token = await client.post("/auth/jwt/login", data=CREDENTIALS)
+        headers = {"Authorization": f"Bearer {token.json()['access_token']}"}
+        start = utc_now() + timedelta(days=1)
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def book(number: int) -> None:
+            # Интервалы процессов не пересекаются - конфликтов броней нет,
+            # а недели и счётчики квот у всех общие
+            moment = start + timedelta(
+                minutes=30 * (number * args.processes + index)
+            )
+            async with limit:
+                response = await client.post(
+                    "/reservations/",
+                    json={
+                        "from_reserve": moment.isoformat(),
+                        "to_reserve": (
+                            moment + timedelta(minutes=20)
+                        ).isoformat(),
+                        "meetingroom_id": randomizer.randint(1, ROOMS),
+                    },
+                    headers=headers,
+                )
+                statuses[response.status_code] += 1
+                if response.status_code == 200 and randomizer.random() < 0.3:
+                    response = await client.delete(
+                        f"/reservations/{response.json()['id']}",
+                        headers=headers,
+                    )
+                    statuses[response.status_code] += 1
+
+        connection.send("ready")
+        # Все процессы начинают писать одновременно
+        await asyncio.to_thread(connection.recv)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(book(number) for number in range(args.requests))
+        )
+        elapsed = time.perf_counter() - started
+    connection.send((dict(statuses), elapsed))
+    await app.router.shutdown()
+
+
+def run_child(index: int, args, connection) -> None:
+    asyncio.run(serve(index, args, connection))
+
+
+def main(args) -> None:
+    directory = tempfile.mkdtemp(prefix="contention-")
+    database = os.path.join(directory, "bench.db")
+    sync_engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as connection:
+        connection.execute(
+            insert(MeetingRoom),
+            [dict(name=f"Комната {room}") for room in range(1, ROOMS + 1)],
+        )
+        connection.execute(
+            insert(User),
+            [
+                dict(
+                    email=CREDENTIALS["username"],
+                    hashed_password=PasswordHelper().hash(
+                        CREDENTIALS["password"]
+                    ),
+                    first_name="Writer",
+                    is_active=True,
+                    is_superuser=False,
+                    is_verified=False,
+                )
+            ],
+        )
+    # spawn: дочерний процесс заново импортирует настройки из окружения
+    os.environ.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+        RATE_LIMIT_ENABLED="false",
+        QUOTA_WEEK_HOURS="10000",
+        QUOTA_FUTURE_RESERVATIONS=str(args.quota),
+    )
+    context = multiprocessing.get_context("spawn")
+    channels = []
+    processes = []
+    for index in range(args.processes):
+        parent_end, child_end = context.Pipe()
+        process = context.Process(
+            target=run_child, args=(index, args, child_end)
+        )
+        process.start()
+        channels.append(parent_end)
+        processes.append(process)
+    try:
+        for channel in channels:
+            channel.recv()
+        for channel in channels:
+            channel.send("go")
+        results = [channel.recv() for channel in channels]
+    finally:
+        for channel in channels:
+            channel.close()
+        for process in processes:
+            process.join()
+        with sync_engine.connect() as connection:
+            booked = connection.execute(
+                select(func.count()).select_from(Reservation)
+            ).scalar_one()
+        sync_engine.dispose()
+        shutil.rmtree(directory)
+    statuses = Counter()
+    for process_statuses, _ in results:
+        statuses.update(process_statuses)
+    elapsed = max(elapsed for _, elapsed in results)
+    print(
+        f"Процессов: {args.processes}, заявок на процесс: {args.requests}, "
+        f"одновременно: {args.concurrency}"
+    )
+    print(f"Ответы: {dict(sorted(statuses.items()))}, время: {elapsed:.2f} с")
+    print(f"Броней в итоге: {booked}, квота: {args.quota}")
+    errors = []
+    failed = sum(count for status, count in statuses.items() if status >= 500)
+    if failed:
+        errors.append(f"ответов 5xx: {failed}")
+    if booked > args.quota:
+        errors.append(f"квота превышена на {booked - args.quota}")
+    if errors:
+        sys.exit("Ошибки: " + ", ".join(errors))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Записи броней из нескольких процессов"
+    )
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--quota",
+        type=int,
+        default=300,
+        help="Сколько будущих броней можно пользователю",
+    )
+    main(parser.parse_args())